@@ -1,28 +1,158 @@
 #mejoras 
+import time
+INICIO_ARRANQUE = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-import cv2
 import numpy as np
-import pandas as pd
 import os
 from datetime import datetime
-import matplotlib.pyplot as plt
-import skfuzzy as fuzz
-from skfuzzy import control as ctrl
 from functools import reduce
 import operator
-from fpdf import FPDF
 import sys
 import traceback
 import tempfile
 import winreg
 import re
 import shutil
+import bisect
+import hashlib
+import json
+import importlib
+import importlib.util
+import threading
+import argparse
+import sqlite3
+import csv
+import queue
+import io
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, as_completed
+
+# ========== CARGA DIFERIDA DE MÓDULOS ==========
+# Etapas de arranque y tiempos de importación en segundos
+TIEMPOS_ARRANQUE = {}
+
+def registrar_tiempo_arranque(etapa, segundos):
+    """Guarda el tiempo de una etapa de arranque para el reporte"""
+    TIEMPOS_ARRANQUE[etapa] = segundos
+
+class ModuloDiferido:
+    """Módulo que se importa en el primer acceso a uno de sus atributos.
+    
+    Permite mostrar la ventana antes de cargar los subsistemas pesados
+    (OpenCV, pandas, matplotlib, skfuzzy, fpdf) y registrar cuánto tarda
+    cada importación.
+    """
+    
+    def __init__(self, nombre, preparar=None):
+        self._nombre = nombre
+        self._preparar = preparar
+        self._modulo = None
+        self._lock = threading.Lock()
+    
+    def cargar(self):
+        """Importa el módulo (una sola vez, seguro entre hilos)"""
+        if self._modulo is None:
+            with self._lock:
+                if self._modulo is None:
+                    inicio = time.perf_counter()
+                    if self._preparar is not None:
+                        self._preparar()
+                    modulo = importlib.import_module(self._nombre)
+                    registrar_tiempo_arranque(f"import {self._nombre}", time.perf_counter() - inicio)
+                    self._modulo = modulo
+        return self._modulo
+    
+    def __getattr__(self, atributo):
+        return getattr(self.cargar(), atributo)
+
+Image = ModuloDiferido("PIL.Image")
+ImageTk = ModuloDiferido("PIL.ImageTk")
+cv2 = ModuloDiferido("cv2")
+pd = ModuloDiferido("pandas")
+# Sólo la API orientada a objetos de matplotlib con Agg (sin pyplot ni TkAgg)
+mpl_figure = ModuloDiferido("matplotlib.figure")
+mpl_agg = ModuloDiferido("matplotlib.backends.backend_agg")
+mdates = ModuloDiferido("matplotlib.dates")
+fuzz = ModuloDiferido("skfuzzy")
+ctrl = ModuloDiferido("skfuzzy.control")
+fpdf = ModuloDiferido("fpdf")
+
+# Orden de precarga en segundo plano: primero lo que usa "Analizar y Guardar"
+MODULOS_PRECARGA = [pd, cv2, Image, ImageTk, fpdf, mpl_figure, mpl_agg, mdates]
+
+registrar_tiempo_arranque("importaciones base", time.perf_counter() - INICIO_ARRANQUE)
+
+def precargar_modulos(modulos=None):
+    """Importa los módulos diferidos; pensado para ejecutarse en un hilo"""
+    for modulo in MODULOS_PRECARGA if modulos is None else modulos:
+        try:
+            modulo.cargar()
+        except Exception as e:
+            registrar_error(e)
+
+# Carga del motor difuso en el hilo de precarga (None = se carga bajo demanda)
+CARGA_MOTOR = None
+
+def precargar_en_segundo_plano(al_terminar=None, tabla_riesgo=False):
+    """Lanza la precarga en un hilo daemon.
+    
+    Primero carga el motor difuso (compilándolo si la caché en disco no
+    existe o quedó invalidada) y, si se pide, la tabla de riesgo; después
+    importa los módulos diferidos. CARGA_MOTOR es el Future de la primera
+    etapa, por el que espera evaluar_riesgo.
+    """
+    global CARGA_MOTOR
+    carga_motor = CARGA_MOTOR = Future()
+    
+    def tarea():
+        inicio = time.perf_counter()
+        try:
+            get_motor_difuso()
+            if tabla_riesgo:
+                activar_tabla_riesgo()
+            carga_motor.set_result(None)
+        except Exception as e:
+            registrar_error(e)
+            carga_motor.set_exception(e)
+        registrar_tiempo_arranque("motor difuso", time.perf_counter() - inicio)
+        precargar_modulos()
+        if al_terminar is not None:
+            al_terminar()
+    hilo = threading.Thread(target=tarea, name="precarga-modulos", daemon=True)
+    hilo.start()
+    return hilo
+
+def reporte_arranque():
+    """Devuelve el reporte de tiempos de arranque como texto"""
+    lineas = [f"--- ARRANQUE ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ---"]
+    for etapa, segundos in TIEMPOS_ARRANQUE.items():
+        lineas.append(f"{etapa:<35} {segundos * 1000:9.1f} ms")
+    return "\n".join(lineas) + "\n"
+
+def escribir_reporte_arranque(ruta="arranque.log"):
+    """Imprime el reporte de arranque y lo agrega al archivo de registro"""
+    reporte = reporte_arranque()
+    print(reporte)
+    try:
+        with open(ruta, "a", encoding="utf-8") as f:
+            f.write(reporte)
+    except Exception as e:
+        print(f"Error al escribir reporte de arranque: {e}")
 
 # ========== LOG DE ERRORES MEJORADO ==========
-def registrar_error(e):
-    """Registra errores con más información de contexto"""
+# False en los comandos de consola: los errores no abren diálogos
+INTERFAZ_GRAFICA = True
+
+def registrar_error(e, avisar=True):
+    """Registra errores con más información de contexto.
+    
+    Con avisar=False sólo se escribe en error.log y stderr, sin diálogo
+    (fallos recuperables que no deben interrumpir al usuario).
+    """
     error_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     error_msg = f"\n--- ERROR ({error_time}) ---\n"
     error_msg += f"Type: {type(e).__name__}\n"
@@ -37,6 +167,14 @@ def registrar_error(e):
     except Exception as log_error:
         print(f"Error al escribir en log: {log_error}")
     
+    if not avisar:
+        print(f"{type(e).__name__}: {e}", file=sys.stderr)
+        return
+    
+    # Tk sólo puede usarse desde el hilo principal
+    if not INTERFAZ_GRAFICA or threading.current_thread() is not threading.main_thread():
+        return
+    
     try:
         root = tk.Tk()
         root.withdraw()
@@ -48,66 +186,97 @@ def registrar_error(e):
     except Exception:
         pass
 
+def mostrar_error(titulo, mensaje):
+    """Muestra un error al usuario (diálogo en la interfaz, stderr en consola)"""
+    if not INTERFAZ_GRAFICA or threading.current_thread() is not threading.main_thread():
+        print(f"{titulo}: {mensaje}", file=sys.stderr)
+        return
+    messagebox.showerror(titulo, mensaje)
+
 # ========== SISTEMA DIFUSO OPTIMIZADO ==========
 def create_universe(lim_inf, lim_sup, points=101):
     """Crea universo de discurso optimizado"""
     return np.linspace(lim_inf, lim_sup, points)
 
+# Universos de discurso de cada variable (límite inferior, límite superior)
+UNIVERSOS = {
+    'Sensibilidad': (0, 6),
+    'Area': (0, 4),
+    'DesvEstR': (0, 4),
+    'Secrecion': (0, 1),
+    'Eritema': (0, 1),
+    'TiempoEvol': (0, 35),
+    'ControlGlu': (5, 12),
+    'Riesgo': (1, 3),
+}
+
+# Orden de las entradas en las reglas de REGLASTEXT
+VARIABLES_ENTRADA = ['Sensibilidad', 'Area', 'DesvEstR', 'Secrecion',
+                     'Eritema', 'TiempoEvol', 'ControlGlu']
+
+# Funciones de membresía: variable -> término -> (tipo, parámetros)
+PARAMETROS_MF = {
+    'Sensibilidad': {
+        'Normal': ('trapmf', [4, 5, 6, 6]),
+        'Disminuida': ('trapmf', [1, 2, 4, 5]),
+        'Ausente': ('trapmf', [0, 0, 1, 2]),
+    },
+    'Area': {
+        'Pequena': ('trapmf', [0, 0, 0.3, 0.7]),
+        'Mediana': ('trapmf', [0.5, 1, 1.5, 2]),
+        'Grande': ('trapmf', [1.8, 2.5, 4, 4]),
+    },
+    'DesvEstR': {
+        'Baja': ('trapmf', [0, 0, 1, 1.5]),
+        'Media': ('trapmf', [1.2, 1.5, 2.5, 2.8]),
+        'Alta': ('trapmf', [2.3, 2.5, 4, 4]),
+    },
+    'Secrecion': {
+        'No': ('trapmf', [0, 0, 0.4, 0.6]),
+        'Si': ('trapmf', [0.4, 0.6, 1, 1]),
+    },
+    'Eritema': {
+        'No': ('trapmf', [0, 0, 0.4, 0.6]),
+        'Si': ('trapmf', [0.4, 0.6, 1, 1]),
+    },
+    'TiempoEvol': {
+        'Reciente': ('trapmf', [0, 0, 5, 7]),
+        'Intermedio': ('trapmf', [6, 8, 20, 22]),
+        'Prolongado': ('trapmf', [20, 22, 35, 35]),
+    },
+    'ControlGlu': {
+        'Bueno': ('trapmf', [5, 5, 6.5, 7]),
+        'Regular': ('trapmf', [6.8, 7, 8.5, 8.7]),
+        'Malo': ('trapmf', [8.5, 9, 12, 12]),
+    },
+    'Riesgo': {
+        'Bajo': ('trimf', [1, 1.3, 2]),
+        'Moderado': ('trimf', [1.6, 2, 2.4]),
+        'Alto': ('trimf', [2.1, 2.5, 3]),
+    },
+}
+
 # Diccionario para almacenar las variables difusas
 FUZZY_VARS = {}
 
+def calcular_mf(universo, tipo, parametros):
+    """Evalúa una función de membresía de skfuzzy sobre el universo"""
+    return getattr(fuzz, tipo)(universo, parametros)
+
 def initialize_fuzzy_system():
     """Inicializa el sistema difuso de forma segura y eficiente"""
     # Antecedentes
-    FUZZY_VARS['Sensibilidad'] = ctrl.Antecedent(create_universe(0, 6), 'Sensibilidad')
-    FUZZY_VARS['Area'] = ctrl.Antecedent(create_universe(0, 4), 'Area')
-    FUZZY_VARS['DesvEstR'] = ctrl.Antecedent(create_universe(0, 4), 'DesvEstR')
-    FUZZY_VARS['Secrecion'] = ctrl.Antecedent(create_universe(0, 1), 'Secrecion')
-    FUZZY_VARS['Eritema'] = ctrl.Antecedent(create_universe(0, 1), 'Eritema')
-    FUZZY_VARS['TiempoEvol'] = ctrl.Antecedent(create_universe(0, 35), 'TiempoEvol')
-    FUZZY_VARS['ControlGlu'] = ctrl.Antecedent(create_universe(5, 12), 'ControlGlu')
+    for var_name in VARIABLES_ENTRADA:
+        FUZZY_VARS[var_name] = ctrl.Antecedent(create_universe(*UNIVERSOS[var_name]), var_name)
     
     # Consecuente
-    FUZZY_VARS['Riesgo'] = ctrl.Consequent(create_universe(1, 3), 'Riesgo', defuzzify_method='centroid')
+    FUZZY_VARS['Riesgo'] = ctrl.Consequent(create_universe(*UNIVERSOS['Riesgo']), 'Riesgo', defuzzify_method='centroid')
     
     # Funciones de membresía
-    sens = FUZZY_VARS['Sensibilidad']
-    sens['Normal'] = fuzz.trapmf(sens.universe, [4, 5, 6, 6])
-    sens['Disminuida'] = fuzz.trapmf(sens.universe, [1, 2, 4, 5])
-    sens['Ausente'] = fuzz.trapmf(sens.universe, [0, 0, 1, 2])
-    
-    area = FUZZY_VARS['Area']
-    area['Pequena'] = fuzz.trapmf(area.universe, [0, 0, 0.3, 0.7])
-    area['Mediana'] = fuzz.trapmf(area.universe, [0.5, 1, 1.5, 2])
-    area['Grande'] = fuzz.trapmf(area.universe, [1.8, 2.5, 4, 4])
-    
-    desv = FUZZY_VARS['DesvEstR']
-    desv['Baja'] = fuzz.trapmf(desv.universe, [0, 0, 1, 1.5])
-    desv['Media'] = fuzz.trapmf(desv.universe, [1.2, 1.5, 2.5, 2.8])
-    desv['Alta'] = fuzz.trapmf(desv.universe, [2.3, 2.5, 4, 4])
-    
-    secrec = FUZZY_VARS['Secrecion']
-    secrec['No'] = fuzz.trapmf(secrec.universe, [0, 0, 0.4, 0.6])
-    secrec['Si'] = fuzz.trapmf(secrec.universe, [0.4, 0.6, 1, 1])
-    
-    erit = FUZZY_VARS['Eritema']
-    erit['No'] = fuzz.trapmf(erit.universe, [0, 0, 0.4, 0.6])
-    erit['Si'] = fuzz.trapmf(erit.universe, [0.4, 0.6, 1, 1])
-    
-    tiempo = FUZZY_VARS['TiempoEvol']
-    tiempo['Reciente'] = fuzz.trapmf(tiempo.universe, [0, 0, 5, 7])
-    tiempo['Intermedio'] = fuzz.trapmf(tiempo.universe, [6, 8, 20, 22])
-    tiempo['Prolongado'] = fuzz.trapmf(tiempo.universe, [20, 22, 35, 35])
-    
-    gluc = FUZZY_VARS['ControlGlu']
-    gluc['Bueno'] = fuzz.trapmf(gluc.universe, [5, 5, 6.5, 7])
-    gluc['Regular'] = fuzz.trapmf(gluc.universe, [6.8, 7, 8.5, 8.7])
-    gluc['Malo'] = fuzz.trapmf(gluc.universe, [8.5, 9, 12, 12])
-    
-    riesgo = FUZZY_VARS['Riesgo']
-    riesgo['Bajo'] = fuzz.trimf(riesgo.universe, [1, 1.3, 2])
-    riesgo['Moderado'] = fuzz.trimf(riesgo.universe, [1.6, 2, 2.4])
-    riesgo['Alto'] = fuzz.trimf(riesgo.universe, [2.1, 2.5, 3])
+    for var_name, terminos in PARAMETROS_MF.items():
+        var = FUZZY_VARS[var_name]
+        for termino, (tipo, parametros) in terminos.items():
+            var[termino] = calcular_mf(var.universe, tipo, parametros)
     
     # Validar que los universos sean consistentes
     for var_name, var in FUZZY_VARS.items():
@@ -142,6 +311,22 @@ SALIDAS = ["Bajo", "Moderado", "Alto"]
 # Singleton para el sistema de control
 FUZZY_SYSTEM = None
 
+def parse_reglas():
+    """Convierte REGLASTEXT en una lista de (condiciones, salida) con índices 1-based"""
+    reglas = []
+    for line in REGLASTEXT.strip().split("\n"):
+        if not line.strip():
+            continue
+        parts = line.split(",")
+        if len(parts) < 2:
+            continue
+        
+        condiciones = [int(v) for v in parts[0].split()]
+        if not any(condiciones):
+            continue
+        reglas.append((condiciones, int(parts[1])))
+    return reglas
+
 def get_fuzzy_system():
     """Obtiene el sistema difuso (patrón singleton)"""
     global FUZZY_SYSTEM
@@ -151,33 +336,20 @@ def get_fuzzy_system():
         
         # Procesar reglas
         all_rules = []
-        for line in REGLASTEXT.strip().split("\n"):
-            if not line.strip():
-                continue
-            parts = line.split(",")
-            if len(parts) < 2:
-                continue
-                
-            condiciones = parts[0].split()
-            salida = int(parts[1])
+        for condiciones, salida in parse_reglas():
             antecedentes = []
             
             for idx, v in enumerate(condiciones):
-                v = int(v)
                 if v == 0: 
                     continue
                     
-                var_name = ['Sensibilidad', 'Area', 'DesvEstR', 'Secrecion', 
-                           'Eritema', 'TiempoEvol', 'ControlGlu'][idx]
+                var_name = VARIABLES_ENTRADA[idx]
                 mf_name = MFS[idx][v-1]
                 
                 # Acceso seguro sin usar eval()
                 antecedent = FUZZY_VARS[var_name][mf_name]
                 antecedentes.append(antecedent)
             
-            if not antecedentes:
-                continue
-                
             rule_antecedent = reduce(operator.and_, antecedentes) if len(antecedentes) > 1 else antecedentes[0]
             regla = ctrl.Rule(rule_antecedent, FUZZY_VARS['Riesgo'][SALIDAS[salida-1]])
             all_rules.append(regla)
@@ -186,6 +358,712 @@ def get_fuzzy_system():
     
     return FUZZY_SYSTEM
 
+# ========== MOTOR DIFUSO VECTORIZADO ==========
+# Diferencia máxima admitida frente a ControlSystemSimulation.compute()
+TOLERANCIA_MOTOR = 1e-9
+
+CARPETA_CACHE = "cache"
+
+# Incrementar si cambia el formato del motor serializado
+VERSION_CACHE_MOTOR = 1
+
+def huella_sistema_difuso(*extra):
+    """Hash de las reglas y funciones de membresía (invalida cachés al cambiar)"""
+    contenido = json.dumps({
+        'reglas': REGLASTEXT.strip(),
+        'mfs': MFS,
+        'salidas': SALIDAS,
+        'parametros': PARAMETROS_MF,
+        'universos': UNIVERSOS,
+        'puntos_universo': create_universe.__defaults__[0],
+        'extra': extra,
+    }, sort_keys=True)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:16]
+
+class MotorDifusoVectorizado:
+    """Evaluador Mamdani compilado que procesa N pacientes a la vez.
+    
+    Reproduce la semántica de skfuzzy: fuzzificación por interpolación
+    lineal, AND = mínimo, acumulación = máximo y centroide exacto sobre el
+    universo de salida ampliado con los puntos de corte de cada término.
+    """
+    
+    def __init__(self, universos, mfs_entrada, universo_salida, mfs_salida, reglas, salidas):
+        self.universos = [np.asarray(u, dtype=float) for u in universos]
+        self.mfs_entrada = [np.asarray(m, dtype=float) for m in mfs_entrada]
+        self.universo_salida = np.asarray(universo_salida, dtype=float)
+        self.mfs_salida = np.asarray(mfs_salida, dtype=float)
+        self.reglas = np.asarray(reglas, dtype=int)
+        self.salidas = np.asarray(salidas, dtype=int)
+    
+    @classmethod
+    def compilar(cls):
+        """Construye el motor a partir de UNIVERSOS, PARAMETROS_MF, MFS y REGLASTEXT"""
+        universos = []
+        mfs_entrada = []
+        for idx, var_name in enumerate(VARIABLES_ENTRADA):
+            universo = create_universe(*UNIVERSOS[var_name])
+            universos.append(universo)
+            mfs_entrada.append(np.stack([
+                calcular_mf(universo, *PARAMETROS_MF[var_name][termino])
+                for termino in MFS[idx]
+            ]))
+        
+        universo_salida = create_universe(*UNIVERSOS['Riesgo'])
+        mfs_salida = np.stack([
+            calcular_mf(universo_salida, *PARAMETROS_MF['Riesgo'][termino])
+            for termino in SALIDAS
+        ])
+        
+        reglas = parse_reglas()
+        return cls(universos, mfs_entrada, universo_salida, mfs_salida,
+                   [condiciones for condiciones, _ in reglas],
+                   [salida for _, salida in reglas])
+    
+    def guardar(self, ruta):
+        """Serializa los arreglos compilados en un archivo .npz (escritura atómica)"""
+        arreglos = {
+            'universo_salida': self.universo_salida,
+            'mfs_salida': self.mfs_salida,
+            'reglas': self.reglas,
+            'salidas': self.salidas,
+        }
+        for idx, (universo, mfs) in enumerate(zip(self.universos, self.mfs_entrada)):
+            arreglos[f'universo_{idx}'] = universo
+            arreglos[f'mfs_entrada_{idx}'] = mfs
+        
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez(f, **arreglos)
+        os.replace(temporal, ruta)
+    
+    @classmethod
+    def cargar(cls, ruta):
+        """Reconstruye el motor desde un archivo creado con guardar()"""
+        with np.load(ruta) as datos:
+            n = len(VARIABLES_ENTRADA)
+            return cls([datos[f'universo_{idx}'] for idx in range(n)],
+                       [datos[f'mfs_entrada_{idx}'] for idx in range(n)],
+                       datos['universo_salida'], datos['mfs_salida'],
+                       datos['reglas'], datos['salidas'])
+    
+    def fuerzas_salida(self, entradas):
+        """Calcula el corte acumulado de cada término de salida, forma (K, N)"""
+        grados = [
+            np.stack([np.interp(entradas[:, idx], universo, mf) for mf in mfs])
+            for idx, (universo, mfs) in enumerate(zip(self.universos, self.mfs_entrada))
+        ]
+        
+        cortes = np.zeros((len(self.mfs_salida), entradas.shape[0]))
+        for condiciones, salida in zip(self.reglas, self.salidas):
+            disparo = None
+            for idx, v in enumerate(condiciones):
+                if v == 0:
+                    continue
+                grado = grados[idx][v - 1]
+                disparo = grado if disparo is None else np.fmin(disparo, grado)
+            np.fmax(cortes[salida - 1], disparo, out=cortes[salida - 1])
+        return cortes
+    
+    def defuzzificar(self, cortes):
+        """Centroide de la salida agregada para cada columna de cortes"""
+        universo = self.universo_salida
+        du = np.diff(universo)
+        n = cortes.shape[1]
+        
+        # Universo ampliado: puntos donde cada término cruza su nivel de corte
+        puntos = [np.broadcast_to(universo, (n, universo.size))]
+        for mf, corte in zip(self.mfs_salida, cortes):
+            corte = corte[:, None]
+            sobre = mf[None, :] >= corte
+            cruce = sobre[:, 1:] != sobre[:, :-1]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                x_cruce = universo[:-1] + (corte - mf[:-1]) * du / np.diff(mf)
+            puntos.append(np.where(cruce, x_cruce, universo[:-1]))
+        xs = np.sort(np.concatenate(puntos, axis=1), axis=1)
+        
+        agregado = np.zeros_like(xs)
+        for mf, corte in zip(self.mfs_salida, cortes):
+            np.fmax(agregado, np.fmin(corte[:, None], np.interp(xs, universo, mf)), out=agregado)
+        
+        # Centroide exacto de la función lineal a trozos
+        x1, x2 = xs[:, :-1], xs[:, 1:]
+        y1, y2 = agregado[:, :-1], agregado[:, 1:]
+        dx = x2 - x1
+        area = 0.5 * dx * (y1 + y2)
+        momento = dx * dx / 3.0 * (y2 + 0.5 * y1) + x1 * area
+        
+        resultado = momento.sum(axis=1) / np.fmax(area.sum(axis=1), np.finfo(float).eps)
+        resultado[agregado.sum(axis=1) == 0] = np.nan  # Ninguna regla activa
+        return resultado
+    
+    def evaluar(self, entradas, bloque=4096):
+        """Evalúa un arreglo (N, 7) de entradas ya acotadas a sus universos"""
+        entradas = np.atleast_2d(np.asarray(entradas, dtype=float))
+        resultado = np.empty(entradas.shape[0])
+        for inicio in range(0, entradas.shape[0], bloque):
+            parte = entradas[inicio:inicio + bloque]
+            resultado[inicio:inicio + bloque] = self.defuzzificar(self.fuerzas_salida(parte))
+        return resultado
+
+# Singleton para el motor vectorizado
+MOTOR_DIFUSO = None
+
+def ruta_cache_motor(carpeta=CARPETA_CACHE):
+    """Ruta del motor serializado para la versión y reglas actuales"""
+    huella = huella_sistema_difuso('motor', VERSION_CACHE_MOTOR)
+    return os.path.join(carpeta, f"motor_difuso_v{VERSION_CACHE_MOTOR}_{huella}.npz")
+
+def get_motor_difuso():
+    """Obtiene el motor difuso vectorizado (patrón singleton).
+    
+    Se carga desde la caché en disco si existe; si no, se compila y se
+    guarda para los siguientes arranques.
+    """
+    global MOTOR_DIFUSO
+    if MOTOR_DIFUSO is None:
+        ruta = ruta_cache_motor()
+        if os.path.exists(ruta):
+            try:
+                MOTOR_DIFUSO = MotorDifusoVectorizado.cargar(ruta)
+                return MOTOR_DIFUSO
+            except Exception as e:
+                registrar_error(e)
+        
+        MOTOR_DIFUSO = MotorDifusoVectorizado.compilar()
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            MOTOR_DIFUSO.guardar(ruta)
+        except OSError as e:
+            registrar_error(e)
+    return MOTOR_DIFUSO
+
+def esperar_motor_difuso():
+    """Espera a que termine la carga del motor lanzada en segundo plano (si la hay)"""
+    if CARGA_MOTOR is not None:
+        # Sin relanzar el error: si la carga falló, get_motor_difuso() la reintenta
+        CARGA_MOTOR.exception()
+
+def preparar_entradas(sensibilidad, area, desv_estr, secrecion, eritema, tiempo_evol, control_glu):
+    """Acota las entradas a sus universos y binariza Secreción/Eritema, forma (N, 7)"""
+    columnas = np.broadcast_arrays(*[
+        np.asarray(v, dtype=float) for v in
+        (sensibilidad, area, desv_estr, secrecion, eritema, tiempo_evol, control_glu)
+    ])
+    entradas = np.column_stack([np.ravel(c) for c in columnas])
+    
+    for idx, var_name in enumerate(VARIABLES_ENTRADA):
+        if var_name in ('Secrecion', 'Eritema'):
+            entradas[:, idx] = np.where(entradas[:, idx] >= 0.5, 1.0, 0.0)
+        else:
+            entradas[:, idx] = np.clip(entradas[:, idx], *UNIVERSOS[var_name])
+    return entradas
+
+def evaluar_riesgo_lote(sensibilidad, area, desv_estr, secrecion, eritema, tiempo_evol, control_glu,
+                        valor_sin_reglas=2.0):
+    """Evalúa el riesgo de N pacientes con el motor vectorizado.
+    
+    Acepta escalares o arreglos de NumPy (se aplica broadcasting). Las filas
+    donde ninguna regla se activa reciben ``valor_sin_reglas``.
+    """
+    entradas = preparar_entradas(sensibilidad, area, desv_estr, secrecion,
+                                 eritema, tiempo_evol, control_glu)
+    riesgo = get_motor_difuso().evaluar(entradas)
+    riesgo = np.where(np.isnan(riesgo), valor_sin_reglas, np.clip(riesgo, 1.0, 3.0))
+    return riesgo
+
+def verificar_motor_vectorizado(n=500, semilla=0):
+    """Compara el motor vectorizado con skfuzzy y devuelve la diferencia máxima"""
+    rng = np.random.default_rng(semilla)
+    entradas = preparar_entradas(*[
+        rng.uniform(*UNIVERSOS[var_name], size=n) for var_name in VARIABLES_ENTRADA
+    ])
+    vectorizado = get_motor_difuso().evaluar(entradas)
+    
+    diferencia = 0.0
+    for fila, valor in zip(entradas, vectorizado):
+        sim = ctrl.ControlSystemSimulation(get_fuzzy_system())
+        for var_name, x in zip(VARIABLES_ENTRADA, fila):
+            sim.input[var_name] = x
+        try:
+            sim.compute()
+            referencia = sim.output['Riesgo']
+        except Exception:
+            referencia = np.nan
+        
+        if np.isnan(referencia) != np.isnan(valor):
+            return np.inf
+        if not np.isnan(referencia):
+            diferencia = max(diferencia, abs(referencia - valor))
+    return diferencia
+
+# ========== TABLA PRECALCULADA DE RIESGO ==========
+# Entradas continuas de la tabla; Secreción y Eritema se binarizan (0/1)
+VARIABLES_TABLA = ['Sensibilidad', 'Area', 'DesvEstR', 'TiempoEvol', 'ControlGlu']
+VARIABLES_BINARIAS = ['Secrecion', 'Eritema']
+# Valores equiespaciados por eje, además de los vértices de las funciones de membresía
+PUNTOS_TABLA = 5
+# Variación máxima del Riesgo dentro de una celda para responder con la tabla
+TOLERANCIA_TABLA = 0.05
+# Incrementar si cambia el formato de la tabla serializada
+VERSION_TABLA = 1
+
+def banda_riesgo(riesgo):
+    """Índice de la banda de semaforo_riesgo (0 bajo, 1 moderado, 2 alto) de un arreglo"""
+    return np.digitize(riesgo, [UMBRAL_RIESGO_BAJO, UMBRAL_RIESGO_MODERADO])
+
+class TablaRiesgo:
+    """Superficie de Riesgo precalculada con interpolación multilineal.
+    
+    La malla de cada entrada continua combina los vértices de sus funciones
+    de membresía con ``puntos`` valores equiespaciados, de modo que dentro
+    de una celda el conjunto de reglas que se activan no cambia. Sólo se
+    responde con la tabla en las celdas seguras: alguna regla se activa en
+    sus 32 esquinas y en su centro, todos esos valores caen en la misma
+    banda de semaforo_riesgo y no difieren más de ``tolerancia``. En el
+    resto (discontinuidades de la superficie Mamdani, cruces de banda)
+    consultar() devuelve None y se usa el motor exacto.
+    """
+    
+    def __init__(self, ejes, tabla, segura, errores=None):
+        self.ejes = [np.asarray(eje, dtype=float) for eje in ejes]
+        self.tabla = np.asarray(tabla, dtype=float)
+        self.segura = np.asarray(segura, dtype=bool)
+        # Medidos frente al motor exacto: error máximo, percentil 99,
+        # fracción de consultas respondidas y cambios de banda
+        self.error_maximo, self.error_p99, self.cobertura, self.cambios_banda = (
+            errores if errores is not None else (None, None, None, None))
+        
+        # Copias en listas para la consulta escalar sin overhead de NumPy
+        self._ejes_lista = [eje.tolist() for eje in self.ejes]
+        self._plano = self.tabla.ravel().tolist()
+        self._pasos = [paso // self.tabla.itemsize for paso in self.tabla.strides]
+        self._seguras = self.segura.ravel().tolist()
+        self._pasos_celda = [paso // self.segura.itemsize for paso in self.segura.strides]
+        self._desplazamientos = [0]
+        for paso in self._pasos[2:]:
+            self._desplazamientos = [d + b for d in self._desplazamientos for b in (0, paso)]
+    
+    @staticmethod
+    def calcular_ejes(puntos):
+        """Ejes de la malla para cada variable de VARIABLES_TABLA"""
+        ejes = []
+        for var_name in VARIABLES_TABLA:
+            vertices = [v for _, parametros in PARAMETROS_MF[var_name].values() for v in parametros]
+            eje = np.union1d(vertices, np.linspace(*UNIVERSOS[var_name], puntos))
+            lim_inf, lim_sup = UNIVERSOS[var_name]
+            ejes.append(eje[(eje >= lim_inf) & (eje <= lim_sup)])
+        return ejes
+    
+    @staticmethod
+    def evaluar_malla(ejes):
+        """Riesgo exacto (NaN si no se activa ninguna regla) en todos los nodos de la malla"""
+        mallas = np.meshgrid([0.0, 1.0], [0.0, 1.0], *ejes, indexing='ij')
+        valores = dict(zip(VARIABLES_BINARIAS + VARIABLES_TABLA, (m.ravel() for m in mallas)))
+        riesgo = evaluar_riesgo_lote(*[valores[var_name] for var_name in VARIABLES_ENTRADA],
+                                     valor_sin_reglas=np.nan)
+        return riesgo.reshape(mallas[0].shape)
+    
+    @staticmethod
+    def celdas_seguras(nodos, centros, tolerancia):
+        """Máscara (2, 2, celdas...) de las celdas que se pueden interpolar"""
+        minimo, maximo, sin_reglas = nodos, nodos, np.isnan(nodos)
+        for eje in range(2, nodos.ndim):
+            inferior = [slice(None)] * nodos.ndim
+            superior = [slice(None)] * nodos.ndim
+            inferior[eje], superior[eje] = slice(None, -1), slice(1, None)
+            inferior, superior = tuple(inferior), tuple(superior)
+            minimo = np.fmin(minimo[inferior], minimo[superior])
+            maximo = np.fmax(maximo[inferior], maximo[superior])
+            sin_reglas = sin_reglas[inferior] | sin_reglas[superior]
+        minimo, maximo = np.fmin(minimo, centros), np.fmax(maximo, centros)
+        return (~sin_reglas & ~np.isnan(centros)
+                & (banda_riesgo(minimo) == banda_riesgo(maximo))
+                & (maximo - minimo <= tolerancia))
+    
+    @classmethod
+    def construir(cls, puntos=PUNTOS_TABLA, tolerancia=TOLERANCIA_TABLA):
+        """Evalúa el motor vectorizado en los nodos y centros de toda la malla"""
+        ejes = cls.calcular_ejes(puntos)
+        nodos = cls.evaluar_malla(ejes)
+        centros = cls.evaluar_malla([(eje[:-1] + eje[1:]) / 2 for eje in ejes])
+        tabla = cls(ejes, nodos, cls.celdas_seguras(nodos, centros, tolerancia))
+        tabla.estimar_error()
+        return tabla
+    
+    @staticmethod
+    def ruta(puntos=PUNTOS_TABLA, tolerancia=TOLERANCIA_TABLA, carpeta=CARPETA_CACHE):
+        """Ruta de la tabla serializada para las reglas, malla y bandas actuales"""
+        huella = huella_sistema_difuso('tabla', VERSION_TABLA, puntos, tolerancia,
+                                       UMBRAL_RIESGO_BAJO, UMBRAL_RIESGO_MODERADO)
+        return os.path.join(carpeta, f"riesgo_tabla_v{VERSION_TABLA}_{huella}.npz")
+    
+    @classmethod
+    def cargar_o_construir(cls, puntos=PUNTOS_TABLA, tolerancia=TOLERANCIA_TABLA, carpeta=CARPETA_CACHE):
+        """Carga la tabla desde disco o la construye y la guarda"""
+        ruta = cls.ruta(puntos, tolerancia, carpeta)
+        if os.path.exists(ruta):
+            try:
+                with np.load(ruta) as datos:
+                    error_maximo, error_p99, cobertura, cambios_banda = datos['errores'].tolist()
+                    return cls(cls.calcular_ejes(puntos), datos['tabla'], datos['segura'],
+                               (error_maximo, error_p99, cobertura, int(cambios_banda)))
+            except Exception as e:
+                registrar_error(e)
+        
+        tabla = cls.construir(puntos, tolerancia)
+        try:
+            os.makedirs(carpeta, exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, "wb") as f:
+                np.savez(f, tabla=tabla.tabla, segura=tabla.segura,
+                         errores=[tabla.error_maximo, tabla.error_p99, tabla.cobertura, tabla.cambios_banda])
+            os.replace(temporal, ruta)
+        except OSError as e:
+            registrar_error(e)
+        return tabla
+    
+    def consultar(self, sensibilidad, area, desv_estr, secrecion, eritema, tiempo_evol, control_glu):
+        """Consulta escalar (entradas ya acotadas); None si la celda no es segura"""
+        bits = (1 if secrecion >= 0.5 else 0, 1 if eritema >= 0.5 else 0)
+        flat = self._pasos[0] * bits[0] + self._pasos[1] * bits[1]
+        celda = self._pasos_celda[0] * bits[0] + self._pasos_celda[1] * bits[1]
+        pesos = []
+        for eje, paso, paso_celda, x in zip(self._ejes_lista, self._pasos[2:], self._pasos_celda[2:],
+                                            (sensibilidad, area, desv_estr, tiempo_evol, control_glu)):
+            i = min(max(bisect.bisect_right(eje, x) - 1, 0), len(eje) - 2)
+            pesos.append((x - eje[i]) / (eje[i + 1] - eje[i]))
+            flat += i * paso
+            celda += i * paso_celda
+        if not self._seguras[celda]:
+            return None
+        
+        # Interpolación lineal sucesiva sobre las 32 esquinas de la celda,
+        # empezando por el último eje (bit menos significativo)
+        plano = self._plano
+        valores = [plano[flat + d] for d in self._desplazamientos]
+        for t in reversed(pesos):
+            valores = [a + (b - a) * t for a, b in zip(valores[0::2], valores[1::2])]
+        return valores[0]
+    
+    def consultar_lote(self, entradas):
+        """Consulta vectorizada sobre un arreglo (N, 7) acotado; NaN en celdas no seguras"""
+        entradas = np.atleast_2d(np.asarray(entradas, dtype=float))
+        columnas = dict(zip(VARIABLES_ENTRADA, entradas.T))
+        
+        base = [(columnas[var_name] >= 0.5).astype(int) for var_name in VARIABLES_BINARIAS]
+        indices, pesos = [], []
+        for eje, var_name in zip(self.ejes, VARIABLES_TABLA):
+            x = columnas[var_name]
+            i = np.clip(np.searchsorted(eje, x, side='right') - 1, 0, eje.size - 2)
+            indices.append(i)
+            pesos.append((x - eje[i]) / (eje[i + 1] - eje[i]))
+        
+        resultado = np.zeros(entradas.shape[0])
+        for esquina in range(2 ** len(self.ejes)):
+            peso = np.ones(entradas.shape[0])
+            idx = list(base)
+            for k, (i, t) in enumerate(zip(indices, pesos)):
+                bit = (esquina >> k) & 1
+                peso = peso * (t if bit else 1.0 - t)
+                idx.append(i + bit)
+            resultado += peso * np.nan_to_num(self.tabla[tuple(idx)])
+        resultado[~self.segura[tuple(base + indices)]] = np.nan
+        return resultado
+    
+    def estimar_error(self, n=20000, semilla=0):
+        """Error de interpolación frente al motor exacto en puntos aleatorios.
+        
+        Sólo cuentan las consultas que responde la tabla; las demás usan el
+        motor exacto y no tienen error. Devuelve el error máximo.
+        """
+        rng = np.random.default_rng(semilla)
+        entradas = preparar_entradas(*[
+            rng.uniform(*UNIVERSOS[var_name], size=n) for var_name in VARIABLES_ENTRADA
+        ])
+        exacto = evaluar_riesgo_lote(*entradas.T, valor_sin_reglas=np.nan)
+        interpolado = self.consultar_lote(entradas)
+        responde = ~np.isnan(interpolado)
+        errores = np.abs(interpolado - exacto)[responde]
+        self.cobertura = float(responde.mean())
+        self.error_maximo = float(errores.max()) if errores.size else 0.0
+        self.error_p99 = float(np.percentile(errores, 99)) if errores.size else 0.0
+        self.cambios_banda = int((banda_riesgo(interpolado[responde]) != banda_riesgo(exacto[responde])).sum())
+        return self.error_maximo
+
+# Tabla activa (None = se usa siempre el motor exacto)
+TABLA_RIESGO = None
+
+def activar_tabla_riesgo(puntos=PUNTOS_TABLA, tolerancia=TOLERANCIA_TABLA, carpeta=CARPETA_CACHE):
+    """Activa la consulta por tabla interpolada en evaluar_riesgo"""
+    global TABLA_RIESGO
+    tabla = TablaRiesgo.cargar_o_construir(puntos, tolerancia, carpeta)
+    print(f"Tabla de riesgo {tabla.tabla.shape}: responde el {tabla.cobertura:.0%} de las consultas "
+          f"con error máximo {tabla.error_maximo:.4f} (percentil 99 {tabla.error_p99:.4f}, "
+          f"{tabla.cambios_banda} cambios de semáforo); el resto usa el motor exacto")
+    TABLA_RIESGO = tabla
+    return tabla
+
+def desactivar_tabla_riesgo():
+    """Vuelve a evaluar el riesgo sólo con el motor exacto"""
+    global TABLA_RIESGO
+    TABLA_RIESGO = None
+
+# ========== CARGA DE IMÁGENES ==========
+# Memoria máxima para imágenes decodificadas en caché
+CACHE_IMAGENES_BYTES = 384 * 1024 * 1024
+# Lado máximo de la copia sobre la que el operador dibuja la ROI
+LADO_PROXY_ROI = 1280
+# Tamaño de las miniaturas del historial en el PDF
+TAMANO_MINIATURA_PDF = (150, 150)
+
+# Miniaturas en disco: carpeta oculta junto a cada imagen (pacientes/<nombre>/.miniaturas)
+CARPETA_PACIENTES = "pacientes"
+CARPETA_MINIATURAS = ".miniaturas"
+# Tope de espacio de miniaturas por carpeta; se borran las menos usadas
+MINIATURAS_MAX_BYTES = 32 * 1024 * 1024
+# Tamaño de la vista previa en la ventana
+TAMANO_PREVIEW = (450, 200)
+# Las miniaturas se generan en cubetas de este múltiplo para reutilizarlas
+PASO_CUBETA_MINIATURA = 50
+
+class CacheMiniaturas:
+    """Caché en disco de miniaturas JPEG direccionada por contenido.
+    
+    La clave combina tamaño y fecha de modificación del archivo original
+    con el tamaño pedido (redondeado a una cubeta). Cada lectura actualiza
+    la fecha de la miniatura; al superar MINIATURAS_MAX_BYTES en una carpeta
+    se eliminan las de uso más antiguo (LRU).
+    """
+    
+    def __init__(self, max_bytes=MINIATURAS_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def cubeta(tamano):
+        paso = PASO_CUBETA_MINIATURA
+        return tuple(max(paso, -(-int(v) // paso) * paso) for v in tamano)
+    
+    @staticmethod
+    def admite(ruta_img):
+        """Sólo se cachean imágenes ya copiadas a la carpeta de un paciente"""
+        base = os.path.abspath(CARPETA_PACIENTES) + os.sep
+        return os.path.abspath(ruta_img).startswith(base)
+    
+    @staticmethod
+    def carpeta(ruta_img):
+        return os.path.join(os.path.dirname(os.path.abspath(ruta_img)), CARPETA_MINIATURAS)
+    
+    def ruta(self, ruta_img, tamano):
+        """Ruta de la miniatura para la imagen y el tamaño (exista o no)"""
+        estado = os.stat(ruta_img)
+        clave = f"{os.path.basename(ruta_img)}|{estado.st_size}|{estado.st_mtime_ns}"
+        huella = hashlib.sha1(clave.encode("utf-8")).hexdigest()[:20]
+        ancho, alto = self.cubeta(tamano)
+        return os.path.join(self.carpeta(ruta_img), f"{huella}_{ancho}x{alto}.jpg")
+    
+    def obtener(self, ruta_img, tamano):
+        """Ruta de una miniatura existente o recién generada (None si no aplica)"""
+        if not self.admite(ruta_img):
+            return None
+        destino = self.ruta(ruta_img, tamano)
+        if os.path.exists(destino):
+            try:
+                os.utime(destino)  # Marca de uso para la política LRU
+            except OSError:
+                pass
+            return destino
+        generadas = self.generar(ruta_img, [tamano])
+        return generadas[0] if generadas else None
+    
+    def generar(self, ruta_img, tamanos):
+        """Genera las miniaturas pedidas decodificando el original una sola vez"""
+        destinos = [self.ruta(ruta_img, tamano) for tamano in tamanos]
+        cubetas = [self.cubeta(tamano) for tamano in tamanos]
+        try:
+            os.makedirs(self.carpeta(ruta_img), exist_ok=True)
+            with Image.open(ruta_img) as original:
+                original.draft('RGB', max(cubetas))
+                original = original.convert('RGB')
+            
+            for destino, cubeta in sorted(zip(destinos, cubetas), key=lambda d: d[1], reverse=True):
+                original.thumbnail(cubeta)
+                temporal = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+                original.save(temporal, "JPEG", quality=90)
+                os.replace(temporal, destino)
+        except OSError as e:
+            # Carpeta de sólo lectura u origen ilegible: se trabaja sin caché en disco
+            registrar_error(e, avisar=False)
+            return []
+        
+        self.limpiar(self.carpeta(ruta_img))
+        return destinos
+    
+    def limpiar(self, carpeta):
+        """Elimina las miniaturas menos usadas si la carpeta supera el tope"""
+        with self._lock:
+            try:
+                entradas = [e for e in os.scandir(carpeta) if e.is_file()]
+            except OSError:
+                return
+            total = sum(e.stat().st_size for e in entradas)
+            if total <= self.max_bytes:
+                return
+            for entrada in sorted(entradas, key=lambda e: e.stat().st_mtime):
+                if total <= self.max_bytes * 0.8:
+                    break
+                try:
+                    total -= entrada.stat().st_size
+                    os.remove(entrada.path)
+                except OSError:
+                    pass
+
+# Singleton de la caché de miniaturas
+CACHE_MINIATURAS = None
+
+def get_cache_miniaturas():
+    """Obtiene la caché de miniaturas en disco (patrón singleton)"""
+    global CACHE_MINIATURAS
+    if CACHE_MINIATURAS is None:
+        CACHE_MINIATURAS = CacheMiniaturas()
+    return CACHE_MINIATURAS
+
+class CargadorImagenes:
+    """Decodifica cada imagen una sola vez y guarda sus variantes en una caché LRU.
+    
+    Las variantes (imagen completa, copia reducida para la ROI, miniaturas
+    para la vista previa y el PDF) se indexan por ruta, fecha de modificación
+    y tamaño pedido. Las copias reducidas de JPEG se decodifican directamente
+    a 1/2, 1/4 o 1/8 de resolución cuando es posible.
+    """
+    
+    def __init__(self, max_bytes=CACHE_IMAGENES_BYTES):
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _clave(ruta, variante):
+        estado = os.stat(ruta)
+        return (os.path.abspath(ruta), estado.st_mtime_ns, estado.st_size, variante)
+    
+    @staticmethod
+    def _peso(valor):
+        if isinstance(valor, tuple):
+            valor = valor[0]
+        if isinstance(valor, np.ndarray):
+            return valor.nbytes
+        ancho, alto = valor.size
+        return ancho * alto * len(valor.getbands())
+    
+    def _obtener(self, clave):
+        with self._lock:
+            valor = self._cache.get(clave)
+            if valor is not None:
+                self._cache.move_to_end(clave)
+            return valor
+    
+    def _guardar(self, clave, valor):
+        peso = self._peso(valor)
+        if peso > self.max_bytes // 2:
+            return valor  # Demasiado grande para convivir con otras entradas
+        with self._lock:
+            if clave not in self._cache:
+                self._cache[clave] = valor
+                self._bytes += peso
+            while self._bytes > self.max_bytes and self._cache:
+                _, descartado = self._cache.popitem(last=False)
+                self._bytes -= self._peso(descartado)
+        return valor
+    
+    def limpiar(self):
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
+    
+    def completa(self, ruta):
+        """Imagen BGR a resolución completa (para las mediciones)"""
+        clave = self._clave(ruta, 'completa')
+        img = self._obtener(clave)
+        if img is None:
+            img = cv2.imread(ruta)
+            if img is None:
+                raise FileNotFoundError(f'Imagen no encontrada: {ruta}')
+            img = self._guardar(clave, img)
+        return img
+    
+    def reducida(self, ruta, lado_max=LADO_PROXY_ROI):
+        """Copia BGR con lado mayor <= lado_max y su escala respecto al original"""
+        clave = self._clave(ruta, ('reducida', lado_max))
+        valor = self._obtener(clave)
+        if valor is not None:
+            return valor
+        
+        completa = self._obtener(self._clave(ruta, 'completa'))
+        if completa is not None:
+            alto, ancho = completa.shape[:2]
+            img = completa
+        else:
+            with Image.open(ruta) as cabecera:
+                ancho, alto = cabecera.size
+            # Decodificación reducida de libjpeg (otros formatos se decodifican completos)
+            bandera = cv2.IMREAD_COLOR
+            for factor, reducida in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                     (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                     (2, cv2.IMREAD_REDUCED_COLOR_2)):
+                if max(ancho, alto) / factor >= lado_max:
+                    bandera = reducida
+                    break
+            img = cv2.imread(ruta, bandera)
+            if img is None:
+                raise FileNotFoundError(f'Imagen no encontrada: {ruta}')
+            # La cabecera da el tamaño almacenado; cv2 ya aplicó la orientación
+            # EXIF (p. ej. Orientation=6 en fotos de teléfono), que lo transpone
+            if (img.shape[1] > img.shape[0]) != (ancho > alto) and img.shape[1] != img.shape[0]:
+                ancho, alto = alto, ancho
+        
+        escala = min(1.0, lado_max / max(ancho, alto))
+        destino = (max(1, round(ancho * escala)), max(1, round(alto * escala)))
+        if (img.shape[1], img.shape[0]) != destino:
+            img = cv2.resize(img, destino, interpolation=cv2.INTER_AREA)
+        # La escala se deriva del tamaño final para mapear coordenadas exactas
+        return self._guardar(clave, (img, img.shape[1] / ancho))
+    
+    def miniatura(self, ruta, tamano):
+        """Miniatura PIL (RGB) que cabe en tamano=(ancho, alto); compartida, no modificar"""
+        tamano = (max(1, int(tamano[0])), max(1, int(tamano[1])))
+        clave = self._clave(ruta, ('miniatura', tamano))
+        img = self._obtener(clave)
+        if img is not None:
+            return img
+        
+        # Primero la caché en disco; si no está disponible, el original
+        en_disco = get_cache_miniaturas().obtener(ruta, tamano)
+        completa = self._obtener(self._clave(ruta, 'completa'))
+        if en_disco is not None:
+            with Image.open(en_disco) as miniatura:
+                img = miniatura.convert('RGB')
+        elif completa is not None:
+            img = Image.fromarray(cv2.cvtColor(completa, cv2.COLOR_BGR2RGB))
+        else:
+            img = Image.open(ruta)
+            img.draft('RGB', tamano)  # Decodificación JPEG reducida
+            img = img.convert('RGB')
+        img.thumbnail(tamano)
+        return self._guardar(clave, img)
+
+# Singleton del cargador de imágenes
+CARGADOR_IMAGENES = None
+
+def get_cargador_imagenes():
+    """Obtiene el cargador de imágenes compartido (patrón singleton)"""
+    global CARGADOR_IMAGENES
+    if CARGADOR_IMAGENES is None:
+        CARGADOR_IMAGENES = CargadorImagenes()
+    return CARGADOR_IMAGENES
+
 # ========== ANÁLISIS DE IMAGEN MEJORADO ==========
 def select_roi_safe(img, img_name):
     """Selección segura de ROI con manejo de cancelación"""
@@ -200,35 +1078,172 @@ def select_roi_safe(img, img_name):
         return None
     return r
 
-def analizar_imagen(imagen_path):
-    """Analiza imagen con manejo robusto de errores"""
-    img = cv2.imread(imagen_path)
-    if img is None:
-        raise FileNotFoundError(f'Imagen no encontrada: {imagen_path}')
+# Modo de selección de la lesión:
+#   "manual"   rectángulo con cv2.selectROI; se mide todo el rectángulo
+#   "asistido" rectángulo con cv2.selectROI refinado con GrabCut
+#   "auto"     segmentación automática, sin intervención del operador
+MODOS_ROI = ["manual", "asistido", "auto"]
+MODO_ROI = "manual"
+
+# Lado máximo de la imagen reducida sobre la que se segmenta
+LADO_SEGMENTACION = 800
+
+def _componente_mayor(mascara):
+    """Conserva sólo la componente conexa más grande de una máscara uint8"""
+    n, etiquetas, stats, _ = cv2.connectedComponentsWithStats(mascara, connectivity=8)
+    if n <= 1:
+        return np.zeros_like(mascara)
+    mayor = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    return (etiquetas == mayor).astype(np.uint8)
+
+def _candidata_lesion(proxy, kernel):
+    """Máscara uint8 inicial: Otsu sobre a* de Lab, apertura/cierre y componente mayor"""
+    canal_a = cv2.GaussianBlur(cv2.cvtColor(proxy, cv2.COLOR_BGR2LAB)[:, :, 1], (5, 5), 0)
+    _, candidata = cv2.threshold(canal_a, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    candidata = cv2.morphologyEx(candidata, cv2.MORPH_OPEN, kernel)
+    candidata = cv2.morphologyEx(candidata, cv2.MORPH_CLOSE, kernel)
+    return _componente_mayor(candidata)
+
+def segmentar_lesion(img, rect=None, lado_max=LADO_SEGMENTACION, iteraciones=3):
+    """Segmenta la lesión y devuelve una máscara booleana del tamaño de img (BGR).
     
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img_name = os.path.basename(imagen_path)
+    Sin ``rect`` se umbraliza (Otsu) el canal a* de Lab, que resalta el tejido
+    rojizo, se limpia con apertura/cierre morfológico y la componente mayor
+    se refina con GrabCut. Con ``rect`` (x, y, w, h) GrabCut parte de ese
+    rectángulo. El trabajo se hace sobre una copia reducida y la máscara se
+    reescala al tamaño original.
+    """
+    alto, ancho = img.shape[:2]
+    escala = min(1.0, lado_max / max(alto, ancho))
+    proxy = cv2.resize(img, (max(1, round(ancho * escala)), max(1, round(alto * escala))),
+                       interpolation=cv2.INTER_AREA) if escala < 1.0 else img
+    
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    modelo_fondo = np.zeros((1, 65), np.float64)
+    modelo_frente = np.zeros((1, 65), np.float64)
+    mascara_gc = np.zeros(proxy.shape[:2], np.uint8)
+    
+    if rect is not None:
+        x, y, w, h = [int(round(v * escala)) for v in rect]
+        x, y = max(0, x), max(0, y)
+        w, h = max(1, min(w, proxy.shape[1] - x)), max(1, min(h, proxy.shape[0] - y))
+        cv2.grabCut(proxy, mascara_gc, (x, y, w, h), modelo_fondo, modelo_frente,
+                    iteraciones, cv2.GC_INIT_WITH_RECT)
+    else:
+        candidata = _candidata_lesion(proxy, kernel)
+        if not candidata.any():
+            raise ValueError("No se detectó ninguna lesión en la imagen")
+        
+        # Semilla para GrabCut: núcleo seguro, resto de la componente probable
+        mascara_gc[:] = cv2.GC_PR_BGD
+        mascara_gc[candidata == 1] = cv2.GC_PR_FGD
+        mascara_gc[cv2.erode(candidata, kernel, iterations=2) == 1] = cv2.GC_FGD
+        try:
+            cv2.grabCut(proxy, mascara_gc, None, modelo_fondo, modelo_frente,
+                        iteraciones, cv2.GC_INIT_WITH_MASK)
+        except cv2.error:
+            mascara_gc[:] = np.where(candidata == 1, cv2.GC_FGD, cv2.GC_BGD)
     
-    r = select_roi_safe(img, img_name)
+    lesion = np.isin(mascara_gc, (cv2.GC_FGD, cv2.GC_PR_FGD)).astype(np.uint8)
+    lesion = _componente_mayor(cv2.morphologyEx(lesion, cv2.MORPH_OPEN, kernel))
+    if not lesion.any():
+        raise ValueError("No se detectó ninguna lesión en la imagen")
+    
+    if escala < 1.0:
+        lesion = cv2.resize(lesion, (ancho, alto), interpolation=cv2.INTER_NEAREST)
+    return lesion.astype(bool)
+
+def medir_lesion(img_rgb, mascara):
+    """Media RGB, desviación RGB y área (cm²) sobre los píxeles de la lesión"""
+    pixeles = img_rgb[mascara]
+    if pixeles.size == 0:
+        raise ValueError("La máscara de la lesión está vacía")
+    mean_rgb = np.mean(pixeles, axis=0)
+    std_rgb = np.std(pixeles, axis=0)
+    area_lesion = int(np.count_nonzero(mascara)) / 10000  # Convertir a cm²
+    return mean_rgb, std_rgb, area_lesion
+
+def seleccionar_roi(imagen_path):
+    """Pide el rectángulo al operador (hilo de interfaz) a resolución completa"""
+    # El operador dibuja sobre una copia reducida; se mapea a resolución completa
+    proxy, escala = get_cargador_imagenes().reducida(imagen_path)
+    r = select_roi_safe(proxy, os.path.basename(imagen_path))
     if r is None:
         raise ValueError("Selección de ROI cancelada por el usuario")
+    return tuple(int(round(v / escala)) for v in r)
+
+def analizar_imagen(imagen_path, modo_roi=None, rect=None):
+    """Analiza imagen con manejo robusto de errores
     
-    x, y, w, h = map(int, r)
-    roi = img_rgb[y:y+h, x:x+w]
+    ``modo_roi`` es uno de MODOS_ROI (por defecto MODO_ROI). Si se pasa
+    ``rect`` (x, y, w, h), se usa en lugar de pedir el rectángulo al operador,
+    lo que permite el análisis sin interfaz.
+    """
+    modo_roi = modo_roi or MODO_ROI
+    if modo_roi not in MODOS_ROI:
+        raise ValueError(f"Modo de ROI desconocido: {modo_roi}")
+    
+    cargador = get_cargador_imagenes()
+    
+    r = rect
+    if r is None and modo_roi != "auto":
+        r = seleccionar_roi(imagen_path)
+    
+    img = cargador.completa(imagen_path)
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     
-    if roi.size == 0:
-        raise ValueError("ROI seleccionada no contiene datos")
+    if modo_roi == "manual":
+        x, y, w, h = map(int, r)
+        roi = img_rgb[y:y+h, x:x+w]
+        
+        if roi.size == 0:
+            raise ValueError("ROI seleccionada no contiene datos")
+        
+        mean_rgb = np.mean(roi, axis=(0, 1))
+        std_rgb = np.std(roi, axis=(0, 1))
+        area_lesion = (w * h) / 10000  # Convertir a cm²
+        return img_rgb, roi, mean_rgb, std_rgb, area_lesion
     
-    mean_rgb = np.mean(roi, axis=(0, 1))
-    std_rgb = np.std(roi, axis=(0, 1))
-    area_lesion = (w * h) / 10000  # Convertir a cm²
+    mascara = segmentar_lesion(img, rect=r)
+    mean_rgb, std_rgb, area_lesion = medir_lesion(img_rgb, mascara)
     
+    # ROI = recorte del rectángulo que contiene la lesión
+    filas = np.flatnonzero(mascara.any(axis=1))
+    columnas = np.flatnonzero(mascara.any(axis=0))
+    roi = img_rgb[filas[0]:filas[-1] + 1, columnas[0]:columnas[-1] + 1]
     return img_rgb, roi, mean_rgb, std_rgb, area_lesion
 
+def combinar_mediciones(mediciones):
+    """Combina (media_rgb, desv_rgb, área) de varias tomas de la misma lesión.
+    
+    El área es la mayor observada; media y desviación se agrupan sobre los
+    píxeles de lesión de todas las tomas (ponderadas por área), como una
+    sola muestra.
+    """
+    medias = np.array([m[0] for m in mediciones], dtype=float)
+    desvs = np.array([m[1] for m in mediciones], dtype=float)
+    areas = np.array([m[2] for m in mediciones], dtype=float)
+    
+    pesos = areas if areas.sum() > 0 else np.ones(len(areas))
+    pesos = pesos / pesos.sum()
+    media = pesos @ medias
+    varianza = pesos @ (desvs ** 2 + medias ** 2) - media ** 2
+    return media, np.sqrt(np.maximum(varianza, 0)), float(areas.max())
+
+# Umbrales del semáforo de riesgo
+UMBRAL_RIESGO_BAJO = 1.6
+UMBRAL_RIESGO_MODERADO = 2.1
+
+def semaforo_riesgo(riesgo):
+    """Clase de semáforo para un valor de riesgo"""
+    if riesgo < UMBRAL_RIESGO_BAJO:
+        return "BAJO (verde)"
+    elif riesgo < UMBRAL_RIESGO_MODERADO:
+        return "MODERADO (amarillo)"
+    return "ALTO (rojo)"
+
 def evaluar_riesgo(sensibilidad, area, desv_estr, secrecion, eritema, tiempo_evol, control_glu):
     """Evalúa el riesgo usando el sistema difuso"""
-    sim = ctrl.ControlSystemSimulation(get_fuzzy_system())
-    
     inputs = {
         'Sensibilidad': max(0, min(6, sensibilidad)),
         'Area': max(0, min(4, area)),
@@ -241,281 +1256,2766 @@ def evaluar_riesgo(sensibilidad, area, desv_estr, secrecion, eritema, tiempo_evo
     
     # Registrar entrada para diagnóstico
     print(f"Evaluando riesgo con entradas: {inputs}")
+    esperar_motor_difuso()
     
-    for key, value in inputs.items():
-        sim.input[key] = value
+    # Tabla interpolada (opcional): None fuera de las celdas seguras
+    if TABLA_RIESGO is not None:
+        riesgo = TABLA_RIESGO.consultar(*inputs.values())
+        if riesgo is not None:
+            return riesgo
     
     try:
-        sim.compute()
-        riesgo = sim.output['Riesgo']
-        return max(1.0, min(3.0, riesgo))  # Asegurar rango 1-3
+        riesgo = evaluar_riesgo_lote(*inputs.values(), valor_sin_reglas=np.nan)[0]
+        if np.isnan(riesgo):
+            raise ValueError("Ninguna regla difusa se activó con estas entradas")
+        return float(riesgo)  # Ya acotado al rango 1-3
     except Exception as e:
         registrar_error(e)
         return 2.0  # Valor predeterminado en caso de error
 
 # ========== MANEJO DE DATOS Y PDF ==========
-def get_dataframe():
-    """Obtiene el DataFrame de resultados, crea el archivo si no existe"""
-    cols = [
-        'ID', 'FechaHora', 'Paciente', 'AreaLesion', 'DesvEstR', 'MediaR', 'MediaG', 'MediaB',
-        'Secrecion', 'Eritema', 'Sensibilidad', 'TiempoEvol', 'ControlGlu', 'Riesgo', 'Semaforo',
-        'Imagen', 'Comparacion', 'EvolArea', 'EvolDesv'
-    ]
+ARCHIVO_CSV = "resultados_pacientes.csv"
+
+COLUMNAS_EVALUACION = [
+    'ID', 'FechaHora', 'Paciente', 'AreaLesion', 'DesvEstR', 'MediaR', 'MediaG', 'MediaB',
+    'Secrecion', 'Eritema', 'Sensibilidad', 'TiempoEvol', 'ControlGlu', 'Riesgo', 'Semaforo',
+    'Imagen', 'Comparacion', 'EvolArea', 'EvolDesv', 'Imagenes'
+]
+
+# Todas las imágenes de una visita se guardan en 'Imagenes' separadas por ';'
+# ('Imagen' conserva la principal: la de mayor área de lesión)
+SEPARADOR_IMAGENES = ";"
+
+# Tipos de las evaluaciones en memoria (Imagen e Imagenes quedan como texto).
+# El CSV nunca se reescribe desde estos tipos: AlmacenCSV lo compacta como texto.
+# Riesgo se mantiene en float64 para no mover valores que caen justo en los
+# umbrales del semáforo. EvolArea/EvolDesv se escriben en el CSV como
+# " (+0.12)" y en memoria son la diferencia numérica.
+ESQUEMA_EVALUACION = {
+    'ID': 'Int64',
+    'FechaHora': 'datetime64[ns]',
+    'Paciente': 'category',
+    'AreaLesion': 'float32', 'DesvEstR': 'float32',
+    'MediaR': 'float32', 'MediaG': 'float32', 'MediaB': 'float32',
+    'Secrecion': 'float32', 'Eritema': 'float32', 'Sensibilidad': 'float32',
+    'TiempoEvol': 'float32', 'ControlGlu': 'float32',
+    'Riesgo': 'float64',
+    'Semaforo': 'category',
+    'Comparacion': 'category',
+    'EvolArea': 'float32', 'EvolDesv': 'float32',
+}
+COLUMNAS_EVOLUCION = ['EvolArea', 'EvolDesv']
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+def _convertir_fechas(serie):
+    """Fechas con FORMATO_FECHA; otros formatos (versiones anteriores) sólo donde no encaja"""
+    fechas = pd.to_datetime(serie, format=FORMATO_FECHA, errors='coerce')
+    otras = fechas.isna() & serie.notna()
+    if otras.any():
+        fechas[otras] = pd.to_datetime(serie[otras].astype(str), format='mixed', errors='coerce')
+    return fechas.astype(ESQUEMA_EVALUACION['FechaHora'])
+
+def tipar_evaluaciones(df):
+    """Copia de df con las columnas presentes convertidas a ESQUEMA_EVALUACION.
     
-    if os.path.exists("resultados_pacientes.csv"):
-        df = pd.read_csv("resultados_pacientes.csv")
-        
-        # Asegurar que todas las columnas existan
-        for col in cols:
-            if col not in df.columns:
-                df[col] = None
+    Los valores que no se pueden convertir quedan como nulos.
+    """
+    df = df.copy()
+    for col, tipo in ESQUEMA_EVALUACION.items():
+        if col not in df.columns or df[col].dtype == tipo:
+            continue
+        serie = df[col]
+        if tipo == 'category':
+            df[col] = serie.astype('category')
+        elif tipo.startswith('datetime'):
+            df[col] = _convertir_fechas(serie)
+        else:
+            if col in COLUMNAS_EVOLUCION and not pd.api.types.is_numeric_dtype(serie):
+                serie = serie.astype(str).str.strip(" ()")
+            df[col] = pd.to_numeric(serie, errors='coerce').astype(tipo)
+    return df
+
+def texto_evolucion(diferencia):
+    """Diferencia con la visita anterior en el formato del CSV: " (+0.12)" """
+    return f" ({diferencia:+.2f})" if pd.notna(diferencia) else ""
+
+def evaluaciones_a_texto(df):
+    """Copia de df con fechas y evoluciones en el formato de texto del CSV"""
+    df = df.copy()
+    if 'FechaHora' in df.columns and pd.api.types.is_datetime64_any_dtype(df['FechaHora']):
+        df['FechaHora'] = df['FechaHora'].dt.strftime(FORMATO_FECHA)
+    for col in COLUMNAS_EVOLUCION:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = [texto_evolucion(v) for v in df[col].tolist()]
+    return df
+
+def texto_fechas(serie):
+    """Fechas como texto FORMATO_FECHA, también si la columna ya es datetime"""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.dt.strftime(FORMATO_FECHA).fillna("")
+    return serie.astype(str)
+
+def _leer_csv_evaluaciones(fuente, **opciones):
+    """Lee un CSV de evaluaciones (ruta o buffer) y aplica el esquema"""
+    df = pd.read_csv(fuente, **opciones)
+    # Asegurar que todas las columnas existan
+    for col in COLUMNAS_EVALUACION:
+        if col not in df.columns:
+            df[col] = None
+    return tipar_evaluaciones(df)
+
+# Copia binaria del CSV en cache/ (requiere pyarrow, opcional). Como el CSV
+# sólo crece por el final entre compactaciones, al cargar se lee la copia y
+# se analizan únicamente las filas agregadas después.
+FORMATOS_COLUMNARES = ["feather", "parquet"]
+FORMATO_COLUMNAR = "feather"
+COLUMNAR_DISPONIBLE = importlib.util.find_spec("pyarrow") is not None
+# Bloque de lectura al calcular la huella de la parte del CSV ya copiada
+BLOQUE_HUELLA_CSV = 1024 * 1024
+
+def ruta_copia_columnar(ruta_csv, carpeta=CARPETA_CACHE, formato=None):
+    """Ruta de la copia columnar de un CSV (una por ruta absoluta, no por nombre)"""
+    nombre = os.path.splitext(os.path.basename(ruta_csv))[0]
+    ruta_real = os.path.normcase(os.path.realpath(ruta_csv))
+    huella = hashlib.sha1(ruta_real.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(carpeta, f"{nombre}_{huella}.{formato or FORMATO_COLUMNAR}")
+
+def leer_columnar(ruta):
+    if ruta.endswith(".parquet"):
+        return pd.read_parquet(ruta)
+    return pd.read_feather(ruta)
+
+def escribir_columnar(df, ruta, meta):
+    """Escribe la copia y, después, su descripción (bytes del CSV cubiertos, filas)"""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    df = df.reset_index(drop=True)
+    if ruta.endswith(".parquet"):
+        df.to_parquet(temporal, index=False)
     else:
-        df = pd.DataFrame(columns=cols)
+        df.to_feather(temporal)
+    os.replace(temporal, ruta)
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(dict(meta, filas=len(df)), f)
+    os.replace(temporal, f"{ruta}.json")
+
+def _guardar_copia_columnar(df, ruta, ruta_csv, cubiertos, huella, estado):
+    """Escribe la copia de los primeros ``cubiertos`` bytes del CSV.
+    
+    ``huella`` es el SHA-1 de esos bytes y ``estado`` el os.stat del CSV
+    cuando se leyeron; si el archivo tenía justo esos bytes, su tamaño y
+    st_mtime_ns permiten validar la copia sin releer el CSV.
+    """
+    try:
+        escribir_columnar(df, ruta, {
+            'csv': os.path.realpath(ruta_csv),
+            'bytes': cubiertos,
+            'huella': huella,
+            'tamano': estado.st_size,
+            'mtime_ns': estado.st_mtime_ns if estado.st_size == cubiertos else None,
+            'columnas': list(df.columns),
+        })
+    except Exception as e:
+        print(f"No se pudo escribir la copia columnar {ruta}: {e}", file=sys.stderr)
+
+def _huella_prefijo(f, cubiertos):
+    """SHA-1 de los primeros ``cubiertos`` bytes del archivo abierto (queda posicionado al final de ellos)"""
+    f.seek(0)
+    huella = hashlib.sha1()
+    restantes = cubiertos
+    while restantes > 0:
+        bloque = f.read(min(BLOQUE_HUELLA_CSV, restantes))
+        if not bloque:
+            break
+        huella.update(bloque)
+        restantes -= len(bloque)
+    return huella
+
+def cargar_csv_columnar(ruta_csv, carpeta=CARPETA_CACHE, formato=None):
+    """Evaluaciones del CSV usando la copia columnar mientras siga siendo válida.
+    
+    La copia vale tal cual si el CSV conserva el tamaño y st_mtime_ns con
+    que se creó. Si no, se compara el SHA-1 de todos los bytes que cubre:
+    si coinciden, sólo se leen las filas anexadas después; cualquier otro
+    cambio (edición de una fila, compactación) obliga a releer el CSV.
+    """
+    ruta = ruta_copia_columnar(ruta_csv, carpeta, formato)
+    try:
+        with open(f"{ruta}.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get('csv') != os.path.realpath(ruta_csv):
+            meta = None
+    except (OSError, ValueError):
+        meta = None
+    
+    with open(ruta_csv, "rb") as f:
+        estado = os.fstat(f.fileno())
+        if meta is not None and os.path.exists(ruta) and estado.st_size >= meta['bytes']:
+            intacto = (meta['mtime_ns'] is not None and estado.st_mtime_ns == meta['mtime_ns']
+                       and estado.st_size == meta['tamano'])
+            huella = None if intacto else _huella_prefijo(f, meta['bytes'])
+            if intacto or huella.hexdigest() == meta['huella']:
+                try:
+                    df = leer_columnar(ruta)
+                except Exception as e:
+                    print(f"Copia columnar ilegible ({ruta}): {e}", file=sys.stderr)
+                    df = None
+                if df is not None and len(df) == meta['filas']:
+                    if intacto:
+                        return df
+                    cola = f.read()
+                    if not cola.strip():
+                        return df
+                    nuevos = _leer_csv_evaluaciones(io.BytesIO(cola), header=None, names=meta['columnas'])
+                    df = tipar_evaluaciones(pd.concat([df, nuevos], ignore_index=True))
+                    # Renovar la copia cuando la cola ya es larga
+                    if len(nuevos) >= COMPACTAR_CADA:
+                        huella.update(cola)
+                        _guardar_copia_columnar(df, ruta, ruta_csv, meta['bytes'] + len(cola),
+                                                huella.hexdigest(), estado)
+                    return df
+        f.seek(0)
+        datos = f.read()
     
+    df = _leer_csv_evaluaciones(io.BytesIO(datos))
+    _guardar_copia_columnar(df, ruta, ruta_csv, len(datos), hashlib.sha1(datos).hexdigest(), estado)
     return df
 
+def get_dataframe(ruta=ARCHIVO_CSV):
+    """Obtiene el DataFrame de resultados con ESQUEMA_EVALUACION, vacío si no existe"""
+    if not os.path.exists(ruta):
+        return tipar_evaluaciones(pd.DataFrame(columns=COLUMNAS_EVALUACION))
+    if COLUMNAR_DISPONIBLE and FORMATO_COLUMNAR:
+        return cargar_csv_columnar(ruta)
+    return _leer_csv_evaluaciones(ruta)
+
+def medir_carga_evaluaciones(visitas=100000):
+    """Tiempo de carga (s), memoria (bytes) y tamaño en disco de cada formato.
+    
+    Compara el CSV con inferencia por defecto de pandas, el CSV con
+    ESQUEMA_EVALUACION y las copias columnares (si pyarrow está instalado).
+    """
+    df = generar_cohorte_sintetica(visitas)
+    rng = np.random.default_rng(1)
+    for col in ['MediaR', 'MediaG', 'MediaB', 'Sensibilidad', 'TiempoEvol', 'ControlGlu']:
+        df[col] = rng.uniform(0, 200, visitas)
+    df['Secrecion'] = rng.integers(0, 2, visitas)
+    df['Eritema'] = rng.integers(0, 2, visitas)
+    df['Imagen'] = [os.path.join(CARPETA_PACIENTES, p, f"{i}.jpg") for i, p in zip(df['ID'], df['Paciente'])]
+    df['Imagenes'] = df['Imagen']
+    df['EvolArea'] = [texto_evolucion(v) for v in rng.normal(0, 0.5, visitas)]
+    df['EvolDesv'] = [texto_evolucion(v) for v in rng.normal(0, 5, visitas)]
+    
+    resultados = {}
+    def medir(nombre, cargar, ruta):
+        inicio = time.perf_counter()
+        cargado = cargar()
+        resultados[nombre] = (time.perf_counter() - inicio,
+                              int(cargado.memory_usage(deep=True).sum()), os.path.getsize(ruta))
+    
+    carpeta = tempfile.mkdtemp(prefix="esquema_")
+    try:
+        ruta_csv = os.path.join(carpeta, "evaluaciones.csv")
+        escribir_csv_atomico(df, ruta_csv)
+        medir("csv (inferido)", lambda: pd.read_csv(ruta_csv), ruta_csv)
+        medir("csv (esquema)", lambda: _leer_csv_evaluaciones(ruta_csv), ruta_csv)
+        if COLUMNAR_DISPONIBLE:
+            for formato in FORMATOS_COLUMNARES:
+                cargar_csv_columnar(ruta_csv, carpeta, formato)
+                ruta = ruta_copia_columnar(ruta_csv, carpeta, formato)
+                medir(formato, lambda: cargar_csv_columnar(ruta_csv, carpeta, formato), ruta)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+def reservar_ruta(carpeta, nombre):
+    """Crea un archivo vacío con un nombre libre en la carpeta y devuelve su ruta.
+    
+    Si ``nombre`` ya existe se prueba con sufijo _2, _3... La creación
+    exclusiva (modo "x") garantiza que dos guardados en el mismo segundo
+    nunca se sobrescriban, aunque ocurran en hilos o procesos distintos.
+    """
+    base, extension = os.path.splitext(nombre)
+    n = 1
+    while True:
+        ruta = os.path.join(carpeta, nombre if n == 1 else f"{base}_{n}{extension}")
+        try:
+            with open(ruta, "x"):
+                return ruta
+        except FileExistsError:
+            n += 1
+
+def _escribir_reservado(ruta, escribir):
+    """Escribe sobre una ruta reservada; si falla borra el archivo vacío"""
+    try:
+        escribir(ruta)
+    except BaseException:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+        raise
+    return ruta
+
 def save_image_to_patient_folder(img_path, paciente):
     """Guarda la imagen en la carpeta del paciente y devuelve nueva ruta"""
     # Crear carpeta de paciente si no existe
-    paciente_dir = os.path.join("pacientes", re.sub(r'[\\/*?:"<>|]', "", paciente))
+    paciente_dir = os.path.join(CARPETA_PACIENTES, re.sub(r'[\\/*?:"<>|]', "", paciente))
     os.makedirs(paciente_dir, exist_ok=True)
     
-    # Generar nombre único basado en fecha
+    # Generar nombre único basado en fecha (con sufijo si ya existe)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     img_name = f"{timestamp}_{os.path.basename(img_path)}"
-    new_path = os.path.join(paciente_dir, img_name)
+    new_path = reservar_ruta(paciente_dir, img_name)
     
     # Copiar la imagen a la nueva ubicación
-    shutil.copy(img_path, new_path)
+    _escribir_reservado(new_path, lambda ruta: shutil.copy(img_path, ruta))
+    
+    # Miniaturas para la vista previa y el reporte PDF
+    try:
+        get_cache_miniaturas().generar(new_path, [TAMANO_PREVIEW, TAMANO_MINIATURA_PDF])
+    except Exception as e:
+        registrar_error(e)
     
     return new_path
 
+def escribir_csv_atomico(df, ruta=ARCHIVO_CSV):
+    """Escribe el CSV en un temporal y lo renombra; nunca deja un archivo truncado"""
+    carpeta = os.path.dirname(os.path.abspath(ruta))
+    fd, temporal = tempfile.mkstemp(prefix=".resultados_", suffix=".tmp", dir=carpeta)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            evaluaciones_a_texto(df).to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
 def save_to_csv(df):
     """Guarda el DataFrame en CSV con manejo de errores"""
     try:
-        df.to_csv("resultados_pacientes.csv", index=False)
+        escribir_csv_atomico(df, ARCHIVO_CSV)
         return True
     except Exception as e:
         registrar_error(e)
-        messagebox.showerror("Error de guardado", 
-                            f"No se pudo guardar los datos:\n{str(e)}")
+        mostrar_error("Error de guardado", f"No se pudo guardar los datos:\n{str(e)}")
         return False
 
-def graficar_evolucion(df_paciente, nombre_paciente):
-    """Crea gráfico de evolución en directorio temporal"""
-    plt.figure(figsize=(10, 6))
+# ========== ALMACÉN DE EVALUACIONES ==========
+ARCHIVO_DB = "resultados_pacientes.db"
+
+# "csv" conserva resultados_pacientes.csv; "sqlite" usa la base indexada
+BACKEND_DATOS = "csv"
+
+# Columnas de un formato anterior del CSV y su equivalente actual
+COLUMNAS_HEREDADAS = {
+    'Fecha': 'FechaHora',
+    'Area': 'AreaLesion',
+    'Nivel_Riesgo': 'Semaforo',
+    'Imagenes': 'Imagen',
+}
+SEMAFOROS_HEREDADOS = {
+    'BAJO': 'BAJO (verde)',
+    'MODERADO': 'MODERADO (amarillo)',
+    'ALTO': 'ALTO (rojo)',
+}
+
+TIPOS_SQL = {
+    'ID': 'INTEGER PRIMARY KEY',
+    'FechaHora': 'TEXT', 'Paciente': 'TEXT',
+    'Semaforo': 'TEXT', 'Imagen': 'TEXT', 'Comparacion': 'TEXT',
+    'EvolArea': 'TEXT', 'EvolDesv': 'TEXT', 'Imagenes': 'TEXT',
+}
+
+# Reescritura completa del CSV cada cierto número de inserciones
+COMPACTAR_CADA = 500
+
+@contextmanager
+def bloqueo_archivo(ruta):
+    """Bloqueo exclusivo entre procesos sobre ``ruta``.lock (espera a que se libere)"""
+    with open(f"{ruta}.lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK reintenta durante ~10 s antes de fallar
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class AlmacenCSV:
+    """Almacén sobre resultados_pacientes.csv (formato histórico).
+    
+    Las inserciones sólo agregan las filas nuevas al final del archivo
+    (con fsync), así que su costo no depende del tamaño del historial.
+    Periódicamente el archivo se compacta reescribiéndolo en un temporal
+    que luego se renombra de forma atómica. Toda escritura se hace bajo
+    bloqueo_archivo, compartido con otros procesos (interfaz y comando lote).
+    """
+    
+    def __init__(self, ruta=ARCHIVO_CSV, compactar_cada=COMPACTAR_CADA):
+        self.ruta = ruta
+        self.compactar_cada = compactar_cada
+        self._lock = threading.Lock()
+        self._agregados = 0
+        self._ultimo_id = None
+        self._firma = None
+        # (firma antes, firma después) del último agregar()
+        self.ultima_escritura = (None, None)
+    
+    def firma(self):
+        """(mtime, tamaño) del archivo; cambia cuando otro proceso lo modifica"""
+        try:
+            estado = os.stat(self.ruta)
+        except FileNotFoundError:
+            return None
+        return (estado.st_mtime_ns, estado.st_size)
+    
+    def cargar(self):
+        """Todas las evaluaciones como DataFrame"""
+        return get_dataframe(self.ruta)
+    
+    def _ultimo_id_archivo(self):
+        """Mayor ID del archivo; sólo se relee si otro proceso lo modificó"""
+        firma = self.firma()
+        if self._ultimo_id is None or self._firma != firma:
+            # La firma se toma antes de leer: si otro proceso escribe durante
+            # la lectura, la siguiente llamada vuelve a leer el archivo
+            encabezado = self._encabezado()
+            if encabezado and 'ID' in encabezado:
+                ids = pd.to_numeric(pd.read_csv(self.ruta, usecols=['ID'])['ID'], errors='coerce')
+            else:
+                ids = pd.Series(dtype=float)
+            self._ultimo_id = int(ids.max()) if ids.notna().any() else 0
+            self._firma = firma
+        return self._ultimo_id
+    
+    def siguiente_id(self):
+        """ID previsto para la próxima evaluación (el definitivo lo asigna agregar)"""
+        with self._lock:
+            return self._ultimo_id_archivo() + 1
+    
+    def _encabezado(self):
+        """Columnas del archivo existente (None si no existe o está vacío)"""
+        if not os.path.exists(self.ruta) or os.path.getsize(self.ruta) == 0:
+            return None
+        with open(self.ruta, "r", encoding="utf-8", newline="") as f:
+            return next(csv.reader(f), None)
+    
+    def agregar(self, registros):
+        """Agrega registros (lista de dict); devuelve True si se guardaron.
+        
+        El ID de cada registro se asigna aquí, bajo el bloqueo del archivo y
+        a partir del mayor ID que contiene, y se escribe de vuelta en el
+        dict; así dos procesos que guardan a la vez nunca repiten un ID.
+        """
+        try:
+            with self._lock, bloqueo_archivo(self.ruta):
+                antes = self.firma()
+                ultimo = self._ultimo_id_archivo()
+                for registro in registros:
+                    ultimo += 1
+                    registro['ID'] = ultimo
+                
+                encabezado = self._encabezado()
+                if encabezado is None or not set(COLUMNAS_EVALUACION) <= set(encabezado):
+                    # Archivo nuevo o con columnas faltantes: reescribir completo
+                    encabezado = self._compactar(pd.DataFrame(registros))
+                else:
+                    self._anexar(encabezado, registros)
+                
+                self._agregados += len(registros)
+                if self.compactar_cada and self._agregados >= self.compactar_cada:
+                    self._compactar()
+                self._ultimo_id = ultimo
+                self._firma = self.firma()
+                self.ultima_escritura = (antes, self._firma)
+            return True
+        except Exception as e:
+            registrar_error(e)
+            mostrar_error("Error de guardado", f"No se pudo guardar los datos:\n{str(e)}")
+            return False
+    
+    def _anexar(self, encabezado, registros):
+        """Escribe sólo las filas nuevas al final del archivo"""
+        with open(self.ruta, "rb+") as f:
+            # Si una escritura anterior quedó a medias, empezar en línea nueva
+            f.seek(-1, os.SEEK_END)
+            completo = f.read(1) == b"\n"
+        
+        with open(self.ruta, "a", encoding="utf-8", newline="") as f:
+            if not completo:
+                f.write("\n")
+            escritor = csv.writer(f, lineterminator="\n")
+            for registro in registros:
+                escritor.writerow([_texto_csv(registro.get(col)) for col in encabezado])
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def _compactar(self, nuevos=None):
+        """Reescribe el archivo completo de forma atómica; devuelve el encabezado.
+        
+        Las filas se copian como texto, sin pasar por ESQUEMA_EVALUACION
+        (float32 en memoria), para no perder precisión ni cambiar su formato.
+        """
+        if os.path.exists(self.ruta) and os.path.getsize(self.ruta) > 0:
+            df = pd.read_csv(self.ruta, dtype=str, keep_default_na=False)
+        else:
+            df = pd.DataFrame(columns=COLUMNAS_EVALUACION)
+        if nuevos is not None and not nuevos.empty:
+            nuevos = nuevos.astype(object).map(_texto_csv)
+            df = pd.concat([df, nuevos], ignore_index=True).fillna("")
+        
+        # Filas incompletas (sin paciente o sin fecha) de una escritura interrumpida
+        df = df[(df['Paciente'] != "") & (df['FechaHora'] != "")]
+        # Conservar el orden de columnas del archivo si ya tiene todas
+        if not set(COLUMNAS_EVALUACION) <= set(df.columns):
+            extras = [col for col in df.columns if col not in COLUMNAS_EVALUACION]
+            df = df.reindex(columns=COLUMNAS_EVALUACION + extras, fill_value="")
+        
+        escribir_csv_atomico(df, self.ruta)
+        self._agregados = 0
+        return list(df.columns)
+    
+    def compactar(self):
+        """Compacta el archivo bajo el lock del almacén y el bloqueo del archivo"""
+        with self._lock, bloqueo_archivo(self.ruta):
+            actualizado = self._firma == self.firma()
+            self._compactar()
+            # Si otro proceso había escrito, su mayor ID se relee en el próximo uso
+            self._firma = self.firma() if actualizado else None
+    
+    def historial(self, paciente):
+        """Evaluaciones del paciente en orden cronológico"""
+        df = self.cargar()
+        return df[df['Paciente'] == paciente].sort_values(['FechaHora', 'ID'], kind='stable')
+    
+    def ultimo(self, paciente):
+        """Última evaluación del paciente (DataFrame de 0 o 1 filas)"""
+        return self.historial(paciente).tail(1)
+
+class AlmacenSQLite:
+    """Almacén en una base SQLite local con índices por paciente y fecha.
+    
+    Cada inserción es una transacción (O(1), atómica ante caídas) y las
+    consultas por paciente usan el índice en lugar de leer todo el historial.
+    """
+    
+    def __init__(self, ruta=ARCHIVO_DB):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(ruta, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        # (firma antes, firma después) del último agregar()
+        self.ultima_escritura = (None, None)
+        self._crear_esquema()
+    
+    def _crear_esquema(self):
+        columnas = ", ".join(f"{col} {TIPOS_SQL.get(col, 'REAL')}" for col in COLUMNAS_EVALUACION)
+        with self._lock, self.conn:
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS evaluaciones ({columnas})")
+            # Bases creadas por versiones anteriores: agregar las columnas nuevas
+            existentes = {fila[1] for fila in self.conn.execute("PRAGMA table_info(evaluaciones)")}
+            for col in COLUMNAS_EVALUACION:
+                if col not in existentes:
+                    self.conn.execute(f"ALTER TABLE evaluaciones ADD COLUMN {col} {TIPOS_SQL.get(col, 'REAL')}")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluaciones_paciente "
+                              "ON evaluaciones (Paciente, FechaHora)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_evaluaciones_fecha "
+                              "ON evaluaciones (FechaHora)")
+    
+    def firma(self):
+        """Contador de SQLite que cambia cuando otra conexión modifica la base"""
+        with self._lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def consulta(self, sql, parametros=()):
+        """Resultado de una consulta SQL de sólo lectura como DataFrame"""
+        with self._lock:
+            return pd.read_sql_query(sql, self.conn, params=parametros)
+    
+    def cerrar(self):
+        with self._lock:
+            self.conn.close()
+    
+    def _consultar(self, sql, parametros=()):
+        df = self.consulta(sql, parametros)
+        return tipar_evaluaciones(df.reindex(columns=COLUMNAS_EVALUACION))
+    
+    def cargar(self):
+        """Todas las evaluaciones como DataFrame"""
+        return self._consultar("SELECT * FROM evaluaciones ORDER BY ID")
+    
+    def siguiente_id(self):
+        with self._lock:
+            maximo = self.conn.execute("SELECT MAX(ID) FROM evaluaciones").fetchone()[0]
+        return (maximo or 0) + 1
+    
+    def agregar(self, registros, reemplazar=False):
+        """Agrega registros (lista de dict); devuelve True si se guardaron.
+        
+        SQLite asigna el ID de cada registro en la misma inserción y se
+        escribe de vuelta en el dict, así dos procesos que guardan a la vez
+        nunca se pisan. Con ``reemplazar`` se conservan los ID dados y se
+        sobrescribe la fila existente (sólo para reimportar un CSV).
+        """
+        columnas = COLUMNAS_EVALUACION if reemplazar else [col for col in COLUMNAS_EVALUACION if col != 'ID']
+        sql = (f"INSERT {'OR REPLACE ' if reemplazar else ''}INTO evaluaciones ({', '.join(columnas)}) "
+               f"VALUES ({', '.join('?' for _ in columnas)})")
+        filas = [tuple(_valor_sql(r.get(col)) for col in columnas) for r in registros]
+        try:
+            with self._lock, self.conn:
+                # Reservar la escritura antes de leer la firma: ningún otro
+                # proceso puede confirmar cambios entre la lectura y el INSERT
+                self.conn.execute("BEGIN IMMEDIATE")
+                antes = self.conn.execute("PRAGMA data_version").fetchone()[0]
+                if reemplazar:
+                    self.conn.executemany(sql, filas)
+                    ids = None
+                else:
+                    ids = [self.conn.execute(sql, fila).lastrowid for fila in filas]
+            # Las escrituras propias no cambian data_version
+            self.ultima_escritura = (antes, antes)
+            if ids is not None:
+                for registro, id_asignado in zip(registros, ids):
+                    registro['ID'] = id_asignado
+            return True
+        except Exception as e:
+            registrar_error(e)
+            mostrar_error("Error de guardado", f"No se pudo guardar los datos:\n{str(e)}")
+            return False
+    
+    def historial(self, paciente):
+        """Evaluaciones del paciente en orden cronológico"""
+        return self._consultar("SELECT * FROM evaluaciones WHERE Paciente = ? "
+                               "ORDER BY FechaHora, ID", (paciente,))
+    
+    def ultimo(self, paciente):
+        """Última evaluación del paciente (DataFrame de 0 o 1 filas)"""
+        return self._consultar("SELECT * FROM evaluaciones WHERE Paciente = ? "
+                               "ORDER BY FechaHora DESC, ID DESC LIMIT 1", (paciente,))
+    
+    def importar_csv(self, ruta=ARCHIVO_CSV):
+        """Importa un resultados_pacientes.csv existente; devuelve filas importadas.
+        
+        Las filas del formato anterior (Fecha/Area/Nivel_Riesgo/Imagenes, sin ID)
+        se normalizan a las columnas actuales y reciben un ID nuevo.
+        """
+        df = pd.read_csv(ruta)
+        for anterior, actual in COLUMNAS_HEREDADAS.items():
+            if anterior not in df.columns:
+                continue
+            if actual not in df.columns:
+                df[actual] = None
+            valores = df[anterior]
+            if anterior == 'Nivel_Riesgo':
+                valores = valores.map(lambda v: SEMAFOROS_HEREDADOS.get(v, v))
+            elif anterior == 'Imagenes':
+                valores = valores.map(lambda v: v.split(";")[0] if isinstance(v, str) else v)
+            df[actual] = df[actual].where(df[actual].notna(), valores)
+        
+        df = df.reindex(columns=COLUMNAS_EVALUACION)
+        # Las columnas ausentes llegan como float64 vacías
+        df['Comparacion'] = df['Comparacion'].astype(object)
+        heredadas = df['Comparacion'].isna() & df['ID'].isna()
+        df.loc[heredadas, 'Comparacion'] = 'actual'
+        
+        # Reutilizar el ID si la fila heredada ya se importó antes
+        with self._lock:
+            for i in df.index[df['ID'].isna()]:
+                fila = self.conn.execute(
+                    "SELECT ID FROM evaluaciones WHERE Paciente = ? AND FechaHora = ?",
+                    (df.at[i, 'Paciente'], df.at[i, 'FechaHora'])).fetchone()
+                if fila is not None:
+                    df.at[i, 'ID'] = fila[0]
+        
+        sin_id = df['ID'].isna()
+        inicio = max(self.siguiente_id(), int(df['ID'].max()) + 1 if (~sin_id).any() else 1)
+        df.loc[sin_id, 'ID'] = range(inicio, inicio + int(sin_id.sum()))
+        df['ID'] = df['ID'].astype(int)
+        
+        registros = df.astype(object).where(df.notna(), None).to_dict('records')
+        if not self.agregar(registros, reemplazar=True):
+            return 0
+        return len(registros)
+
+def _valor_sql(valor):
+    """Convierte valores de NumPy/pandas a tipos nativos para sqlite3"""
+    if valor is None or valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.strftime(FORMATO_FECHA)
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and np.isnan(valor):
+        return None
+    return valor
+
+def _texto_csv(valor):
+    """Valor tal como se escribe en el CSV (vacío si es nulo)"""
+    valor = _valor_sql(valor)
+    return "" if valor is None else str(valor)
+
+# Singleton del almacén activo
+ALMACEN = None
+
+def get_almacen():
+    """Obtiene el almacén configurado en BACKEND_DATOS (patrón singleton).
+    
+    La primera vez que se usa SQLite sin base previa se importa el CSV existente.
+    """
+    global ALMACEN
+    if ALMACEN is None:
+        if BACKEND_DATOS == "sqlite":
+            nueva = not os.path.exists(ARCHIVO_DB)
+            ALMACEN = AlmacenSQLite(ARCHIVO_DB)
+            if nueva and os.path.exists(ARCHIVO_CSV):
+                ALMACEN.importar_csv(ARCHIVO_CSV)
+        else:
+            ALMACEN = AlmacenCSV(ARCHIVO_CSV)
+    return ALMACEN
+
+# ========== CACHÉ DE HISTORIAL ==========
+class CacheHistorial:
+    """Historial de evaluaciones en memoria, compartido por todo el proceso.
+    
+    Se carga una vez desde el almacén y mantiene un índice por paciente
+    (historial completo y último registro). Las evaluaciones guardadas desde
+    este proceso lo actualizan de forma incremental; si otro proceso cambia
+    el almacén (firma de mtime/tamaño o data_version), se recarga.
+    """
+    
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self._lock = threading.RLock()
+        self._firma = None
+        self._base = None
+        self._nuevos = []
+        self._historiales = {}
+        self._ultimo_id = 0
+    
+    def invalidar(self):
+        with self._lock:
+            self._firma = None
+            self._base = None
+    
+    def _verificar(self):
+        """Recarga el historial si el almacén cambió fuera de este proceso"""
+        firma = self.almacen.firma()
+        if self._base is not None and firma == self._firma:
+            return
+        
+        df = self.almacen.cargar()
+        self._base = df
+        self._nuevos = []
+        self._historiales = {
+            paciente: grupo.sort_values(['FechaHora', 'ID'], kind='stable')
+            for paciente, grupo in df.groupby('Paciente', sort=False, observed=True)
+        }
+        self._ultimo_id = int(df['ID'].max()) if df['ID'].notna().any() else 0
+        self._firma = firma
+    
+    def cargar(self):
+        """Todas las evaluaciones como DataFrame"""
+        with self._lock:
+            self._verificar()
+            if self._nuevos:
+                nuevos = pd.DataFrame(self._nuevos).reindex(columns=COLUMNAS_EVALUACION)
+                self._base = tipar_evaluaciones(pd.concat([self._base, nuevos], ignore_index=True))
+                self._nuevos = []
+            return self._base.copy()
+    
+    def siguiente_id(self):
+        with self._lock:
+            self._verificar()
+            return self._ultimo_id + 1
+    
+    def historial(self, paciente):
+        """Evaluaciones del paciente en orden cronológico"""
+        with self._lock:
+            self._verificar()
+            historial = self._historiales.get(paciente)
+            if historial is None:
+                return pd.DataFrame(columns=COLUMNAS_EVALUACION)
+            return historial.copy()
+    
+    def ultimo(self, paciente):
+        """Última evaluación del paciente (DataFrame de 0 o 1 filas)"""
+        with self._lock:
+            self._verificar()
+            historial = self._historiales.get(paciente)
+            if historial is None:
+                return pd.DataFrame(columns=COLUMNAS_EVALUACION)
+            return historial.tail(1).copy()
+    
+    def _incorporar(self, registros):
+        """Agrega al índice en memoria registros ya guardados en el almacén"""
+        nuevos = tipar_evaluaciones(pd.DataFrame(registros).reindex(columns=COLUMNAS_EVALUACION))
+        for paciente, grupo in nuevos.groupby('Paciente', sort=False, observed=True):
+            anterior = self._historiales.get(paciente)
+            historial = grupo if anterior is None else tipar_evaluaciones(
+                pd.concat([anterior, grupo], ignore_index=True))
+            self._historiales[paciente] = historial.sort_values(['FechaHora', 'ID'], kind='stable')
+        
+        self._nuevos.extend(registros)
+        ids = nuevos['ID'].dropna()
+        if not ids.empty:
+            self._ultimo_id = max(self._ultimo_id, int(ids.max()))
+    
+    def agregar(self, registros):
+        """Guarda en el almacén y actualiza sólo los pacientes afectados"""
+        with self._lock:
+            self._verificar()
+            if not self.almacen.agregar(registros):
+                return False
+            
+            antes, despues = self.almacen.ultima_escritura
+            if antes != self._firma:
+                # Otro proceso escribió entre la última carga y este guardado:
+                # se recarga todo en la próxima consulta en lugar de ocultarlo
+                self.invalidar()
+            else:
+                self._incorporar(registros)
+                self._firma = despues
+        
+        # El detector sólo se actualiza si ya está cargado; si no, se pondrá
+        # al día desde el almacén la primera vez que se use
+        if DETECTOR_TENDENCIAS is not None:
+            try:
+                DETECTOR_TENDENCIAS.actualizar(registros, self)
+            except Exception as e:
+                registrar_error(e)
+        return True
+
+# Singleton de la caché de historial
+HISTORIAL = None
+
+def get_historial():
+    """Obtiene la caché de historial sobre el almacén activo (patrón singleton)"""
+    global HISTORIAL
+    if HISTORIAL is None:
+        HISTORIAL = CacheHistorial(get_almacen())
+    return HISTORIAL
+
+# ========== DETECCIÓN DE TENDENCIAS ==========
+# Variables vigiladas y su variación típica entre visitas (en sus unidades)
+ESCALAS_TENDENCIA = {'AreaLesion': 0.5, 'DesvEstR': 5.0, 'Riesgo': 0.25}
+# Peso de la última visita en la media móvil exponencial (EWMA)
+LAMBDA_TENDENCIA = 0.3
+# CUSUM unilateral de aumentos: holgura k y umbral h, en escalas
+HOLGURA_CUSUM = 0.5
+UMBRAL_CUSUM = 4.0
+# Alertas conservadas en la lista de trabajo
+MAX_ALERTAS = 500
+# Segundos mínimos entre escrituras del estado en disco
+INTERVALO_GUARDADO_TENDENCIAS = 2.0
+# Incrementar si cambia el formato del estado serializado
+VERSION_TENDENCIAS = 2
+
+def _numero(valor):
+    """float del valor, o NaN si no es numérico"""
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+def _fecha_registro(registro):
+    """FechaHora de la evaluación como Timestamp (None si falta o no es válida)"""
+    fecha = pd.to_datetime(registro.get('FechaHora'), errors='coerce')
+    return None if pd.isna(fecha) else fecha
+
+def _ordenar_por_fecha(df):
+    """Evaluaciones con fecha válida, en orden cronológico (fecha y después ID)"""
+    df = df.assign(_Fecha=pd.to_datetime(df['FechaHora'], errors='coerce'))
+    df = df[df['_Fecha'].notna()].sort_values(['_Fecha', 'ID'], kind='stable')
+    return df.drop(columns='_Fecha')
+
+def _id_registro(registro):
+    """ID entero de la evaluación (0 si aún no tiene)"""
+    valor = _numero(registro.get('ID'))
+    return int(valor) if np.isfinite(valor) else 0
+
+class DetectorTendencias:
+    """Estadísticos acumulados por paciente para detectar empeoramiento.
+    
+    Cada evaluación guardada actualiza en O(1) la EWMA y un CUSUM de
+    aumentos de AreaLesion, DesvEstR y Riesgo, sin releer el historial.
+    Cuando un CUSUM supera UMBRAL_CUSUM, o la EWMA del riesgo entra en la
+    banda alta, se añade una alerta a la lista de trabajo. El estado se
+    guarda en cache/ y, al arrancar, sólo se reprocesan las evaluaciones
+    con ID posterior al último incorporado.
+    """
+    
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self.pacientes = {}
+        self.alertas = []
+        self.ultimo_id = 0
+        self._siguiente_alerta = 1
+        self._cambios = False
+        self._guardado = 0.0
+    
+    def cargar(self):
+        """Lee el estado guardado; False si no existe o es de otra versión"""
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                estado = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if estado.get('version') != VERSION_TENDENCIAS:
+            return False
+        with self._lock:
+            self.pacientes = estado['pacientes']
+            self.alertas = estado['alertas']
+            self.ultimo_id = estado['ultimo_id']
+            self._siguiente_alerta = estado['siguiente_alerta']
+        return True
+    
+    def guardar(self, forzar=False):
+        """Escribe el estado si cambió (como mucho cada INTERVALO_GUARDADO_TENDENCIAS)"""
+        with self._lock:
+            if not self._cambios:
+                return
+            if not forzar and time.monotonic() - self._guardado < INTERVALO_GUARDADO_TENDENCIAS:
+                return
+            contenido = json.dumps({
+                'version': VERSION_TENDENCIAS,
+                'ultimo_id': self.ultimo_id,
+                'siguiente_alerta': self._siguiente_alerta,
+                'pacientes': self.pacientes,
+                'alertas': self.alertas,
+            }, ensure_ascii=False)
+            self._cambios = False
+            self._guardado = time.monotonic()
+        
+        try:
+            os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+            temporal = f"{self.ruta}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(contenido)
+            os.replace(temporal, self.ruta)
+        except OSError as e:
+            print(f"No se pudo guardar el estado de tendencias: {e}", file=sys.stderr)
+    
+    def _alerta(self, registro, fecha, variable, tipo, valor, mensaje):
+        alerta = {
+            'Alerta': self._siguiente_alerta,
+            'ID': registro.get('ID'),
+            'Paciente': registro['Paciente'],
+            'FechaHora': fecha.strftime(FORMATO_FECHA),
+            'Variable': variable,
+            'Tipo': tipo,
+            'Valor': valor,
+            'Mensaje': mensaje,
+            'Atendida': False,
+        }
+        self._siguiente_alerta += 1
+        return alerta
+    
+    def _incorporar(self, estado, registro, fecha, alertar=True):
+        """Actualiza el estado del paciente con una evaluación fechada; devuelve sus alertas"""
+        alertas = []
+        for variable, escala in ESCALAS_TENDENCIA.items():
+            valor = _numero(registro.get(variable))
+            if not np.isfinite(valor):
+                continue
+            actual = estado['variables'].get(variable)
+            if actual is None:
+                estado['variables'][variable] = {'ewma': valor, 'cusum': 0.0}
+                continue
+            
+            anterior = actual['ewma']
+            actual['cusum'] = max(0.0, actual['cusum'] + (valor - anterior) / escala - HOLGURA_CUSUM)
+            actual['ewma'] = anterior + LAMBDA_TENDENCIA * (valor - anterior)
+            
+            if actual['cusum'] > UMBRAL_CUSUM:
+                if alertar:
+                    alertas.append(self._alerta(
+                        registro, fecha, variable, 'CUSUM', valor,
+                        f"{variable} en aumento sostenido (CUSUM {actual['cusum']:.1f} > {UMBRAL_CUSUM:g})"))
+                actual['cusum'] = 0.0
+            if variable == 'Riesgo' and anterior < UMBRAL_RIESGO_MODERADO <= actual['ewma'] and alertar:
+                alertas.append(self._alerta(
+                    registro, fecha, variable, 'BANDA', valor,
+                    f"Riesgo promedio en banda ALTA ({actual['ewma']:.2f})"))
+        
+        estado['visitas'] += 1
+        estado['fecha'] = fecha.isoformat()
+        estado['ultimo_id'] = max(estado['ultimo_id'], _id_registro(registro))
+        return alertas
+    
+    @staticmethod
+    def _estado_vacio():
+        return {'visitas': 0, 'fecha': "", 'ultimo_id': 0, 'variables': {}}
+    
+    def _reconstruir(self, paciente, historial, alertar_ids=()):
+        """Recalcula un paciente desde su historial (evaluación fuera de orden)"""
+        estado = self._estado_vacio()
+        alertas = []
+        for registro in _ordenar_por_fecha(historial).to_dict('records'):
+            alertas += self._incorporar(estado, registro, _fecha_registro(registro),
+                                        alertar=registro.get('ID') in alertar_ids)
+        self.pacientes[paciente] = estado
+        return alertas
+    
+    def actualizar(self, registros, historial):
+        """Incorpora evaluaciones recién guardadas; devuelve las alertas nuevas.
+        
+        ``historial`` (CacheHistorial) sólo se consulta si una evaluación es
+        anterior a la última del paciente, para recalcularlo en orden.
+        """
+        nuevas = []
+        with self._lock:
+            for registro in registros:
+                paciente = registro['Paciente']
+                estado = self.pacientes.setdefault(paciente, self._estado_vacio())
+                id_registro = _id_registro(registro)
+                if id_registro and id_registro <= estado['ultimo_id']:
+                    continue
+                self.ultimo_id = max(self.ultimo_id, id_registro)
+                
+                # Sin fecha válida no se puede ubicar en la trayectoria
+                fecha = _fecha_registro(registro)
+                if fecha is None:
+                    continue
+                if estado['fecha'] and fecha < pd.Timestamp(estado['fecha']):
+                    nuevas += self._reconstruir(paciente, historial.historial(paciente), {registro.get('ID')})
+                else:
+                    nuevas += self._incorporar(estado, registro, fecha)
+            
+            self.alertas.extend(nuevas)
+            del self.alertas[:-MAX_ALERTAS]
+            self._cambios = True
+        self.guardar()
+        return nuevas
+    
+    def sincronizar(self, historial, alertar=True):
+        """Incorpora las evaluaciones del almacén con ID posterior al estado"""
+        df = historial.cargar()
+        ids = pd.to_numeric(df['ID'], errors='coerce').astype(float)
+        with self._lock:
+            if not (ids > self.ultimo_id).any():
+                return []
+            nuevas = []
+            for registro in _ordenar_por_fecha(df[ids > self.ultimo_id]).to_dict('records'):
+                estado = self.pacientes.setdefault(registro['Paciente'], self._estado_vacio())
+                nuevas += self._incorporar(estado, registro, _fecha_registro(registro), alertar)
+            self.ultimo_id = int(ids.max())
+            self.alertas.extend(nuevas)
+            del self.alertas[:-MAX_ALERTAS]
+            self._cambios = True
+        self.guardar(forzar=True)
+        return nuevas
+    
+    def reconstruir(self, historial):
+        """Recalcula todos los pacientes desde el almacén, sin generar alertas"""
+        with self._lock:
+            self.pacientes = {}
+            self.ultimo_id = 0
+            self.sincronizar(historial, alertar=False)
+    
+    def pendientes(self, paciente=None):
+        """Alertas sin atender, de la más reciente a la más antigua"""
+        with self._lock:
+            return [dict(a) for a in reversed(self.alertas)
+                    if not a['Atendida'] and (paciente is None or a['Paciente'] == paciente)]
+    
+    def alertas_registro(self, id_registro):
+        """Alertas generadas por una evaluación"""
+        with self._lock:
+            return [dict(a) for a in self.alertas if a['ID'] == id_registro]
+    
+    def atender(self, numeros):
+        """Marca alertas como atendidas; devuelve cuántas cambiaron"""
+        numeros = set(numeros)
+        with self._lock:
+            cambiadas = 0
+            for alerta in self.alertas:
+                if alerta['Alerta'] in numeros and not alerta['Atendida']:
+                    alerta['Atendida'] = True
+                    cambiadas += 1
+            self._cambios = self._cambios or cambiadas > 0
+        self.guardar(forzar=True)
+        return cambiadas
+
+# Singleton del detector de tendencias
+DETECTOR_TENDENCIAS = None
+_DETECTOR_LOCK = threading.Lock()
+
+def get_detector_tendencias():
+    """Obtiene el detector de tendencias del almacén activo (patrón singleton).
+    
+    La primera vez carga el estado de cache/ y lo pone al día con el
+    almacén; si no hay estado, lo construye sin generar alertas históricas.
+    """
+    global DETECTOR_TENDENCIAS
+    with _DETECTOR_LOCK:
+        if DETECTOR_TENDENCIAS is None:
+            detector = DetectorTendencias(os.path.join(CARPETA_CACHE, f"tendencias_{BACKEND_DATOS}.json"))
+            if detector.cargar():
+                detector.sincronizar(get_historial())
+            else:
+                detector.reconstruir(get_historial())
+            DETECTOR_TENDENCIAS = detector
+        return DETECTOR_TENDENCIAS
+
+def imprimir_alertas(alertas, salida=sys.stdout):
+    """Lista de trabajo de alertas en texto"""
+    if not alertas:
+        print("No hay alertas pendientes", file=salida)
+        return
+    for alerta in alertas:
+        estado = "atendida" if alerta['Atendida'] else "pendiente"
+        print(f"#{alerta['Alerta']:<5} {alerta['FechaHora']:<19}  {alerta['Paciente']:<25} "
+              f"{alerta['Mensaje']} [{estado}]", file=salida)
+
+# Figuras de evolución reutilizables (una por hilo que grafica a la vez)
+TAMANO_POOL_FIGURAS = 2
+
+class FiguraEvolucion:
+    """Figura Agg de doble eje (área / DesvEstR) ya configurada.
+    
+    Sólo se actualizan los datos de las líneas y el título en cada uso;
+    no toca el estado global de pyplot.
+    """
+    
+    def __init__(self, figsize=(10, 6), dpi=150):
+        self.figura = mpl_figure.Figure(figsize=figsize, dpi=dpi)
+        self.canvas = mpl_agg.FigureCanvasAgg(self.figura)
+        self.figura.subplots_adjust(left=0.08, right=0.92, top=0.88, bottom=0.1)
+        
+        self.ax = self.figura.add_subplot(111)
+        self.ax.xaxis_date()
+        localizador = mdates.AutoDateLocator()
+        self.ax.xaxis.set_major_locator(localizador)
+        self.ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(localizador))
+        self.ax2 = self.ax.twinx()
+        
+        # Gráfico principal y segundo eje para Desviación Estándar
+        self.linea_area, = self.ax.plot([], [], 'o-', color='#3498db', linewidth=2,
+                                        markersize=8, label='Área lesión (cm²)')
+        self.linea_desv, = self.ax2.plot([], [], 's--', color='#e74c3c', linewidth=2,
+                                         markersize=8, label='Desv. estándar R')
+        
+        # Configuración de ejes, rejilla y leyenda combinada
+        self.ax.set_ylabel('Área lesión (cm²)', color='#3498db', fontsize=12)
+        self.ax2.set_ylabel('Desv. estándar R', color='#e74c3c', fontsize=12)
+        self.ax.grid(True, linestyle='--', alpha=0.7)
+        self.ax2.legend([self.linea_area, self.linea_desv],
+                        [self.linea_area.get_label(), self.linea_desv.get_label()], loc='best')
+        self.titulo = self.ax.set_title("", fontsize=14, pad=20)
+    
+    def actualizar(self, df_paciente, nombre_paciente):
+        """Carga los datos del paciente y reajusta la escala de ambos ejes"""
+        df_plot = df_paciente.copy()
+        df_plot['Fecha'] = pd.to_datetime(df_plot['FechaHora'])
+        df_plot = df_plot.sort_values('Fecha')
+        
+        fechas = mdates.date2num(df_plot['Fecha'].to_numpy())
+        self.linea_area.set_data(fechas, df_plot['AreaLesion'].to_numpy(float))
+        self.linea_desv.set_data(fechas, df_plot['DesvEstR'].to_numpy(float))
+        for eje in (self.ax, self.ax2):
+            eje.relim()
+            eje.autoscale_view()
+        self.titulo.set_text(f"Evolución de lesión: {nombre_paciente}")
+    
+    def renderizar(self):
+        """Dibuja la figura y la devuelve como imagen PIL RGB en memoria"""
+        self.canvas.draw()
+        return Image.fromarray(np.asarray(self.canvas.buffer_rgba())[:, :, :3].copy())
+
+class PoolFiguras:
+    """Conjunto pequeño de FiguraEvolucion compartidas entre hilos.
+    
+    Cada figura la usa un solo hilo a la vez; si todas están ocupadas y
+    ya se creó el máximo, se espera a que se libere una.
+    """
+    
+    def __init__(self, tamano=TAMANO_POOL_FIGURAS):
+        self.tamano = tamano
+        self._libres = queue.LifoQueue()
+        self._creadas = 0
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def figura(self):
+        try:
+            figura = self._libres.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                crear = self._creadas < self.tamano
+                if crear:
+                    self._creadas += 1
+            figura = FiguraEvolucion() if crear else self._libres.get()
+        try:
+            yield figura
+        finally:
+            self._libres.put(figura)
+
+# Singleton del pool de figuras
+POOL_FIGURAS = None
+
+def get_pool_figuras():
+    """Obtiene el pool de figuras de evolución (patrón singleton)"""
+    global POOL_FIGURAS
+    if POOL_FIGURAS is None:
+        POOL_FIGURAS = PoolFiguras()
+    return POOL_FIGURAS
+
+def graficar_evolucion(df_paciente, nombre_paciente):
+    """Crea gráfico de evolución como imagen en memoria (PIL RGB)"""
+    with get_pool_figuras().figura() as figura:
+        figura.actualizar(df_paciente, nombre_paciente)
+        return figura.renderizar()
+
+# Gráfica de evolución: "matplotlib" (imagen) o "vectorial" (primitivas FPDF)
+BACKENDS_GRAFICA = ["matplotlib", "vectorial"]
+BACKEND_GRAFICA = "matplotlib"
+# Márgenes de autoescala, igual que matplotlib (axes.xmargin / axes.ymargin)
+MARGEN_EJES = 0.05
+COLOR_AREA = (52, 152, 219)      # '#3498db'
+COLOR_DESV = (231, 76, 60)       # '#e74c3c'
+
+def preparar_grafica(df_paciente, nombre_paciente):
+    """Imagen de la gráfica si el backend es matplotlib; None si se dibuja en el PDF"""
+    if len(df_paciente) < 2 or BACKEND_GRAFICA == "vectorial":
+        return None
+    return graficar_evolucion(df_paciente, nombre_paciente)
+
+def _limites_eje(valores):
+    """Límites con margen del 5 %, como la autoescala de matplotlib"""
+    vmin, vmax = float(np.nanmin(valores)), float(np.nanmax(valores))
+    if vmax == vmin:
+        delta = abs(vmin) * 0.05 or 0.05
+        vmin, vmax = vmin - delta, vmax + delta
+    margen = (vmax - vmin) * MARGEN_EJES
+    return vmin - margen, vmax + margen
+
+def _marcas_eje(vmin, vmax, n=5):
+    """Marcas "redondas" (1, 2, 2.5, 5 x 10^k) dentro del intervalo"""
+    paso_bruto = (vmax - vmin) / n
+    magnitud = 10 ** np.floor(np.log10(paso_bruto))
+    paso = next(m * magnitud for m in (1, 2, 2.5, 5, 10) if m * magnitud >= paso_bruto)
+    inicio = np.ceil(vmin / paso) * paso
+    return [float(v) for v in np.arange(inicio, vmax + paso * 1e-9, paso)]
+
+def escala_evolucion(df_paciente):
+    """Fechas y coordenadas normalizadas (0-1 dentro de los ejes) de cada serie.
+    
+    Devuelve (fechas, x, area, desv, limites) donde limites contiene los
+    intervalos de datos de cada eje en días, cm² y unidades de DesvEstR.
+    """
+    df_plot = df_paciente.copy()
+    df_plot['Fecha'] = pd.to_datetime(df_plot['FechaHora'])
+    df_plot = df_plot.sort_values('Fecha')
+    
+    fechas = df_plot['Fecha']
+    # Días desde 1970-01-01, la misma unidad que matplotlib.dates
+    dias = ((fechas - pd.Timestamp("1970-01-01")) / pd.Timedelta(days=1)).to_numpy(float)
+    area = df_plot['AreaLesion'].to_numpy(float)
+    desv = df_plot['DesvEstR'].to_numpy(float)
+    
+    limites = {'x': _limites_eje(dias), 'area': _limites_eje(area), 'desv': _limites_eje(desv)}
+    normalizar = lambda v, lim: (v - lim[0]) / (lim[1] - lim[0])
+    return (fechas, normalizar(dias, limites['x']), normalizar(area, limites['area']),
+            normalizar(desv, limites['desv']), limites)
+
+def dibujar_evolucion_pdf(pdf, df_paciente, nombre_paciente, ancho=180, alto=105):
+    """Dibuja la gráfica de evolución con primitivas vectoriales de FPDF.
+    
+    Reproduce la gráfica de graficar_evolucion (área con eje izquierdo,
+    DesvEstR con eje derecho, rejilla y leyenda) sin matplotlib.
+    """
+    if pdf.get_y() + alto > pdf.h - pdf.b_margin:
+        pdf.add_page()
+    x0, y0 = pdf.l_margin, pdf.get_y()
+    
+    # Zona de trazado dentro del recuadro (espacio para título y etiquetas)
+    izq, der = x0 + 16, x0 + ancho - 16
+    arriba, abajo = y0 + 14, y0 + alto - 10
+    fechas, x, area, desv, limites = escala_evolucion(df_paciente)
+    px = lambda fx: izq + fx * (der - izq)
+    py = lambda fy: abajo - fy * (abajo - arriba)
+    
+    # Título y nombres de los ejes
+    pdf.set_font("Arial", "B", 12)
+    pdf.set_xy(x0, y0)
+    pdf.cell(ancho, 7, f"Evolución de lesión: {nombre_paciente}", 0, 0, 'C')
+    pdf.set_font("Arial", "", 8)
+    pdf.set_text_color(*COLOR_AREA)
+    pdf.text(x0, arriba - 2, "Área lesión (cm²)")
+    pdf.set_text_color(*COLOR_DESV)
+    pdf.text(der + 16 - pdf.get_string_width("Desv. estándar R"), arriba - 2, "Desv. estándar R")
+    
+    # Rejilla y marcas del eje izquierdo / derecho
+    pdf.set_line_width(0.1)
+    pdf.set_draw_color(200, 200, 200)
+    for valor in _marcas_eje(*limites['area']):
+        y = py((valor - limites['area'][0]) / (limites['area'][1] - limites['area'][0]))
+        pdf.dashed_line(izq, y, der, y, 1, 1)
+        pdf.set_text_color(*COLOR_AREA)
+        etiqueta = f"{valor:g}"
+        pdf.text(izq - 1.5 - pdf.get_string_width(etiqueta), y + 1, etiqueta)
+    pdf.set_text_color(*COLOR_DESV)
+    for valor in _marcas_eje(*limites['desv']):
+        y = py((valor - limites['desv'][0]) / (limites['desv'][1] - limites['desv'][0]))
+        pdf.text(der + 1.5, y + 1, f"{valor:g}")
+    
+    # Fechas: cinco marcas equiespaciadas en el tiempo
+    pdf.set_text_color(0, 0, 0)
+    inicio, fin = fechas.iloc[0], fechas.iloc[-1]
+    for k in range(5):
+        fecha = inicio + (fin - inicio) * k / 4
+        dia = (fecha - pd.Timestamp("1970-01-01")) / pd.Timedelta(days=1)
+        xm = px((dia - limites['x'][0]) / (limites['x'][1] - limites['x'][0]))
+        pdf.set_draw_color(200, 200, 200)
+        pdf.dashed_line(xm, arriba, xm, abajo, 1, 1)
+        etiqueta = fecha.strftime("%d/%m/%y")
+        pdf.text(xm - pdf.get_string_width(etiqueta) / 2, abajo + 4, etiqueta)
+    
+    # Marco de los ejes
+    pdf.set_draw_color(0, 0, 0)
+    pdf.rect(izq, arriba, der - izq, abajo - arriba)
+    
+    # Serie de área: línea continua con círculos
+    pdf.set_line_width(0.5)
+    pdf.set_draw_color(*COLOR_AREA)
+    pdf.set_fill_color(*COLOR_AREA)
+    puntos = [(px(a), py(b)) for a, b in zip(x, area)]
+    for (xa, ya), (xb, yb) in zip(puntos, puntos[1:]):
+        pdf.line(xa, ya, xb, yb)
+    for xp, yp in puntos:
+        pdf.ellipse(xp - 1, yp - 1, 2, 2, 'F')
+    
+    # Serie de DesvEstR: línea discontinua con cuadrados
+    pdf.set_draw_color(*COLOR_DESV)
+    pdf.set_fill_color(*COLOR_DESV)
+    puntos = [(px(a), py(b)) for a, b in zip(x, desv)]
+    for (xa, ya), (xb, yb) in zip(puntos, puntos[1:]):
+        pdf.dashed_line(xa, ya, xb, yb, 2, 1)
+    for xp, yp in puntos:
+        pdf.rect(xp - 0.9, yp - 0.9, 1.8, 1.8, 'F')
+    
+    # Leyenda
+    pdf.set_line_width(0.1)
+    pdf.set_draw_color(200, 200, 200)
+    pdf.set_fill_color(255, 255, 255)
+    pdf.rect(izq + 3, arriba + 3, 44, 12, 'DF')
+    pdf.set_line_width(0.5)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_draw_color(*COLOR_AREA)
+    pdf.line(izq + 5, arriba + 6.5, izq + 11, arriba + 6.5)
+    pdf.text(izq + 13, arriba + 7.5, "Área lesión (cm²)")
+    pdf.set_draw_color(*COLOR_DESV)
+    pdf.dashed_line(izq + 5, arriba + 11.5, izq + 11, arriba + 11.5, 2, 1)
+    pdf.text(izq + 13, arriba + 12.5, "Desv. estándar R")
+    
+    # Restaurar estado y dejar el cursor bajo la gráfica
+    pdf.set_line_width(0.2)
+    pdf.set_draw_color(0, 0, 0)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_xy(x0, y0 + alto)
+
+def verificar_grafica_vectorial(df_paciente):
+    """Compara la posición de cada punto en la gráfica vectorial y en matplotlib.
+    
+    Devuelve la diferencia máxima en fracción del área de los ejes (0 = idéntico).
+    """
+    _, x, area, desv, _ = escala_evolucion(df_paciente)
+    
+    with get_pool_figuras().figura() as figura:
+        figura.actualizar(df_paciente, "")
+        figura.canvas.draw()
+        
+        diferencia = 0.0
+        for eje, linea, serie in ((figura.ax, figura.linea_area, area),
+                                  (figura.ax2, figura.linea_desv, desv)):
+            datos = np.column_stack([linea.get_xdata(), linea.get_ydata()])
+            fracciones = eje.transAxes.inverted().transform(eje.transData.transform(datos))
+            diferencia = max(diferencia,
+                             float(np.max(np.abs(fracciones[:, 0] - x))),
+                             float(np.max(np.abs(fracciones[:, 1] - serie))))
+    return diferencia
+
+def get_downloads_folder():
+    """Obtiene el directorio de descargas de forma multiplataforma"""
+    if os.name == 'nt':
+        try:
+            sub_key = r'SOFTWARE\Microsoft\Windows\CurrentVersion\Explorer\Shell Folders'
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, sub_key) as key:
+                downloads_dir = winreg.QueryValueEx(key, '{374DE290-123F-4565-9164-39C4925E467B}')[0]
+            return downloads_dir
+        except Exception:
+            return os.path.join(os.path.expanduser("~"), "Downloads")
+    else:
+        return os.path.join(os.path.expanduser("~"), "Downloads")
+
+def es_fpdf2():
+    """fpdf2 acepta buffers e imágenes PIL; PyFPDF 1.7 sólo rutas de archivo"""
+    version = getattr(fpdf, "FPDF_VERSION", getattr(fpdf, "__version__", "1"))
+    return int(str(version).split(".")[0]) >= 2
+
+def _info_imagen_pdf(imagen):
+    """Describe una imagen en el formato interno de PyFPDF 1.7.
+    
+    Los bytes JPEG se incrustan tal cual (DCTDecode); las imágenes PIL
+    se comprimen sin pérdida como RGB (FlateDecode).
+    """
+    if isinstance(imagen, (bytes, bytearray)):
+        with Image.open(io.BytesIO(imagen)) as img:
+            ancho, alto = img.size
+            espacios = {'L': 'DeviceGray', 'CMYK': 'DeviceCMYK'}
+            espacio = espacios.get(img.mode, 'DeviceRGB')
+        return {'w': ancho, 'h': alto, 'cs': espacio, 'bpc': 8,
+                'f': 'DCTDecode', 'data': bytes(imagen)}
+    
+    imagen = imagen.convert('RGB')
+    ancho, alto = imagen.size
+    return {'w': ancho, 'h': alto, 'cs': 'DeviceRGB', 'bpc': 8,
+            'f': 'FlateDecode', 'data': zlib.compress(imagen.tobytes(), 6)}
+
+def insertar_imagen_pdf(pdf, clave, imagen, w):
+    """Inserta una imagen en memoria (bytes JPEG o PIL) sin archivos temporales.
+    
+    La clave identifica la imagen dentro del documento; reutilizarla
+    incrusta los datos una sola vez.
+    """
+    if es_fpdf2():
+        fuente = io.BytesIO(imagen) if isinstance(imagen, (bytes, bytearray)) else imagen
+        pdf.image(fuente, w=w)
+        return
+    
+    if clave not in pdf.images:
+        info = _info_imagen_pdf(imagen)
+        info['i'] = len(pdf.images) + 1
+        pdf.images[clave] = info
+    pdf.image(clave, w=w)
+
+def imagen_historial_pdf(img_path):
+    """JPEG de la miniatura en disco (sin recodificar) o miniatura PIL"""
+    en_disco = get_cache_miniaturas().obtener(img_path, TAMANO_MINIATURA_PDF)
+    if en_disco is not None:
+        with open(en_disco, "rb") as f:
+            return f.read()
+    return get_cargador_imagenes().miniatura(img_path, TAMANO_MINIATURA_PDF)
+
+# Pacientes cuyas secciones de reporte se conservan en memoria
+CACHE_REPORTES_PACIENTES = 16
+
+def claves_registros(df):
+    """Clave estable de cada evaluación: su ID o, si no tiene, fecha e imagen"""
+    return [int(i) if pd.notna(i) else f"{fecha}|{imagen}"
+            for i, fecha, imagen in zip(df['ID'], df['FechaHora'], df['Imagen'])]
+
+# Color del texto de riesgo por clase de semáforo (verde, amarillo, rojo)
+COLORES_RIESGO = [(50, 200, 50), (200, 200, 50), (200, 50, 50)]
+
+def clase_riesgo(riesgo):
+    """Clase de semáforo (0 bajo, 1 moderado, 2 alto) para un arreglo de riesgos"""
+    riesgo = np.asarray(riesgo, dtype=float)
+    return np.select([riesgo < UMBRAL_RIESGO_BAJO, riesgo < UMBRAL_RIESGO_MODERADO], [0, 1], 2)
+
+def _columna_numerica(df, columna):
+    """Columna como float (0 si no existe en el DataFrame)"""
+    if columna not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[columna], errors='coerce').to_numpy(float)
+
+def _decimales(valores):
+    return [f"{v:.2f}" for v in valores.tolist()]
+
+def preparar_datos_reporte(df):
+    """Textos y clases de riesgo del reporte para todas las filas a la vez.
+    
+    Devuelve un DataFrame con el mismo índice y las columnas Fecha (16
+    caracteres), FechaHora, Area, Desv, Riesgo (con dos decimales) y Clase.
+    """
+    fechas = texto_fechas(df['FechaHora'])
+    riesgo = _columna_numerica(df, 'Riesgo')
+    return pd.DataFrame({
+        'Fecha': fechas.str.slice(0, 16),
+        'FechaHora': fechas,
+        'Area': _decimales(_columna_numerica(df, 'AreaLesion')),
+        'Desv': _decimales(_columna_numerica(df, 'DesvEstR')),
+        'Riesgo': _decimales(riesgo),
+        'Clase': clase_riesgo(riesgo),
+    }, index=df.index)
+
+def formatear_filas_historial(df):
+    """Filas de la tabla "Resumen Histórico": (fecha, área, desv, riesgo, color)"""
+    datos = preparar_datos_reporte(df)
+    colores = [COLORES_RIESGO[clase] for clase in datos['Clase'].tolist()]
+    return list(zip(datos['Fecha'], datos['Area'], datos['Desv'], datos['Riesgo'], colores))
+
+def formatear_imagenes_historial(df):
+    """Datos de "Historial de Imágenes": (ruta, fecha, área, desv) por imagen"""
+    datos = preparar_datos_reporte(df)
+    return list(zip(df['Imagen'], datos['FechaHora'], datos['Area'], datos['Desv']))
+
+def generar_historial_sintetico(visitas, paciente="Sintetico", semilla=0):
+    """Historial ficticio de un paciente con el esquema de evaluaciones (para medir)"""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.Timestamp("2020-01-01") + pd.to_timedelta(np.sort(rng.uniform(0, 1500, visitas)), unit='D')
+    riesgo = rng.uniform(1.0, 3.0, visitas)
+    return pd.DataFrame({
+        'ID': np.arange(1, visitas + 1),
+        'Paciente': paciente,
+        'FechaHora': fechas.strftime("%Y-%m-%d %H:%M:%S"),
+        'Imagen': [f"pacientes/{paciente}/visita_{i}.jpg" for i in range(visitas)],
+        'Comparacion': 'actual',
+        'AreaLesion': rng.gamma(2.0, 1.5, visitas),
+        'DesvEstR': rng.uniform(5, 60, visitas),
+        'Riesgo': riesgo,
+        'Semaforo': [semaforo_riesgo(r) for r in riesgo],
+        'Sensibilidad': rng.integers(0, 7, visitas),
+        'TiempoEvol': rng.integers(0, 15, visitas),
+        'ControlGlu': rng.integers(0, 3, visitas),
+    }).reindex(columns=COLUMNAS_EVALUACION)
+
+def medir_preparacion_reporte(visitas=10000, repeticiones=3):
+    """Tiempo (s) de preparar las filas del reporte: iterrows frente a columnar"""
+    df = generar_historial_sintetico(visitas)
+    
+    def por_filas():
+        filas = []
+        for _, row in df.iterrows():
+            riesgo = row.get('Riesgo', 0)
+            if riesgo < UMBRAL_RIESGO_BAJO:
+                color = COLORES_RIESGO[0]
+            elif riesgo < UMBRAL_RIESGO_MODERADO:
+                color = COLORES_RIESGO[1]
+            else:
+                color = COLORES_RIESGO[2]
+            filas.append((str(row['FechaHora'])[:16], f"{row.get('AreaLesion', 0):.2f}",
+                          f"{row.get('DesvEstR', 0):.2f}", f"{riesgo:.2f}", color))
+        return filas
+    
+    tiempos = {}
+    for nombre, funcion in (("iterrows", por_filas), ("columnar", lambda: formatear_filas_historial(df))):
+        mejor = np.inf
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            resultado = funcion()
+            mejor = min(mejor, time.perf_counter() - inicio)
+        tiempos[nombre] = (mejor, resultado)
+    
+    if tiempos["iterrows"][1] != tiempos["columnar"][1]:
+        raise AssertionError("La preparación columnar no coincide con la de iterrows")
+    return {nombre: mejor for nombre, (mejor, _) in tiempos.items()}
+
+def huellas_registros(df, columnas, extra=None):
+    """Clave de cada registro junto con los valores de los que depende una sección.
+    
+    Un registro editado o reimportado con el mismo ID cambia de huella.
+    ``extra`` agrega una lista más de valores por fila (p. ej. mtime).
+    """
+    valores = [texto_fechas(df[col]) if col == 'FechaHora' else df[col].astype(str)
+               for col in columnas if col in df.columns]
+    listas = [v.tolist() for v in valores] + ([extra] if extra is not None else [])
+    return list(zip(claves_registros(df), *listas))
+
+def _mtime_imagen(ruta):
+    """mtime_ns de la imagen (None si no existe)"""
+    try:
+        return os.stat(ruta).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        return None
+
+class CacheReportes:
+    """Secciones ya preparadas del reporte de cada paciente.
+    
+    Las filas de la tabla, las miniaturas del historial de imágenes y la
+    gráfica se guardan por huella de registro (ID y valores usados; en las
+    imágenes, también su mtime); al regenerar un reporte sólo se preparan
+    las evaluaciones nuevas o modificadas. Las miniaturas que no se pudieron
+    cargar no se guardan, para reintentarlas. Se conservan los últimos
+    max_pacientes pacientes usados.
+    """
+    
+    def __init__(self, max_pacientes=CACHE_REPORTES_PACIENTES):
+        self.max_pacientes = max_pacientes
+        self._lock = threading.Lock()
+        self._pacientes = OrderedDict()
+    
+    def _entrada(self, paciente):
+        with self._lock:
+            entrada = self._pacientes.pop(paciente, None)
+            if entrada is None:
+                entrada = {'filas': {}, 'imagenes': {}, 'grafica': (None, None)}
+            self._pacientes[paciente] = entrada
+            while len(self._pacientes) > self.max_pacientes:
+                self._pacientes.popitem(last=False)
+            return entrada
+    
+    def limpiar(self):
+        with self._lock:
+            self._pacientes.clear()
+    
+    @staticmethod
+    def _completar(cache, claves, df, formatear, conservar=None):
+        """Formatea sólo los registros que faltan.
+        
+        Devuelve (valores en el orden de df, nueva caché) sin las claves que
+        ya no están ni los valores que ``conservar`` rechaza.
+        """
+        faltan = np.array([clave not in cache for clave in claves], dtype=bool)
+        nuevos = {}
+        if faltan.any():
+            nuevos = dict(zip([c for c, f in zip(claves, faltan) if f], formatear(df[faltan])))
+        valores = [cache[clave] if clave in cache else nuevos[clave] for clave in claves]
+        vigentes = {clave: valor for clave, valor in zip(claves, valores)
+                    if conservar is None or conservar(valor)}
+        return valores, vigentes
+    
+    def filas(self, paciente, df_paciente):
+        """Filas formateadas de la tabla de historial, en el orden de df_paciente"""
+        entrada = self._entrada(paciente)
+        claves = huellas_registros(df_paciente, ['FechaHora', 'AreaLesion', 'DesvEstR', 'Riesgo'])
+        filas, entrada['filas'] = self._completar(entrada['filas'], claves, df_paciente,
+                                                  formatear_filas_historial)
+        return filas
+    
+    def imagenes(self, paciente, df_paciente):
+        """(ruta, fecha, área, desv, miniatura) de cada imagen; miniatura None si falta"""
+        def preparar(df):
+            datos = []
+            for img_path, fecha, area, desv in formatear_imagenes_historial(df):
+                imagen = None
+                try:
+                    if os.path.isfile(img_path):
+                        imagen = imagen_historial_pdf(img_path)
+                except Exception as e:
+                    registrar_error(e)
+                datos.append((img_path, fecha, area, desv, imagen))
+            return datos
+        
+        entrada = self._entrada(paciente)
+        df_imagenes = df_paciente[df_paciente['Comparacion'] == 'actual']
+        claves = huellas_registros(df_imagenes, ['FechaHora', 'AreaLesion', 'DesvEstR', 'Imagen'],
+                                   extra=[_mtime_imagen(ruta) for ruta in df_imagenes['Imagen'].tolist()])
+        imagenes, entrada['imagenes'] = self._completar(entrada['imagenes'], claves, df_imagenes, preparar,
+                                                        conservar=lambda datos: datos[4] is not None)
+        return imagenes
+    
+    def grafica(self, paciente, df_paciente):
+        """Gráfica de evolución; se reutiliza mientras no cambien los registros"""
+        entrada = self._entrada(paciente)
+        clave = (tuple(huellas_registros(df_paciente, ['FechaHora', 'AreaLesion', 'DesvEstR'])),
+                 BACKEND_GRAFICA)
+        if entrada['grafica'][0] == clave:
+            return entrada['grafica'][1]
+        img = preparar_grafica(df_paciente, paciente)
+        entrada['grafica'] = (clave, img)
+        return img
+
+# Singleton de la caché de reportes
+CACHE_REPORTES = None
+
+def get_cache_reportes():
+    """Obtiene la caché de secciones de reporte (patrón singleton)"""
+    global CACHE_REPORTES
+    if CACHE_REPORTES is None:
+        CACHE_REPORTES = CacheReportes()
+    return CACHE_REPORTES
+
+class ReporteCancelado(Exception):
+    """El usuario canceló la generación del reporte"""
+
+def nuevo_pdf():
+    """Documento FPDF con la configuración común de los reportes"""
+    pdf = fpdf.FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    return pdf
+
+def escribir_reporte_paciente(pdf, nombre_paciente, df_paciente, img_graph, avanzar=None):
+    """Agrega al documento las páginas del reporte de un paciente"""
+    avanzar = avanzar or (lambda fraccion, etapa: None)
+    
+    # === Página 1: Resumen y datos ===
+    pdf.add_page()
+    
+    # Encabezado
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, f"Reporte de Evolución - {nombre_paciente}", 0, 1, 'C')
+    pdf.ln(5)
+    
+    # Resumen de riesgo actual
+    last_record = df_paciente.iloc[-1]
+    riesgo_val = last_record.get('Riesgo', 0)
+    semaforo = last_record.get('Semaforo', '')
+    
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 8, "Resumen de Riesgo Actual:", 0, 1)
+    pdf.set_font("Arial", "", 12)
+    
+    color = COLORES_RIESGO[int(clase_riesgo(riesgo_val))]
+    pdf.set_text_color(*color)
+    pdf.cell(0, 8, f"Riesgo: {riesgo_val:.2f} - {semaforo}", 0, 1)
+    pdf.set_text_color(0, 0, 0)
+    pdf.ln(5)
+    
+    # Datos de la última consulta
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 8, "Última Evaluación:", 0, 1)
+    
+    # Tabla de datos
+    col_widths = [60, 40]
+    data = [
+        ("Fecha", str(last_record['FechaHora'])),
+        ("Área de lesión", f"{last_record.get('AreaLesion', 0):.2f} cm²"),
+        ("Desviación estándar R", f"{last_record.get('DesvEstR', 0):.2f}"),
+        ("Sensibilidad", f"{last_record.get('Sensibilidad', 0)}"),
+        ("Tiempo de evolución", f"{last_record.get('TiempoEvol', 0)} días"),
+        ("Control glucémico", f"{last_record.get('ControlGlu', 0)}")
+    ]
+    
+    for label, value in data:
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(col_widths[0], 8, label, 0, 0)
+        pdf.set_font("Arial", "", 12)
+        pdf.cell(0, 8, value, 0, 1)
+        pdf.ln(3)
+    
+    pdf.ln(5)
+    
+    # Historial resumido
+    avanzar(0.1, "Tabla de historial")
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 8, "Resumen Histórico:", 0, 1)
+    
+    # Encabezados de tabla
+    col_widths = [40, 25, 25, 20]
+    headers = ["Fecha", "Área (cm²)", "Desv. R", "Riesgo"]
+    for i, header in enumerate(headers):
+        pdf.cell(col_widths[i], 8, header, 1, 0, 'C')
+    pdf.ln()
+    
+    # Datos de tabla
+    pdf.set_font("Arial", "", 9)
+    for fecha, area, desv, riesgo, color in get_cache_reportes().filas(nombre_paciente, df_paciente):
+        pdf.cell(col_widths[0], 8, fecha, 1)
+        pdf.cell(col_widths[1], 8, area, 1, 0, 'C')
+        pdf.cell(col_widths[2], 8, desv, 1, 0, 'C')
+        
+        # Color según riesgo
+        pdf.set_text_color(*color)
+        pdf.cell(col_widths[3], 8, riesgo, 1, 0, 'C')
+        pdf.set_text_color(0, 0, 0)
+        pdf.ln()
+    
+    pdf.ln(10)
+    
+    # Gráfica de evolución
+    avanzar(0.3, "Gráfica de evolución")
+    if img_graph is not None:
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 8, "Evolución de la Lesión:", 0, 1)
+        insertar_imagen_pdf(pdf, f"evolucion:{nombre_paciente}", img_graph, w=180)
+        pdf.ln(5)
+    elif BACKEND_GRAFICA == "vectorial" and len(df_paciente) > 1:
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 8, "Evolución de la Lesión:", 0, 1)
+        dibujar_evolucion_pdf(pdf, df_paciente, nombre_paciente)
+        pdf.ln(5)
+    
+    # === Página 2: Imágenes históricas ===
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, "Historial de Imágenes", 0, 1, 'C')
+    pdf.ln(5)
+    
+    # Obtener todas las imágenes del paciente
+    imagenes = get_cache_reportes().imagenes(nombre_paciente, df_paciente)
+    
+    total_imagenes = max(1, len(imagenes))
+    for n, (img_path, fecha, area, desv, imagen) in enumerate(imagenes):
+        avanzar(0.35 + 0.6 * n / total_imagenes, f"Imagen {n + 1} de {total_imagenes}")
+        if imagen is None:
+            continue
+            
+        try:
+            # Encabezado de imagen
+            pdf.set_font("Arial", "B", 12)
+            pdf.cell(0, 8, f"Fecha: {fecha}", 0, 1)
+            pdf.set_font("Arial", "", 10)
+            
+            # Información de la imagen
+            pdf.cell(0, 6, f"Área: {area} cm²", 0, 1)
+            pdf.cell(0, 6, f"Desv. R: {desv}", 0, 1)
+            
+            # Agregar la imagen directamente desde memoria
+            insertar_imagen_pdf(pdf, os.path.abspath(img_path), imagen, w=90)
+            pdf.ln(10)
+            
+            # Línea separadora
+            pdf.set_draw_color(200, 200, 200)
+            pdf.line(10, pdf.get_y(), 200, pdf.get_y())
+            pdf.ln(5)
+            
+        except Exception as e:
+            registrar_error(e)
+
+def exportar_pdf(nombre_paciente, df_paciente, img_graph, progreso=None, cancelar=None, carpeta=None):
+    """Genera PDF profesional con historial completo de imágenes
+    
+    progreso(fraccion, etapa) se llama al avanzar cada sección y cancelar
+    (threading.Event) se consulta entre secciones; si está activo se lanza
+    ReporteCancelado sin escribir el archivo. Por defecto se guarda en
+    la carpeta de Descargas.
+    """
+    def avanzar(fraccion, etapa):
+        if cancelar is not None and cancelar.is_set():
+            raise ReporteCancelado(nombre_paciente)
+        if progreso is not None:
+            progreso(fraccion, etapa)
+    
+    try:
+        avanzar(0.0, "Resumen")
+        # Preparar nombre de archivo seguro
+        safe_name = re.sub(r'[\\/*?:"<>|]', "", nombre_paciente)[:50]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pdfname = f"{safe_name}_{timestamp}_reporte.pdf"
+        downloads = carpeta or get_downloads_folder()
+        
+        # Crear PDF
+        pdf = nuevo_pdf()
+        escribir_reporte_paciente(pdf, nombre_paciente, df_paciente, img_graph, avanzar)
+        
+        avanzar(0.95, "Guardando PDF")
+        pdf_path = _escribir_reservado(reservar_ruta(downloads, pdfname), pdf.output)
+        avanzar(1.0, "Listo")
+        return pdf_path
+        
+    except ReporteCancelado:
+        raise
+    except Exception as e:
+        registrar_error(e)
+        return None
+
+# ========== ANÁLISIS POR LOTES (SIN INTERFAZ) ==========
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# Datos clínicos que acompañan a cada imagen del lote
+CAMPOS_CLINICOS = ['Sensibilidad', 'Secrecion', 'Eritema', 'TiempoEvol', 'ControlGlu']
+
+def _leer_tabla(ruta):
+    """Lee un CSV o JSON (lista de objetos) como lista de dict"""
+    if ruta.lower().endswith(".json"):
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    df = pd.read_csv(ruta)
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+def _parsear_roi(valor):
+    """Convierte "x,y,w,h" (o lista) en tupla de enteros; None si está vacío"""
+    if valor is None or valor == "":
+        return None
+    if isinstance(valor, str):
+        valor = valor.replace(";", ",").split(",")
+    return tuple(int(float(v)) for v in valor)
+
+def cargar_lote(entrada, clinicos=None):
+    """Construye la lista de trabajos a partir de una carpeta o un manifiesto.
+    
+    - Carpeta: se recorre recursivamente (sin carpetas ocultas como la caché
+      de miniaturas) y el paciente es el nombre de la carpeta que contiene
+      cada imagen (estructura pacientes/<nombre>/).
+    - Manifiesto CSV/JSON: columnas Imagen, Paciente y opcionalmente los
+      CAMPOS_CLINICOS, ROI ("x,y,w,h") y FechaHora.
+    
+    Los datos clínicos faltantes se toman de ``clinicos`` (CSV/JSON con una
+    fila por Paciente).
+    """
+    if os.path.isdir(entrada):
+        trabajos = []
+        for carpeta, subcarpetas, archivos in os.walk(entrada):
+            # Omitir la caché de miniaturas (CARPETA_MINIATURAS) y otras carpetas ocultas
+            subcarpetas[:] = [d for d in subcarpetas if d != CARPETA_MINIATURAS and not d.startswith(".")]
+            for archivo in sorted(archivos):
+                if archivo.lower().endswith(EXTENSIONES_IMAGEN):
+                    trabajos.append({'Imagen': os.path.join(carpeta, archivo),
+                                     'Paciente': os.path.basename(carpeta)})
+    else:
+        base = os.path.dirname(os.path.abspath(entrada))
+        trabajos = []
+        for fila in _leer_tabla(entrada):
+            trabajo = dict(fila)
+            if not os.path.isabs(trabajo['Imagen']):
+                trabajo['Imagen'] = os.path.join(base, trabajo['Imagen'])
+            if not trabajo.get('Paciente'):
+                trabajo['Paciente'] = os.path.basename(os.path.dirname(trabajo['Imagen']))
+            trabajos.append(trabajo)
+    
+    por_paciente = {}
+    if clinicos:
+        por_paciente = {str(fila['Paciente']): fila for fila in _leer_tabla(clinicos)}
+    for trabajo in trabajos:
+        datos = por_paciente.get(str(trabajo['Paciente']), {})
+        for campo in CAMPOS_CLINICOS:
+            if trabajo.get(campo) is None:
+                trabajo[campo] = datos.get(campo)
+    return trabajos
+
+def _iniciar_proceso_sin_interfaz(backend_grafica="matplotlib"):
+    """Inicializador de procesos de trabajo: errores sólo a error.log"""
+    global INTERFAZ_GRAFICA, BACKEND_GRAFICA
+    INTERFAZ_GRAFICA = False
+    BACKEND_GRAFICA = backend_grafica
+
+def analizar_trabajo_lote(trabajo, modo_roi="auto"):
+    """Extrae características y evalúa el riesgo de una imagen (proceso de trabajo).
+    
+    Devuelve el trabajo ampliado con las medidas, o con 'Error' si falló.
+    """
+    resultado = dict(trabajo)
+    try:
+        faltantes = [campo for campo in CAMPOS_CLINICOS if trabajo.get(campo) is None]
+        if faltantes:
+            raise ValueError(f"Faltan datos clínicos: {', '.join(faltantes)}")
+        
+        rect = _parsear_roi(trabajo.get('ROI'))
+        if rect is None and modo_roi != "auto":
+            raise ValueError(f"El modo '{modo_roi}' requiere una ROI almacenada")
+        if rect is not None and modo_roi == "auto":
+            modo_roi = "asistido"
+        
+        _, _, mean_rgb, std_rgb, area_lesion = analizar_imagen(trabajo['Imagen'], modo_roi, rect)
+        riesgo = evaluar_riesgo_lote(
+            float(trabajo['Sensibilidad']), area_lesion, std_rgb[0],
+            float(trabajo['Secrecion']), float(trabajo['Eritema']),
+            float(trabajo['TiempoEvol']), float(trabajo['ControlGlu'])
+        )[0]
+        
+        resultado.update({
+            'AreaLesion': float(area_lesion),
+            'DesvEstR': float(std_rgb[0]),
+            'MediaR': float(mean_rgb[0]),
+            'MediaG': float(mean_rgb[1]),
+            'MediaB': float(mean_rgb[2]),
+            'Riesgo': float(riesgo),
+        })
+        if not resultado.get('FechaHora'):
+            fecha = datetime.fromtimestamp(os.path.getmtime(trabajo['Imagen']))
+            resultado['FechaHora'] = fecha.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception as e:
+        resultado['Error'] = f"{type(e).__name__}: {e}"
+    return resultado
+
+def _registro_lote(resultado, historial):
+    """Convierte un resultado del lote en registro del almacén, con su evolución"""
+    previos = historial.historial(resultado['Paciente'])
+    previos = previos[pd.to_datetime(previos['FechaHora']) < pd.Timestamp(resultado['FechaHora'])]
+    
+    evol_area = ""
+    evol_desv = ""
+    if not previos.empty:
+        area_ant = previos['AreaLesion'].iloc[-1]
+        desv_ant = previos['DesvEstR'].iloc[-1]
+        evol_area = f" ({resultado['AreaLesion'] - area_ant:+.2f})" if area_ant > 0 else ""
+        evol_desv = f" ({resultado['DesvEstR'] - desv_ant:+.2f})" if desv_ant > 0 else ""
+    
+    registro = {col: resultado.get(col) for col in COLUMNAS_EVALUACION}
+    registro.update({
+        'ID': historial.siguiente_id(),
+        'Semaforo': semaforo_riesgo(resultado['Riesgo']),
+        'Comparacion': 'actual',
+        'EvolArea': evol_area,
+        'EvolDesv': evol_desv,
+        'Imagenes': resultado['Imagen'],
+    })
+    return registro
+
+def procesar_lote(trabajos, modo_roi="auto", procesos=None, salida=sys.stdout):
+    """Analiza los trabajos en un pool de procesos y guarda cada resultado.
+    
+    Devuelve (guardados, errores). Los errores por archivo se informan en
+    ``salida`` y en error.log sin detener el lote.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    historial = get_historial()
+    detector = get_detector_tendencias()
+    total = len(trabajos)
+    guardados = 0
+    errores = 0
+    inicio = time.perf_counter()
+    
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso_sin_interfaz,
+                             initargs=(BACKEND_GRAFICA,)) as pool:
+        futuros = [pool.submit(analizar_trabajo_lote, trabajo, modo_roi) for trabajo in trabajos]
+        for n, futuro in enumerate(as_completed(futuros), start=1):
+            resultado = futuro.result()
+            nombre = os.path.basename(resultado['Imagen'])
+            
+            if 'Error' not in resultado:
+                registro = _registro_lote(resultado, historial)
+                if historial.agregar([registro]):
+                    guardados += 1
+                    print(f"[{n}/{total}] {nombre}: {registro['Paciente']} "
+                          f"riesgo={registro['Riesgo']:.2f} {registro['Semaforo']}", file=salida)
+                    for alerta in detector.alertas_registro(registro['ID']):
+                        print(f"    ALERTA #{alerta['Alerta']}: {alerta['Mensaje']}", file=salida)
+                    continue
+                resultado['Error'] = "No se pudo guardar el registro"
+            
+            errores += 1
+            print(f"[{n}/{total}] {nombre}: ERROR {resultado['Error']}", file=salida)
+            try:
+                with open("error.log", "a", encoding="utf-8") as logf:
+                    logf.write(f"\n--- ERROR LOTE ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}) ---\n"
+                               f"Imagen: {resultado['Imagen']}\n{resultado['Error']}\n")
+            except Exception as log_error:
+                print(f"Error al escribir en log: {log_error}", file=sys.stderr)
+    
+    detector.guardar(forzar=True)
+    duracion = time.perf_counter() - inicio
+    print(f"Lote terminado: {guardados} guardados, {errores} con error, "
+          f"{duracion:.1f} s ({total / max(duracion, 1e-9):.2f} imágenes/s, {procesos} procesos)", file=salida)
+    return guardados, errores
+
+# ========== REPORTES MASIVOS ==========
+def seleccionar_historiales(df, pacientes=None, desde=None, hasta=None):
+    """Historiales completos de los pacientes pedidos o atendidos en el rango.
+    
+    desde/hasta son fechas inclusivas (YYYY-MM-DD). Devuelve un dict
+    paciente -> DataFrame en orden cronológico, a partir de una sola carga.
+    """
+    fechas = pd.to_datetime(df['FechaHora'], errors='coerce')
+    seleccion = pd.Series(True, index=df.index)
+    if desde:
+        seleccion &= fechas >= pd.Timestamp(desde)
+    if hasta:
+        seleccion &= fechas < pd.Timestamp(hasta) + pd.Timedelta(days=1)
+    if pacientes:
+        seleccion &= df['Paciente'].isin(pacientes)
+    
+    atendidos = df.loc[seleccion, 'Paciente'].unique()
+    df = df[df['Paciente'].isin(atendidos)]
+    return {
+        paciente: grupo.sort_values(['FechaHora', 'ID'], kind='stable')
+        for paciente, grupo in df.groupby('Paciente', sort=True, observed=True)
+    }
+
+def _grafica_reporte(nombre, df_paciente):
+    """Proceso de trabajo: gráfica de evolución del paciente (None si no aplica)"""
+    return preparar_grafica(df_paciente, nombre)
+
+def _reporte_individual(nombre, df_paciente, carpeta):
+    """Proceso de trabajo: PDF de un paciente. Devuelve (ruta, error)"""
+    try:
+        pdf_path = exportar_pdf(nombre, df_paciente, _grafica_reporte(nombre, df_paciente),
+                                carpeta=carpeta)
+        return pdf_path, None if pdf_path else "No se pudo generar el PDF (ver error.log)"
+    except Exception:
+        return None, traceback.format_exc()
+
+def _escribir_resumen_reportes(pdf, historiales, desde, hasta):
+    """Primera página del reporte combinado: una fila por paciente"""
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, "Reporte de Pacientes", 0, 1, 'C')
+    pdf.set_font("Arial", "", 11)
+    periodo = f"{desde or 'inicio'} a {hasta or 'hoy'}"
+    pdf.cell(0, 8, f"Periodo: {periodo} - {len(historiales)} pacientes", 0, 1, 'C')
+    pdf.ln(5)
+    
+    col_widths = [55, 18, 35, 25, 22, 35]
+    headers = ["Paciente", "Visitas", "Última visita", "Área (cm²)", "Riesgo", "Semáforo"]
+    pdf.set_font("Arial", "B", 10)
+    for i, header in enumerate(headers):
+        pdf.cell(col_widths[i], 8, header, 1, 0, 'C')
+    pdf.ln()
+    
+    pdf.set_font("Arial", "", 9)
+    for paciente, df_paciente in historiales.items():
+        ultimo = df_paciente.iloc[-1]
+        riesgo = ultimo.get('Riesgo', 0)
+        pdf.cell(col_widths[0], 8, str(paciente)[:30], 1)
+        pdf.cell(col_widths[1], 8, str(len(df_paciente)), 1, 0, 'C')
+        pdf.cell(col_widths[2], 8, str(ultimo['FechaHora'])[:16], 1, 0, 'C')
+        pdf.cell(col_widths[3], 8, f"{ultimo.get('AreaLesion', 0):.2f}", 1, 0, 'C')
+        pdf.cell(col_widths[4], 8, f"{riesgo:.2f}", 1, 0, 'C')
+        pdf.cell(col_widths[5], 8, str(ultimo.get('Semaforo', ''))[:20], 1, 0, 'C')
+        pdf.ln()
+
+def exportar_reportes(pacientes=None, desde=None, hasta=None, combinado=False,
+                      procesos=None, carpeta=None, salida=sys.stdout):
+    """Genera los reportes de varios pacientes en un pool de procesos.
+    
+    Con combinado=False escribe un PDF por paciente; con combinado=True los
+    procesos preparan las gráficas y se arma un único PDF con una tabla
+    resumen seguida del reporte de cada paciente. Devuelve la lista de
+    rutas generadas.
+    """
+    procesos = procesos or os.cpu_count() or 1
+    carpeta = carpeta or get_downloads_folder()
+    os.makedirs(carpeta, exist_ok=True)
+    inicio = time.perf_counter()
+    
+    # Una sola carga del historial para todos los pacientes
+    historiales = seleccionar_historiales(get_historial().cargar(), pacientes, desde, hasta)
+    total = len(historiales)
+    print(f"{total} pacientes por reportar", file=salida)
+    if not total:
+        return []
+    
+    rutas = []
+    errores = 0
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso_sin_interfaz,
+                             initargs=(BACKEND_GRAFICA,)) as pool:
+        if combinado:
+            futuros = {pool.submit(_grafica_reporte, nombre, df): nombre
+                       for nombre, df in historiales.items()}
+            graficas = {}
+            for futuro in as_completed(futuros):
+                try:
+                    graficas[futuros[futuro]] = futuro.result()
+                except Exception as e:
+                    registrar_error(e)
+                    graficas[futuros[futuro]] = None
+        else:
+            futuros = {pool.submit(_reporte_individual, nombre, df, carpeta): nombre
+                       for nombre, df in historiales.items()}
+            for n, futuro in enumerate(as_completed(futuros), start=1):
+                pdf_path, error = futuro.result()
+                if pdf_path:
+                    rutas.append(pdf_path)
+                    print(f"[{n}/{total}] {futuros[futuro]}: {pdf_path}", file=salida)
+                else:
+                    errores += 1
+                    print(f"[{n}/{total}] {futuros[futuro]}: ERROR {error}", file=salida)
+    
+    if combinado:
+        pdf = nuevo_pdf()
+        _escribir_resumen_reportes(pdf, historiales, desde, hasta)
+        for n, (nombre, df_paciente) in enumerate(historiales.items(), start=1):
+            escribir_reporte_paciente(pdf, nombre, df_paciente, graficas.get(nombre))
+            print(f"[{n}/{total}] {nombre}", file=salida)
+        pdf_path = reservar_ruta(carpeta, f"reporte_pacientes_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf")
+        _escribir_reservado(pdf_path, pdf.output)
+        rutas.append(pdf_path)
+    
+    duracion = time.perf_counter() - inicio
+    print(f"Reportes terminados: {total - errores} pacientes, {errores} con error, "
+          f"{duracion:.1f} s ({total / max(duracion, 1e-9):.2f} pacientes/s, {procesos} procesos)", file=salida)
+    return rutas
+
+# ========== ANALÍTICA DE COHORTE ==========
+# Bandas de riesgo en el orden de clase_riesgo (0, 1, 2)
+BANDAS_RIESGO = ["BAJO", "MODERADO", "ALTO"]
+# Origen de los días en las regresiones: julianday('2000-01-01') en SQLite
+JULIANO_ORIGEN = 2451544.5
+
+def _preparar_cohorte(df, desde=None, hasta=None):
+    """Visitas con fecha válida, ordenadas por paciente y fecha, con días desde 2000-01-01"""
+    fechas = pd.to_datetime(df['FechaHora'], errors='coerce')
+    datos = pd.DataFrame({
+        'Paciente': df['Paciente'].astype(str),
+        'Fecha': fechas,
+        'AreaLesion': pd.to_numeric(df['AreaLesion'], errors='coerce'),
+        'DesvEstR': pd.to_numeric(df['DesvEstR'], errors='coerce'),
+        'Riesgo': pd.to_numeric(df['Riesgo'], errors='coerce'),
+    })
+    seleccion = datos['Fecha'].notna()
+    if desde:
+        seleccion &= datos['Fecha'] >= pd.Timestamp(desde)
+    if hasta:
+        seleccion &= datos['Fecha'] < pd.Timestamp(hasta) + pd.Timedelta(days=1)
+    datos = datos[seleccion].sort_values(['Paciente', 'Fecha'], kind='stable')
+    datos['Dias'] = (datos['Fecha'] - pd.Timestamp("2000-01-01")) / pd.Timedelta(days=1)
+    return datos.reset_index(drop=True)
+
+def velocidad_cicatrizacion(datos):
+    """Pendiente (por día) de AreaLesion y DesvEstR de cada paciente, por mínimos cuadrados.
+    
+    ``datos`` viene de _preparar_cohorte. Se calcula con sumas agrupadas
+    sobre tiempos centrados por paciente; NaN si el paciente tiene una
+    sola fecha.
+    """
+    grupos = datos.groupby('Paciente', sort=True)
+    xc = datos['Dias'] - grupos['Dias'].transform('mean')
+    sumas = pd.DataFrame({
+        'Paciente': datos['Paciente'],
+        'xx': xc * xc,
+        'xa': xc * datos['AreaLesion'],
+        'xd': xc * datos['DesvEstR'],
+    }).groupby('Paciente', sort=True).sum()
+    
+    resumen = grupos.agg(
+        Visitas=('Dias', 'size'),
+        Primera=('Fecha', 'first'),
+        Ultima=('Fecha', 'last'),
+        AreaInicial=('AreaLesion', 'first'),
+        AreaFinal=('AreaLesion', 'last'),
+        RiesgoFinal=('Riesgo', 'last'),
+    )
+    denominador = sumas['xx'].where(sumas['xx'] > 0)
+    resumen['PendienteArea'] = sumas['xa'] / denominador
+    resumen['PendienteDesv'] = sumas['xd'] / denominador
+    return resumen
+
+def velocidad_cicatrizacion_sql(almacen, desde=None, hasta=None):
+    """Igual que velocidad_cicatrizacion, con las sumas calculadas dentro de SQLite"""
+    condiciones = ["julianday(FechaHora) IS NOT NULL"]
+    parametros = []
+    if desde:
+        condiciones.append("FechaHora >= ?")
+        parametros.append(str(pd.Timestamp(desde)))
+    if hasta:
+        condiciones.append("FechaHora < ?")
+        parametros.append(str(pd.Timestamp(hasta) + pd.Timedelta(days=1)))
+    sql = f"""
+        WITH base AS (
+            SELECT Paciente, julianday(FechaHora) - {JULIANO_ORIGEN} AS x,
+                   AreaLesion AS a, DesvEstR AS d
+            FROM evaluaciones WHERE {' AND '.join(condiciones)}
+        )
+        SELECT Paciente, COUNT(*) AS n, SUM(x) AS sx, SUM(x * x) AS sxx,
+               SUM(a) AS sa, SUM(x * a) AS sxa, SUM(d) AS sd, SUM(x * d) AS sxd
+        FROM base GROUP BY Paciente ORDER BY Paciente"""
+    sumas = almacen.consulta(sql, parametros).set_index('Paciente')
+    
+    n = sumas['n']
+    denominador = (n * sumas['sxx'] - sumas['sx'] ** 2)
+    denominador = denominador.where(denominador > 1e-9 * n * sumas['sxx'])
+    return pd.DataFrame({
+        'Visitas': n,
+        'PendienteArea': (n * sumas['sxa'] - sumas['sx'] * sumas['sa']) / denominador,
+        'PendienteDesv': (n * sumas['sxd'] - sumas['sx'] * sumas['sd']) / denominador,
+    })
+
+def tiempo_en_banda(datos):
+    """Días y fracción del seguimiento de cada paciente en cada banda de riesgo.
+    
+    El intervalo entre dos visitas se asigna a la banda de la primera; la
+    última visita no suma tiempo.
+    """
+    siguiente = datos.groupby('Paciente', sort=False)['Fecha'].shift(-1)
+    dias = ((siguiente - datos['Fecha']) / pd.Timedelta(days=1)).fillna(0.0)
+    dias = dias.where(datos['Riesgo'].notna(), 0.0)
+    banda = pd.Categorical.from_codes(clase_riesgo(datos['Riesgo']), BANDAS_RIESGO)
+    
+    tabla = (pd.DataFrame({'Paciente': datos['Paciente'], 'Banda': banda, 'Dias': dias})
+             .groupby(['Paciente', 'Banda'], observed=False, sort=True)['Dias'].sum()
+             .unstack('Banda').reindex(columns=BANDAS_RIESGO).fillna(0.0))
+    total = tabla.sum(axis=1)
+    fracciones = tabla.div(total.where(total > 0), axis=0)
+    tabla.columns = [f"Dias{banda}" for banda in BANDAS_RIESGO]
+    fracciones.columns = [f"Fraccion{banda}" for banda in BANDAS_RIESGO]
+    return pd.concat([tabla, fracciones], axis=1)
+
+def distribuciones_cohorte(resumen):
+    """Distribuciones de la cohorte a partir del resumen por paciente"""
+    percentiles = [0.1, 0.25, 0.5, 0.75, 0.9]
+    banda_actual = pd.Series(clase_riesgo(resumen['RiesgoFinal'].to_numpy(float)))
+    banda_actual = banda_actual[resumen['RiesgoFinal'].notna().to_numpy()]
+    pendientes = resumen['PendienteArea'].dropna()
+    dias = resumen[[f"Dias{banda}" for banda in BANDAS_RIESGO]].sum()
+    return {
+        'pacientes': len(resumen),
+        'visitas': int(resumen['Visitas'].sum()),
+        'pendiente_area': resumen['PendienteArea'].describe(percentiles=percentiles),
+        'pendiente_desv': resumen['PendienteDesv'].describe(percentiles=percentiles),
+        'mejorando': float((pendientes < 0).mean()) if len(pendientes) else np.nan,
+        'banda_actual': banda_actual.value_counts().reindex(range(3), fill_value=0)
+                        .set_axis(BANDAS_RIESGO),
+        'fraccion_tiempo_banda': (dias / dias.sum()).set_axis(BANDAS_RIESGO) if dias.sum() > 0
+                                 else pd.Series(np.nan, index=BANDAS_RIESGO),
+    }
+
+def analitica_cohorte(df=None, desde=None, hasta=None):
+    """Resumen por paciente (velocidad de cicatrización y tiempo en banda) y
+    distribuciones de la cohorte, en una sola pasada sobre el historial.
+    
+    Sin ``df`` se usa el historial completo del almacén activo.
+    """
+    if df is None:
+        df = get_historial().cargar()
+    datos = _preparar_cohorte(df, desde, hasta)
+    resumen = velocidad_cicatrizacion(datos).join(tiempo_en_banda(datos))
+    return resumen, distribuciones_cohorte(resumen)
+
+def imprimir_cohorte(resumen, distribuciones, salida=sys.stdout):
+    """Resumen legible de la analítica de cohorte"""
+    print(f"Pacientes: {distribuciones['pacientes']}  Visitas: {distribuciones['visitas']}", file=salida)
+    print(f"Pacientes mejorando (área decreciente): {distribuciones['mejorando']:.1%}", file=salida)
+    for clave, titulo in (('pendiente_area', "Pendiente área (cm²/día)"),
+                          ('pendiente_desv', "Pendiente DesvEstR (/día)")):
+        d = distribuciones[clave]
+        print(f"{titulo}: p10={d['10%']:+.4f} p50={d['50%']:+.4f} p90={d['90%']:+.4f}", file=salida)
+    print("Banda actual: " + ", ".join(f"{banda} {n}" for banda, n in distribuciones['banda_actual'].items()),
+          file=salida)
+    print("Tiempo en banda: " + ", ".join(f"{banda} {f:.1%}" for banda, f
+                                           in distribuciones['fraccion_tiempo_banda'].items()), file=salida)
+    peores = resumen['PendienteArea'].dropna().nlargest(5)
+    if not peores.empty:
+        print("Mayor crecimiento del área:", file=salida)
+        for paciente, pendiente in peores.items():
+            print(f"  {paciente:<30} {pendiente:+.4f} cm²/día", file=salida)
+
+def generar_cohorte_sintetica(visitas, pacientes=None, semilla=0):
+    """Historial ficticio de muchos pacientes con tendencias de área distintas"""
+    rng = np.random.default_rng(semilla)
+    pacientes = pacientes or max(1, visitas // 50)
+    paciente = np.sort(rng.integers(0, pacientes, visitas))
+    dias = rng.uniform(0, 1000, visitas)
+    base = rng.uniform(1, 8, pacientes)[paciente]
+    pendiente = rng.normal(-0.004, 0.004, pacientes)[paciente]
+    area = np.clip(base + pendiente * dias + rng.normal(0, 0.3, visitas), 0, None)
+    riesgo = np.clip(1.0 + area / 4 + rng.normal(0, 0.2, visitas), 1.0, 3.0)
+    fechas = pd.Timestamp("2021-01-01") + pd.to_timedelta(dias, unit='D')
+    return pd.DataFrame({
+        'ID': np.arange(1, visitas + 1),
+        'FechaHora': fechas.strftime("%Y-%m-%d %H:%M:%S"),
+        'Paciente': np.char.add("Paciente_", paciente.astype(str)),
+        'AreaLesion': area,
+        'DesvEstR': rng.uniform(5, 60, visitas),
+        'Riesgo': riesgo,
+        'Semaforo': np.array(["BAJO (verde)", "MODERADO (amarillo)", "ALTO (rojo)"])[clase_riesgo(riesgo)],
+        'Comparacion': 'actual',
+    }).reindex(columns=COLUMNAS_EVALUACION)
+
+def medir_analitica_cohorte(visitas=100000, pacientes=None):
+    """Tiempos (s) de la analítica vectorizada, por paciente y en SQLite.
+    
+    También devuelve la diferencia máxima entre las pendientes calculadas
+    con pandas y con SQLite.
+    """
+    df = generar_cohorte_sintetica(visitas, pacientes)
+    tiempos = {}
+    
+    inicio = time.perf_counter()
+    resumen, _ = analitica_cohorte(df)
+    tiempos['vectorizada'] = time.perf_counter() - inicio
+    
+    # Referencia: el patrón actual, un filtro y un ajuste por paciente
+    inicio = time.perf_counter()
+    fechas = pd.to_datetime(df['FechaHora'])
+    for nombre in df['Paciente'].unique():
+        filas = df['Paciente'] == nombre
+        if filas.sum() > 1:
+            np.polyfit((fechas[filas] - fechas.min()) / pd.Timedelta(days=1), df.loc[filas, 'AreaLesion'], 1)
+    tiempos['por_paciente'] = time.perf_counter() - inicio
+    
+    carpeta = tempfile.mkdtemp(prefix="cohorte_")
+    try:
+        almacen = AlmacenSQLite(os.path.join(carpeta, "cohorte.db"))
+        almacen.agregar(df.to_dict('records'))
+        inicio = time.perf_counter()
+        sql = velocidad_cicatrizacion_sql(almacen)
+        tiempos['sqlite'] = time.perf_counter() - inicio
+        almacen.cerrar()
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+    
+    diferencia = float((sql['PendienteArea'] - resumen['PendienteArea']).abs().max())
+    return tiempos, diferencia
+
+# ========== CAPTURA DE CÁMARA ==========
+# Refresco de la vista previa (ms); ~30 cuadros por segundo
+INTERVALO_PREVIEW_MS = 33
+# Lado máximo del cuadro mostrado en la vista previa
+LADO_PREVIEW_CAMARA = 800
+
+class CapturaCamara:
+    """Lee cuadros de la cámara en un hilo dedicado.
+    
+    Sólo se conserva el último cuadro (búfer de una posición): si la vista
+    previa va más lenta que la cámara, los cuadros intermedios se descartan
+    en lugar de acumularse, así lo mostrado y lo guardado es siempre lo más
+    reciente.
+    """
+    
+    def __init__(self, indice=0):
+        self.indice = indice
+        self.error = None
+        self._cap = None
+        self._hilo = None
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self._cuadro = None
+        self._secuencia = 0
+    
+    def iniciar(self):
+        """Abre la cámara y lanza el hilo de lectura; False si no está disponible"""
+        self._cap = cv2.VideoCapture(self.indice)
+        if not self._cap.isOpened():
+            self._cap.release()
+            return False
+        # Evitar que el controlador acumule cuadros viejos
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._hilo = threading.Thread(target=self._leer, name="captura-camara", daemon=True)
+        self._hilo.start()
+        return True
+    
+    def _leer(self):
+        while not self._detener.is_set():
+            ret, cuadro = self._cap.read()  # Cada lectura entrega un arreglo nuevo
+            if not ret:
+                self.error = "No se pudo capturar imagen."
+                break
+            with self._lock:
+                self._cuadro = cuadro
+                self._secuencia += 1
+    
+    def ultimo(self):
+        """(cuadro BGR a resolución completa, número de secuencia); sin copiar"""
+        with self._lock:
+            return self._cuadro, self._secuencia
+    
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=1.0)
+        if self._cap is not None:
+            self._cap.release()
+
+# ======================== INTERFAZ MEJORADA =========================
+# Pausa de escritura antes de buscar el historial del paciente
+RETARDO_BUSQUEDA_MS = 200
+# Intervalo de revisión de resultados enviados por hilos de trabajo
+INTERVALO_COLA_UI_MS = 30
+# Reportes PDF que pueden generarse a la vez
+REPORTES_SIMULTANEOS = 2
+# Hilos que extraen características de las imágenes de una visita
+HILOS_EXTRACCION = 4
+
+class DialogoProgreso(tk.Toplevel):
+    """Ventana no modal con el avance de un reporte y botón de cancelar"""
+    
+    def __init__(self, master, titulo):
+        super().__init__(master)
+        self.title(titulo)
+        self.resizable(False, False)
+        self.transient(master)
+        self.cancelar = threading.Event()
+        
+        self.etapa_var = tk.StringVar(value="En cola...")
+        ttk.Label(self, textvariable=self.etapa_var, width=40).pack(padx=15, pady=(15, 5))
+        self.barra = ttk.Progressbar(self, length=300, mode="determinate", maximum=100)
+        self.barra.pack(padx=15, pady=5)
+        self.boton = ttk.Button(self, text="Cancelar", command=self.solicitar_cancelacion)
+        self.boton.pack(pady=(5, 15))
+        self.protocol("WM_DELETE_WINDOW", self.solicitar_cancelacion)
+    
+    def actualizar(self, fraccion, etapa):
+        if self.winfo_exists():
+            self.barra["value"] = fraccion * 100
+            self.etapa_var.set(etapa)
+    
+    def solicitar_cancelacion(self):
+        self.cancelar.set()
+        self.etapa_var.set("Cancelando...")
+        self.boton.state(["disabled"])
+
+# Control de calidad en vivo: se mide sobre una copia de este lado máximo
+LADO_CALIDAD = 320
+# Varianza del Laplaciano mínima (sobre la copia reducida) para considerar nítida la toma
+UMBRAL_NITIDEZ = 100.0
+# Brillo medio aceptable y fracción máxima de píxeles saturados en negro o blanco
+BRILLO_MINIMO = 50
+BRILLO_MAXIMO = 210
+FRACCION_RECORTE = 0.05
+# Análisis aptos seguidos antes de la captura automática
+ESTABLES_AUTOCAPTURA = 5
+
+def evaluar_calidad_cuadro(cuadro, lado_max=LADO_CALIDAD):
+    """Calidad de una toma medida sobre una copia reducida (BGR).
     
-    # Crear copia para evitar SettingWithCopyWarning
-    df_plot = df_paciente.copy()
+    Devuelve un dict con nitidez (varianza del Laplaciano), brillo medio,
+    fracciones subexpuesta/sobreexpuesta, la máscara provisional de la
+    lesión en la copia reducida (Otsu sobre a*, la misma semilla que
+    segmentar_lesion), su área en las unidades de analizar_imagen
+    (píxeles a resolución completa / 10000), la escala de la copia y la
+    lista de avisos; 'apta' es True si no hay avisos.
+    """
+    alto, ancho = cuadro.shape[:2]
+    escala = min(1.0, lado_max / max(alto, ancho))
+    proxy = cv2.resize(cuadro, (max(1, round(ancho * escala)), max(1, round(alto * escala))),
+                       interpolation=cv2.INTER_AREA) if escala < 1.0 else cuadro
     
-    # Convertir fechas y ordenar
-    df_plot['Fecha'] = pd.to_datetime(df_plot['FechaHora'])
-    df_plot = df_plot.sort_values('Fecha')
+    gris = cv2.cvtColor(proxy, cv2.COLOR_BGR2GRAY)
+    nitidez = float(cv2.Laplacian(gris, cv2.CV_64F).var())
+    histograma = cv2.calcHist([gris], [0], None, [256], [0, 256]).ravel() / gris.size
+    brillo = float(histograma @ np.arange(256))
+    sub = float(histograma[:11].sum())
+    sobre = float(histograma[245:].sum())
     
-    # Gráfico principal
-    plt.plot(df_plot['Fecha'], df_plot['AreaLesion'], 
-             'o-', color='#3498db', linewidth=2, markersize=8, label='Área lesión (cm²)')
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    mascara = _candidata_lesion(proxy, kernel).astype(bool)
+    area = float(np.count_nonzero(mascara)) / (escala * escala) / 10000
     
-    # Segundo eje para Desviación Estándar
-    ax2 = plt.gca().twinx()
-    ax2.plot(df_plot['Fecha'], df_plot['DesvEstR'], 
-             's--', color='#e74c3c', linewidth=2, markersize=8, label='Desv. estándar R')
+    avisos = []
+    if nitidez < UMBRAL_NITIDEZ:
+        avisos.append("Imagen borrosa")
+    if brillo < BRILLO_MINIMO or sub > FRACCION_RECORTE:
+        avisos.append("Poca luz")
+    if brillo > BRILLO_MAXIMO or sobre > FRACCION_RECORTE:
+        avisos.append("Sobreexpuesta")
+    if not mascara.any():
+        avisos.append("No se detecta la lesión")
+    elif mascara[0].any() or mascara[-1].any() or mascara[:, 0].any() or mascara[:, -1].any():
+        avisos.append("Lesión cortada por el borde")
     
-    # Configuración de ejes
-    plt.gca().set_ylabel('Área lesión (cm²)', color='#3498db', fontsize=12)
-    ax2.set_ylabel('Desv. estándar R', color='#e74c3c', fontsize=12)
+    return {
+        'nitidez': nitidez, 'brillo': brillo, 'subexpuesta': sub, 'sobreexpuesta': sobre,
+        'mascara': mascara, 'area': area, 'escala': escala,
+        'avisos': avisos, 'apta': not avisos,
+    }
+
+class AnalizadorCalidad:
+    """Evalúa la calidad del último cuadro de la cámara en un hilo propio.
     
-    # Títulos y leyendas
-    plt.title(f"Evolución de lesión: {nombre_paciente}", fontsize=14, pad=20)
-    plt.grid(True, linestyle='--', alpha=0.7)
+    Toma siempre el cuadro más reciente cuando termina el anterior, así
+    nunca frena la lectura ni la vista previa; publica el último resultado
+    junto con el cuadro analizado y su número de secuencia.
+    """
     
-    # Combinar leyendas
-    lines, labels = plt.gca().get_legend_handles_labels()
-    lines2, labels2 = ax2.get_legend_handles_labels()
-    plt.legend(lines + lines2, labels + labels2, loc='best')
+    def __init__(self, captura):
+        self.captura = captura
+        self.duracion = 0.0
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self._resultado = (None, None, 0)
+        self._hilo = threading.Thread(target=self._analizar, name="calidad-camara", daemon=True)
     
-    plt.tight_layout()
+    def iniciar(self):
+        self._hilo.start()
     
-    # Guardar en archivo temporal
-    temp_dir = tempfile.gettempdir()
-    img_name = f"{nombre_paciente}_evolucion_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-    img_path = os.path.join(temp_dir, img_name)
-    plt.savefig(img_path, dpi=150)
-    plt.close()
+    def _analizar(self):
+        analizado = 0
+        while not self._detener.is_set():
+            cuadro, secuencia = self.captura.ultimo()
+            if cuadro is None or secuencia == analizado:
+                self._detener.wait(0.005)
+                continue
+            inicio = time.perf_counter()
+            try:
+                calidad = evaluar_calidad_cuadro(cuadro)
+            except Exception as e:
+                registrar_error(e)
+                self._detener.wait(0.5)
+                continue
+            self.duracion = time.perf_counter() - inicio
+            analizado = secuencia
+            with self._lock:
+                self._resultado = (calidad, cuadro, secuencia)
     
-    return img_path
-
-def get_downloads_folder():
-    """Obtiene el directorio de descargas de forma multiplataforma"""
-    if os.name == 'nt':
-        try:
-            sub_key = r'SOFTWARE\Microsoft\Windows\CurrentVersion\Explorer\Shell Folders'
-            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, sub_key) as key:
-                downloads_dir = winreg.QueryValueEx(key, '{374DE290-123F-4565-9164-39C4925E467B}')[0]
-            return downloads_dir
-        except Exception:
-            return os.path.join(os.path.expanduser("~"), "Downloads")
-    else:
-        return os.path.join(os.path.expanduser("~"), "Downloads")
+    def ultimo(self):
+        """(calidad, cuadro analizado, secuencia) del análisis más reciente"""
+        with self._lock:
+            return self._resultado
+    
+    def detener(self):
+        self._detener.set()
+        if self._hilo.is_alive():
+            self._hilo.join(timeout=1.0)
 
-def exportar_pdf(nombre_paciente, df_paciente, img_graph):
-    """Genera PDF profesional con historial completo de imágenes"""
-    try:
-        # Preparar nombre de archivo seguro
-        safe_name = re.sub(r'[\\/*?:"<>|]', "", nombre_paciente)[:50]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        pdfname = f"{safe_name}_{timestamp}_reporte.pdf"
-        downloads = get_downloads_folder()
-        pdf_path = os.path.join(downloads, pdfname)
+class VentanaCamara(tk.Toplevel):
+    """Vista previa de la cámara dentro de Tk, refrescada con after().
+    
+    Muestra la calidad de la toma y el contorno provisional de la lesión.
+    'S' guarda el cuadro más reciente a resolución completa (con aviso si
+    la toma no es apta) y llama a al_guardar(ruta); con la captura
+    automática se guarda solo tras ESTABLES_AUTOCAPTURA análisis aptos
+    seguidos. 'Q' o Esc cierran sin guardar.
+    """
+    
+    def __init__(self, master, captura, al_guardar):
+        super().__init__(master)
+        self.title("Tomar Foto")
+        self.captura = captura
+        self.al_guardar = al_guardar
+        self._mostrado = 0
+        self._foto = None
+        self._evaluado = 0
+        self._aptos_seguidos = 0
+        self.analizador = AnalizadorCalidad(captura)
+        self.analizador.iniciar()
         
-        # Crear PDF
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
+        self.preview = ttk.Label(self)
+        self.preview.pack(padx=10, pady=10)
+        self.estado_var = tk.StringVar(value="Presione 'S' para guardar, 'Q' para salir")
+        ttk.Label(self, textvariable=self.estado_var).pack(pady=(0, 5))
+        self.calidad_var = tk.StringVar(value="Analizando calidad...")
+        self.calidad_label = tk.Label(self, textvariable=self.calidad_var, font=("Arial", 11, "bold"))
+        self.calidad_label.pack(pady=(0, 5))
         
-        # === Página 1: Resumen y datos ===
-        pdf.add_page()
+        botones = ttk.Frame(self)
+        botones.pack(pady=(0, 10))
+        self.auto_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(botones, text="Captura automática", variable=self.auto_var).pack(side=tk.LEFT, padx=5)
+        ttk.Button(botones, text="Guardar (S)", command=self.guardar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(botones, text="Salir (Q)", command=self.cerrar).pack(side=tk.LEFT, padx=5)
         
-        # Encabezado
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, f"Reporte de Evolución - {nombre_paciente}", 0, 1, 'C')
-        pdf.ln(5)
+        for tecla in ("<s>", "<S>"):
+            self.bind(tecla, lambda e: self.guardar())
+        for tecla in ("<q>", "<Q>", "<Escape>"):
+            self.bind(tecla, lambda e: self.cerrar())
+        self.protocol("WM_DELETE_WINDOW", self.cerrar)
+        self.focus_set()
         
-        # Resumen de riesgo actual
-        last_record = df_paciente.iloc[-1]
-        riesgo_val = last_record.get('Riesgo', 0)
-        semaforo = last_record.get('Semaforo', '')
+        self._tarea = self.after(INTERVALO_PREVIEW_MS, self._refrescar)
+    
+    def _refrescar(self):
+        """Muestra el último cuadro si llegó uno nuevo desde el refresco anterior"""
+        if self.captura.error:
+            messagebox.showerror("Error", self.captura.error, parent=self)
+            self.cerrar()
+            return
         
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 8, "Resumen de Riesgo Actual:", 0, 1)
-        pdf.set_font("Arial", "", 12)
+        calidad, analizado, evaluado = self.analizador.ultimo()
+        if calidad is not None and evaluado != self._evaluado:
+            self._evaluado = evaluado
+            if self._actualizar_calidad(calidad, analizado):
+                return
         
-        if riesgo_val < 1.6:
-            color = (50, 200, 50)  # Verde
-        elif riesgo_val < 2.1:
-            color = (200, 200, 50)  # Amarillo
+        cuadro, secuencia = self.captura.ultimo()
+        if cuadro is not None and secuencia != self._mostrado:
+            self._mostrado = secuencia
+            self._mostrar(cuadro, calidad)
+        self._tarea = self.after(INTERVALO_PREVIEW_MS, self._refrescar)
+    
+    def _actualizar_calidad(self, calidad, cuadro):
+        """Muestra el estado de la toma; True si la captura automática la guardó"""
+        if calidad['apta']:
+            self._aptos_seguidos += 1
+            self.calidad_var.set(f"Toma correcta - área provisional {calidad['area']:.2f} cm²")
+            self.calidad_label.configure(fg="#27ae60")
         else:
-            color = (200, 50, 50)  # Rojo
-            
-        pdf.set_text_color(*color)
-        pdf.cell(0, 8, f"Riesgo: {riesgo_val:.2f} - {semaforo}", 0, 1)
-        pdf.set_text_color(0, 0, 0)
-        pdf.ln(5)
-        
-        # Datos de la última consulta
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 8, "Última Evaluación:", 0, 1)
-        
-        # Tabla de datos
-        col_widths = [60, 40]
-        data = [
-            ("Fecha", last_record['FechaHora']),
-            ("Área de lesión", f"{last_record.get('AreaLesion', 0):.2f} cm²"),
-            ("Desviación estándar R", f"{last_record.get('DesvEstR', 0):.2f}"),
-            ("Sensibilidad", f"{last_record.get('Sensibilidad', 0)}"),
-            ("Tiempo de evolución", f"{last_record.get('TiempoEvol', 0)} días"),
-            ("Control glucémico", f"{last_record.get('ControlGlu', 0)}")
-        ]
-        
-        for label, value in data:
-            pdf.set_font("Arial", "B", 12)
-            pdf.cell(col_widths[0], 8, label, 0, 0)
-            pdf.set_font("Arial", "", 12)
-            pdf.cell(0, 8, value, 0, 1)
-            pdf.ln(3)
-        
-        pdf.ln(5)
+            self._aptos_seguidos = 0
+            self.calidad_var.set(" / ".join(calidad['avisos']))
+            self.calidad_label.configure(fg="#c0392b")
         
-        # Historial resumido
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 8, "Resumen Histórico:", 0, 1)
+        if self.auto_var.get() and self._aptos_seguidos >= ESTABLES_AUTOCAPTURA:
+            if self._guardar_cuadro(cuadro):
+                return True
+            self.auto_var.set(False)
+        return False
+    
+    def _mostrar(self, cuadro, calidad=None):
+        alto, ancho = cuadro.shape[:2]
+        escala = min(1.0, LADO_PREVIEW_CAMARA / max(alto, ancho))
+        if escala < 1.0:
+            cuadro = cv2.resize(cuadro, (int(ancho * escala), int(alto * escala)),
+                                interpolation=cv2.INTER_AREA)
+        elif calidad is not None:
+            cuadro = cuadro.copy()  # No dibujar sobre el cuadro que se puede guardar
         
-        # Encabezados de tabla
-        col_widths = [40, 25, 25, 20]
-        headers = ["Fecha", "Área (cm²)", "Desv. R", "Riesgo"]
-        for i, header in enumerate(headers):
-            pdf.cell(col_widths[i], 8, header, 1, 0, 'C')
-        pdf.ln()
+        # Contorno provisional de la lesión (máscara de la copia de calidad reescalada)
+        if calidad is not None and calidad['mascara'].any():
+            mascara = cv2.resize(calidad['mascara'].astype(np.uint8), (cuadro.shape[1], cuadro.shape[0]),
+                                 interpolation=cv2.INTER_NEAREST)
+            contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            color = (0, 200, 0) if calidad['apta'] else (0, 0, 255)
+            cv2.drawContours(cuadro, contornos, -1, color, 2)
+        self._foto = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(cuadro, cv2.COLOR_BGR2RGB)))
+        self.preview.configure(image=self._foto)
+    
+    def guardar(self):
+        """Escribe el cuadro más reciente; avisa si la última evaluación no es apta"""
+        cuadro, _ = self.captura.ultimo()
+        if cuadro is None:
+            return
+        calidad, _, _ = self.analizador.ultimo()
+        if calidad is not None and not calidad['apta']:
+            if not messagebox.askyesno("Calidad de la toma",
+                                       f"{' / '.join(calidad['avisos'])}.\n\n¿Guardar de todos modos?",
+                                       parent=self):
+                return
+        self._guardar_cuadro(cuadro)
+    
+    def _guardar_cuadro(self, cuadro):
+        """Escribe el cuadro a resolución completa, sin copia ni anotaciones.
         
-        # Datos de tabla
-        pdf.set_font("Arial", "", 9)
-        for _, row in df_paciente.iterrows():
-            pdf.cell(col_widths[0], 8, str(row['FechaHora'])[:16], 1)
-            pdf.cell(col_widths[1], 8, f"{row.get('AreaLesion', 0):.2f}", 1, 0, 'C')
-            pdf.cell(col_widths[2], 8, f"{row.get('DesvEstR', 0):.2f}", 1, 0, 'C')
+        Devuelve True si se guardó (y la ventana se cerró).
+        """
+        try:
+            temp_dir = tempfile.gettempdir()
+            img_name = f"captura_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+            img_path = reservar_ruta(temp_dir, img_name)
             
-            # Color según riesgo
-            riesgo = row.get('Riesgo', 0)
-            if riesgo < 1.6:
-                pdf.set_text_color(50, 200, 50)
-            elif riesgo < 2.1:
-                pdf.set_text_color(200, 200, 50)
-            else:
-                pdf.set_text_color(200, 50, 50)
-                
-            pdf.cell(col_widths[3], 8, f"{riesgo:.2f}", 1, 0, 'C')
-            pdf.set_text_color(0, 0, 0)
-            pdf.ln()
-        
-        pdf.ln(10)
-        
-        # Gráfica de evolución
-        if img_graph and os.path.isfile(img_graph):
-            pdf.set_font("Arial", "B", 14)
-            pdf.cell(0, 8, "Evolución de la Lesión:", 0, 1)
-            pdf.image(img_graph, w=180)
-            pdf.ln(5)
-        
-        # === Página 2: Imágenes históricas ===
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "Historial de Imágenes", 0, 1, 'C')
-        pdf.ln(5)
-        
-        # Obtener todas las imágenes del paciente
-        image_records = df_paciente[df_paciente['Comparacion'] == 'actual']
-        
-        for idx, record in image_records.iterrows():
-            img_path = record['Imagen']
-            if not os.path.isfile(img_path):
-                continue
-                
-            try:
-                # Encabezado de imagen
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, f"Fecha: {record['FechaHora']}", 0, 1)
-                pdf.set_font("Arial", "", 10)
-                
-                # Información de la imagen
-                pdf.cell(0, 6, f"Área: {record.get('AreaLesion', 0):.2f} cm²", 0, 1)
-                pdf.cell(0, 6, f"Desv. R: {record.get('DesvEstR', 0):.2f}", 0, 1)
-                
-                # Agregar la imagen
-                img = Image.open(img_path)
-                img.thumbnail((150, 150))  # Redimensionar para PDF
-                
-                # Guardar temporalmente
-                temp_img = os.path.join(tempfile.gettempdir(), f"temp_{idx}.png")
-                img.save(temp_img)
-                
-                pdf.image(temp_img, w=90)
-                pdf.ln(10)
-                
-                # Línea separadora
-                pdf.set_draw_color(200, 200, 200)
-                pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-                pdf.ln(5)
-                
-            except Exception as e:
-                registrar_error(e)
+            def escribir(ruta):
+                if not cv2.imwrite(ruta, cuadro):
+                    raise IOError(f"No se pudo escribir {ruta}")
+            _escribir_reservado(img_path, escribir)
+        except Exception as e:
+            registrar_error(e)
+            messagebox.showerror("Error", f"Error al capturar imagen: {str(e)}", parent=self)
+            return False
+        self.cerrar()
+        self.al_guardar(img_path)
+        return True
+    
+    def cerrar(self):
+        self.after_cancel(self._tarea)
+        self.analizador.detener()
+        self.captura.detener()
+        self.destroy()
+
+class VentanaAlertas(tk.Toplevel):
+    """Lista de trabajo con las alertas de empeoramiento sin atender"""
+    
+    def __init__(self, master, al_abrir, al_cambiar):
+        super().__init__(master)
+        self.title("Alertas de evolución")
+        self.geometry("760x320")
+        self.transient(master)
+        self.al_abrir = al_abrir
+        self.al_cambiar = al_cambiar
         
-        pdf.output(pdf_path)
-        return pdf_path
+        columnas = ("Fecha", "Paciente", "Mensaje")
+        self.tabla = ttk.Treeview(self, columns=columnas, show="headings", selectmode="extended")
+        for columna, ancho in zip(columnas, (140, 180, 400)):
+            self.tabla.heading(columna, text=columna)
+            self.tabla.column(columna, width=ancho, anchor=tk.W)
+        self.tabla.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+        self.tabla.bind("<Double-1>", lambda e: self.abrir())
         
-    except Exception as e:
-        registrar_error(e)
-        return None
+        botones = ttk.Frame(self)
+        botones.pack(pady=(5, 10))
+        ttk.Button(botones, text="Abrir paciente", command=self.abrir).pack(side=tk.LEFT, padx=5)
+        ttk.Button(botones, text="Marcar atendidas", command=self.atender).pack(side=tk.LEFT, padx=5)
+        ttk.Button(botones, text="Cerrar", command=self.destroy).pack(side=tk.LEFT, padx=5)
+        self.refrescar()
+    
+    def refrescar(self):
+        self.tabla.delete(*self.tabla.get_children())
+        for alerta in get_detector_tendencias().pendientes():
+            self.tabla.insert("", tk.END, iid=str(alerta['Alerta']),
+                              values=(alerta['FechaHora'], alerta['Paciente'], alerta['Mensaje']))
+    
+    def abrir(self):
+        seleccion = self.tabla.selection()
+        if seleccion:
+            self.al_abrir(self.tabla.set(seleccion[0], "Paciente"))
+    
+    def atender(self):
+        seleccion = self.tabla.selection()
+        if not seleccion:
+            return
+        get_detector_tendencias().atender(int(iid) for iid in seleccion)
+        self.refrescar()
+        self.al_cambiar()
 
-# ======================== INTERFAZ MEJORADA =========================
 class AppPieDiabetico(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -537,6 +4037,11 @@ class AppPieDiabetico(tk.Tk):
         self.style.configure("Result.TLabel", font=("Arial", 12, "bold"), foreground="#e74c3c")
         self.style.configure("Evol.TLabel", font=("Arial", 10), foreground="#2c3e50", background="#e8f4fc")
         
+        # Resultados de hilos de trabajo que deben aplicarse en el hilo de Tk.
+        # Se crea antes de lanzar cualquier tarea que pueda llamar a en_hilo_ui.
+        self._cola_ui = queue.Queue()
+        self.after(INTERVALO_COLA_UI_MS, self._procesar_cola_ui)
+        
         # Crear widgets
         self.create_widgets()
         
@@ -545,6 +4050,46 @@ class AppPieDiabetico(tk.Tk):
         self.current_images = []
         self.last_record = None
         
+        # Búsqueda de historial en segundo plano
+        self._busqueda_pendiente = None
+        self._busqueda_generacion = 0
+        self._busqueda_aplicada = 0
+        self._ejecutor_busqueda = ThreadPoolExecutor(max_workers=1, thread_name_prefix="busqueda")
+        
+        # Reportes PDF en segundo plano (cada uno con su ventana de progreso)
+        self._ejecutor_reportes = ThreadPoolExecutor(max_workers=REPORTES_SIMULTANEOS,
+                                                     thread_name_prefix="reporte")
+        self._reportes_activos = set()
+        
+        # Análisis de visitas: un coordinador y varios hilos de extracción
+        self._ejecutor_visita = ThreadPoolExecutor(max_workers=1, thread_name_prefix="visita")
+        self._ejecutor_imagenes = ThreadPoolExecutor(max_workers=HILOS_EXTRACCION,
+                                                     thread_name_prefix="imagen")
+        self._procesando = False
+        self._ventana_camara = None
+        
+        # Alertas de tendencia: el detector se pone al día en segundo plano
+        self._ventana_alertas = None
+        self._ejecutor_visita.submit(get_detector_tendencias).add_done_callback(
+            lambda f: self.en_hilo_ui(self.actualizar_alertas))
+    
+    def en_hilo_ui(self, funcion, *args):
+        """Encola una llamada para ejecutarla en el hilo de Tk (seguro desde cualquier hilo)"""
+        self._cola_ui.put((funcion, args))
+    
+    def _procesar_cola_ui(self):
+        """Ejecuta las llamadas encoladas por los hilos de trabajo"""
+        try:
+            while True:
+                funcion, args = self._cola_ui.get_nowait()
+                try:
+                    funcion(*args)
+                except Exception as e:
+                    registrar_error(e)
+        except queue.Empty:
+            pass
+        self.after(INTERVALO_COLA_UI_MS, self._procesar_cola_ui)
+        
     def create_widgets(self):
         """Crea la interfaz de usuario"""
         main_frame = ttk.Frame(self)
@@ -557,6 +4102,9 @@ class AppPieDiabetico(tk.Tk):
         ttk.Label(header_frame, text="Healthy Foot", style="Title.TLabel").pack(side=tk.LEFT)
         ttk.Label(header_frame, text="Sistema de Evaluación de Riesgo en Pie Diabético", 
                  style="Subtitle.TLabel").pack(side=tk.LEFT, padx=10)
+        self.alertas_btn = ttk.Button(header_frame, text="Alertas", command=self.mostrar_alertas,
+                                      state="disabled")
+        self.alertas_btn.pack(side=tk.RIGHT)
         
         # Contenedor principal
         content_frame = ttk.Frame(main_frame)
@@ -633,11 +4181,12 @@ class AppPieDiabetico(tk.Tk):
         btn_frame = ttk.Frame(right_frame)
         btn_frame.pack(fill=tk.X, pady=5)
         
-        ttk.Button(btn_frame, text="Cargar Imagen", command=self.cargar_imagenes,
+        ttk.Button(btn_frame, text="Cargar Imágenes", command=self.cargar_imagenes,
                   style="TButton").pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
         
         ttk.Button(btn_frame, text="Analizar y Guardar", command=self.procesar,
                   style="TButton").pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.analizar_btn = btn_frame.winfo_children()[-1]
         
         ttk.Button(btn_frame, text="Generar PDF", command=self.generar_pdf,
                   state="disabled", style="TButton").pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
@@ -645,27 +4194,85 @@ class AppPieDiabetico(tk.Tk):
         
         ttk.Button(btn_frame, text="Nuevo Paciente", command=self.limpiar,
                   style="TButton").pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        
+        # Modo de selección de la lesión
+        roi_frame = ttk.Frame(right_frame)
+        roi_frame.pack(fill=tk.X, pady=5)
+        ttk.Label(roi_frame, text="Selección de lesión:").pack(side=tk.LEFT, padx=5)
+        self.modo_roi_var = tk.StringVar(value=MODO_ROI)
+        ttk.Combobox(roi_frame, textvariable=self.modo_roi_var, values=MODOS_ROI,
+                     state="readonly", width=12).pack(side=tk.LEFT, padx=5)
+    
+    def actualizar_alertas(self):
+        """Muestra en el botón el número de alertas pendientes"""
+        if DETECTOR_TENDENCIAS is None:
+            return
+        pendientes = len(DETECTOR_TENDENCIAS.pendientes())
+        self.alertas_btn.config(text=f"Alertas ({pendientes})" if pendientes else "Alertas",
+                                state="normal")
+        if self._ventana_alertas is not None and self._ventana_alertas.winfo_exists():
+            self._ventana_alertas.refrescar()
+    
+    def mostrar_alertas(self):
+        if self._ventana_alertas is not None and self._ventana_alertas.winfo_exists():
+            self._ventana_alertas.lift()
+            return
+        self._ventana_alertas = VentanaAlertas(self, al_abrir=self.nombre_var.set,
+                                               al_cambiar=self.actualizar_alertas)
     
     def on_nombre_change(self, *args):
-        """Busca datos históricos cuando cambia el nombre del paciente"""
+        """Programa la búsqueda de datos históricos tras una pausa al escribir"""
+        if self._busqueda_pendiente is not None:
+            self.after_cancel(self._busqueda_pendiente)
+        # Cualquier búsqueda en curso queda obsoleta
+        self._busqueda_generacion += 1
+        self._busqueda_pendiente = self.after(RETARDO_BUSQUEDA_MS, self._iniciar_busqueda)
+    
+    def _iniciar_busqueda(self):
+        """Lanza la búsqueda del último registro del paciente fuera del hilo de Tk"""
+        self._busqueda_pendiente = None
+        generacion = self._busqueda_generacion
         nombre = self.nombre_var.get().strip()
         if not nombre:
-            self.last_record = None
-            self.update_evolution_display()
+            self._mostrar_busqueda(generacion, None)
             return
-            
-        # Buscar en el historial
-        if os.path.exists("resultados_pacientes.csv"):
-            df = pd.read_csv("resultados_pacientes.csv")
-            paciente_df = df[df['Paciente'] == nombre]
-            
-            if not paciente_df.empty:
-                # Obtener el último registro como DataFrame
-                self.last_record = paciente_df.sort_values('FechaHora', ascending=False).head(1)
-                self.update_evolution_display()
+        
+        def tarea():
+            # Descartar si llegó otra pulsación mientras esperaba en la cola
+            if generacion != self._busqueda_generacion:
                 return
-                
-        self.last_record = None
+            try:
+                ultimo = get_historial().ultimo(nombre)
+            except Exception as e:
+                registrar_error(e)
+                ultimo = None
+            self.en_hilo_ui(self._mostrar_busqueda, generacion, ultimo)
+        
+        self._ejecutor_busqueda.submit(tarea)
+    
+    def _mostrar_busqueda(self, generacion, ultimo):
+        """Aplica el resultado de la búsqueda si sigue siendo el más reciente"""
+        if generacion != self._busqueda_generacion:
+            return
+        self._busqueda_aplicada = generacion
+        self.last_record = ultimo if ultimo is not None and not ultimo.empty else None
+        self.update_evolution_display()
+        if self.img_paths:
+            self.update_image_display()
+    
+    def resolver_busqueda_pendiente(self):
+        """Completa en el acto una búsqueda aún pendiente (antes de usar last_record)"""
+        if self._busqueda_pendiente is None and self._busqueda_aplicada == self._busqueda_generacion:
+            return
+        if self._busqueda_pendiente is not None:
+            self.after_cancel(self._busqueda_pendiente)
+            self._busqueda_pendiente = None
+        
+        self._busqueda_generacion += 1
+        self._busqueda_aplicada = self._busqueda_generacion
+        nombre = self.nombre_var.get().strip()
+        ultimo = get_historial().ultimo(nombre) if nombre else None
+        self.last_record = ultimo if ultimo is not None and not ultimo.empty else None
         self.update_evolution_display()
     
     def update_evolution_display(self):
@@ -694,74 +4301,32 @@ class AppPieDiabetico(tk.Tk):
         if opcion == 'yes':
             self.tomar_foto()
         else:
-            # Selección de archivos
-            file = filedialog.askopenfilename(
-                title="Seleccione una imagen de la lesión",
+            # Selección de archivos (varias tomas de la misma lesión)
+            files = filedialog.askopenfilenames(
+                title="Seleccione una o más imágenes de la lesión",
                 filetypes=[("Imágenes", "*.jpg *.jpeg *.png *.bmp *.tif *.tiff")]
             )
-            if file:
-                self.img_paths = [file]
+            if files:
+                self.img_paths = list(files)
                 self.update_image_display()
     
     def tomar_foto(self):
-        """Captura una imagen desde la cámara web con mejor manejo de eventos"""
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            messagebox.showerror("Error", "No se pudo acceder a la cámara.")
+        """Abre la vista previa de la cámara; la lectura corre en su propio hilo"""
+        if self._ventana_camara is not None and self._ventana_camara.winfo_exists():
+            self._ventana_camara.lift()
             return
-
-        # Crear ventana para preview
-        win_name = "Tomar Foto - Presione 'S' para guardar, 'Q' para salir"
-        cv2.namedWindow(win_name, cv2.WINDOW_NORMAL)
-        cv2.resizeWindow(win_name, 800, 600)
-        
-        saved = False
-        try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    messagebox.showerror("Error", "No se pudo capturar imagen.")
-                    break
-                
-                # Mostrar el frame con instrucciones
-                display_frame = frame.copy()
-                cv2.putText(display_frame, "Presione 'S' para guardar, 'Q' para salir", 
-                            (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                cv2.imshow(win_name, display_frame)
-                
-                # Manejo de teclas con espera más larga
-                key = cv2.waitKey(100) & 0xFF
-                
-                # Tecla 'S' para guardar
-                if key == ord('s') or key == ord('S'):
-                    # Crear un archivo temporal
-                    temp_dir = tempfile.gettempdir()
-                    img_name = f"captura_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-                    img_path = os.path.join(temp_dir, img_name)
-                    cv2.imwrite(img_path, frame)
-                    self.img_paths = [img_path]
-                    saved = True
-                    break
-                
-                # Tecla 'Q' para salir
-                elif key == ord('q') or key == ord('Q') or key == 27:  # 27 = ESC
-                    break
-                
-                # Verificar si la ventana fue cerrada manualmente
-                if cv2.getWindowProperty(win_name, cv2.WND_PROP_VISIBLE) < 1:
-                    break
-                    
-        except Exception as e:
-            registrar_error(e)
-            messagebox.showerror("Error", f"Error al capturar imagen: {str(e)}")
-        finally:
-            # Liberar recursos siempre
-            cap.release()
-            cv2.destroyAllWindows()
         
-        if saved:
-            self.update_image_display()
-            messagebox.showinfo("Foto guardada", "La foto se ha capturado correctamente")
+        captura = CapturaCamara()
+        if not captura.iniciar():
+            messagebox.showerror("Error", "No se pudo acceder a la cámara.")
+            return
+        self._ventana_camara = VentanaCamara(self, captura, al_guardar=self._foto_capturada)
+    
+    def _foto_capturada(self, img_path):
+        self._ventana_camara = None
+        self.img_paths = [img_path]
+        self.update_image_display()
+        messagebox.showinfo("Foto guardada", "La foto se ha capturado correctamente")
 
     def update_image_display(self):
         """Actualiza la visualización de imágenes en el canvas"""
@@ -783,8 +4348,7 @@ class AppPieDiabetico(tk.Tk):
         # Mostrar imagen actual
         img_path = self.img_paths[0]
         try:
-            img = Image.open(img_path)
-            img.thumbnail((width, 200))
+            img = get_cargador_imagenes().miniatura(img_path, (width, 200))
             
             # Crear marco para imagen
             frame = ttk.Frame(self.img_canvas)
@@ -816,8 +4380,7 @@ class AppPieDiabetico(tk.Tk):
             os.path.isfile(self.last_record['Imagen'].iloc[0])):
             
             try:
-                img_hist = Image.open(self.last_record['Imagen'].iloc[0])
-                img_hist.thumbnail((width, 200))
+                img_hist = get_cargador_imagenes().miniatura(self.last_record['Imagen'].iloc[0], (width, 200))
                 
                 # Crear marco para imagen histórica
                 frame_hist = ttk.Frame(self.img_canvas)
@@ -836,7 +4399,7 @@ class AppPieDiabetico(tk.Tk):
                 label_hist.pack(padx=5, pady=5)
                 
                 # Mostrar etiqueta
-                fecha = self.last_record['FechaHora'].iloc[0].split()[0]
+                fecha = str(self.last_record['FechaHora'].iloc[0]).split()[0]
                 ttk.Label(frame_hist, text=f"ÚLTIMA IMAGEN ({fecha})", font=("Arial", 9)).pack(padx=5)
                 
                 self.current_images.append(photo_hist)
@@ -844,7 +4407,7 @@ class AppPieDiabetico(tk.Tk):
                 registrar_error(e)
     
     def procesar(self):
-        """Procesa los datos con manejo robusto de errores"""
+        """Procesa los datos: ROI en el hilo de Tk, extracción y guardado en segundo plano"""
         try:
             nombre = self.nombre_var.get().strip()
             if not nombre:
@@ -854,162 +4417,232 @@ class AppPieDiabetico(tk.Tk):
             if not self.img_paths:
                 messagebox.showerror("Error", "Seleccione al menos una imagen")
                 return
-                
-            # Obtener dataframe
-            df = get_dataframe()
-            next_id = df['ID'].max() + 1 if not df.empty else 1
-            
-            # Procesar imágenes
-            resultados_img = []
-            for img_path in self.img_paths:
-                try:
-                    _, _, mean_rgb, std_rgb, area_lesion = analizar_imagen(img_path)
-                    
-                    # Guardar imagen en carpeta del paciente
-                    saved_path = save_image_to_patient_folder(img_path, nombre)
-                    resultados_img.append((saved_path, mean_rgb, std_rgb, area_lesion))
-                except Exception as e:
-                    registrar_error(e)
-                    messagebox.showerror("Error de imagen", 
-                                       f"Error procesando {os.path.basename(img_path)}:\n{str(e)}")
-                    return
-            
-            # Actualizar UI con resultados
-            self.area_var.set(f"{resultados_img[-1][3]:.2f}")
-            self.desv_var.set(f"{resultados_img[-1][2][0]:.2f}")
-            
-            # Obtener valores de entrada
-            sensibilidad = self.vars["Sensibilidad (0-6)"].get()
-            secrecion = self.vars["¿Secreción? (0=No, 1=Sí)"].get()
-            eritema = self.vars["¿Eritema? (0=No, 1=Sí)"].get()
-            tiempo_evol = self.vars["Tiempo de evolución (días, 0-35)"].get()
-            control_glu = self.vars["Control Glucémico (5-12)"].get()
-            
-            # Evaluar riesgo
-            riesgo = evaluar_riesgo(
-                sensibilidad,
-                resultados_img[-1][3],
-                resultados_img[-1][2][0],
-                secrecion,
-                eritema,
-                tiempo_evol,
-                control_glu
-            )
             
-            # Interpretar riesgo
-            if riesgo < 1.6:
-                color = "BAJO (verde)"
-            elif riesgo < 2.1:
-                color = "MODERADO (amarillo)"
-            else:
-                color = "ALTO (rojo)"
-                
-            # Actualizar UI
-            self.result_var.set(
-                f"Paciente: {nombre}\n"
-                f"Riesgo Calculado: {riesgo:.2f}\n"
-                f"Nivel de Riesgo: {color}"
-            )
-            self.pdf_btn.config(state="normal")
-            
-            # Calcular evolución si hay registro previo
-            evol_area = ""
-            evol_desv = ""
-            
-            if self.last_record is not None and not self.last_record.empty:
-                area_ant = self.last_record['AreaLesion'].iloc[0]
-                desv_ant = self.last_record['DesvEstR'].iloc[0]
-                
-                dif_area = resultados_img[-1][3] - area_ant
-                dif_desv = resultados_img[-1][2][0] - desv_ant
-                
-                evol_area = f" ({dif_area:+.2f})" if area_ant > 0 else ""
-                evol_desv = f" ({dif_desv:+.2f})" if desv_ant > 0 else ""
+            if self._procesando:
+                return
             
-            # Preparar registros para guardar
-            registros = []
+            # El cálculo de evolución necesita el último registro actualizado
+            self.resolver_busqueda_pendiente()
             
-            # Registro actual
-            registro_actual = {
-                'ID': next_id,
-                'FechaHora': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'Paciente': nombre,
-                'AreaLesion': resultados_img[-1][3],
-                'DesvEstR': resultados_img[-1][2][0],
-                'MediaR': resultados_img[-1][1][0],
-                'MediaG': resultados_img[-1][1][1],
-                'MediaB': resultados_img[-1][1][2],
-                'Secrecion': secrecion,
-                'Eritema': eritema,
-                'Sensibilidad': sensibilidad,
-                'TiempoEvol': tiempo_evol,
-                'ControlGlu': control_glu,
-                'Riesgo': riesgo,
-                'Semaforo': color,
-                'Imagen': resultados_img[-1][0],
-                'Comparacion': 'actual',
-                'EvolArea': evol_area,
-                'EvolDesv': evol_desv
+            # Fase 1 (hilo de Tk): datos clínicos y ROI, que requieren al operador
+            clinicos = {
+                'Sensibilidad': self.vars["Sensibilidad (0-6)"].get(),
+                'Secrecion': self.vars["¿Secreción? (0=No, 1=Sí)"].get(),
+                'Eritema': self.vars["¿Eritema? (0=No, 1=Sí)"].get(),
+                'TiempoEvol': self.vars["Tiempo de evolución (días, 0-35)"].get(),
+                'ControlGlu': self.vars["Control Glucémico (5-12)"].get(),
             }
-            registros.append(registro_actual)
+            modo_roi = self.modo_roi_var.get()
+            rects = [None] * len(self.img_paths)
+            if modo_roi != "auto":
+                for i, img_path in enumerate(self.img_paths):
+                    try:
+                        rects[i] = seleccionar_roi(img_path)
+                    except Exception as e:
+                        registrar_error(e)
+                        messagebox.showerror("Error de imagen", 
+                                           f"Error procesando {os.path.basename(img_path)}:\n{str(e)}")
+                        return
             
-            # Guardar en CSV
-            df_nuevo = pd.DataFrame(registros)
-            df = pd.concat([df, df_nuevo], ignore_index=True)
-            
-            if save_to_csv(df):
-                messagebox.showinfo("Éxito", "Datos guardados correctamente")
-                # Actualizar último registro
-                self.last_record = pd.DataFrame([registro_actual])
-                self.update_evolution_display()
-                self.update_image_display()
+            # Fase 2 (segundo plano): extracción, riesgo y guardado
+            self._procesando = True
+            self.analizar_btn.state(["disabled"])
+            self.result_var.set(f"Analizando {len(self.img_paths)} imagen(es)...")
+            futuro = self._ejecutor_visita.submit(
+                self._analizar_visita, nombre, list(self.img_paths), rects, modo_roi,
+                clinicos, self.last_record)
+            futuro.add_done_callback(lambda f: self.en_hilo_ui(self._visita_terminada, nombre, f))
             
         except Exception as e:
             registrar_error(e)
             messagebox.showerror("Error", f"Error en procesamiento:\n{str(e)}")
     
+    def _analizar_visita(self, nombre, img_paths, rects, modo_roi, clinicos, last_record):
+        """Hilo de trabajo: analiza todas las tomas a la vez y guarda la visita.
+        
+        Devuelve el registro guardado o None si el almacén lo rechazó.
+        """
+        futuros = [self._ejecutor_imagenes.submit(analizar_imagen, img_path, modo_roi, rect)
+                   for img_path, rect in zip(img_paths, rects)]
+        mediciones = []
+        for img_path, futuro in zip(img_paths, futuros):
+            try:
+                _, _, mean_rgb, std_rgb, area_lesion = futuro.result()
+            except Exception as e:
+                registrar_error(e)
+                raise ValueError(f"Error procesando {os.path.basename(img_path)}:\n{str(e)}") from e
+            mediciones.append((mean_rgb, std_rgb, area_lesion))
+        
+        mean_rgb, std_rgb, area_lesion = combinar_mediciones(mediciones)
+        
+        # Evaluar riesgo
+        riesgo = evaluar_riesgo(
+            clinicos['Sensibilidad'],
+            area_lesion,
+            std_rgb[0],
+            clinicos['Secrecion'],
+            clinicos['Eritema'],
+            clinicos['TiempoEvol'],
+            clinicos['ControlGlu']
+        )
+        
+        # Calcular evolución si hay registro previo
+        evol_area = ""
+        evol_desv = ""
+        
+        if last_record is not None and not last_record.empty:
+            area_ant = last_record['AreaLesion'].iloc[0]
+            desv_ant = last_record['DesvEstR'].iloc[0]
+            
+            dif_area = area_lesion - area_ant
+            dif_desv = std_rgb[0] - desv_ant
+            
+            evol_area = f" ({dif_area:+.2f})" if area_ant > 0 else ""
+            evol_desv = f" ({dif_desv:+.2f})" if desv_ant > 0 else ""
+        
+        # Guardar imágenes en carpeta del paciente; la principal es la de mayor área
+        saved_paths = [save_image_to_patient_folder(img_path, nombre) for img_path in img_paths]
+        principal = saved_paths[int(np.argmax([m[2] for m in mediciones]))]
+        
+        almacen = get_historial()
+        registro_actual = {
+            'ID': almacen.siguiente_id(),
+            'FechaHora': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'Paciente': nombre,
+            'AreaLesion': area_lesion,
+            'DesvEstR': std_rgb[0],
+            'MediaR': mean_rgb[0],
+            'MediaG': mean_rgb[1],
+            'MediaB': mean_rgb[2],
+            'Secrecion': clinicos['Secrecion'],
+            'Eritema': clinicos['Eritema'],
+            'Sensibilidad': clinicos['Sensibilidad'],
+            'TiempoEvol': clinicos['TiempoEvol'],
+            'ControlGlu': clinicos['ControlGlu'],
+            'Riesgo': riesgo,
+            'Semaforo': semaforo_riesgo(riesgo),
+            'Imagen': principal,
+            'Comparacion': 'actual',
+            'EvolArea': evol_area,
+            'EvolDesv': evol_desv,
+            'Imagenes': SEPARADOR_IMAGENES.join(saved_paths)
+        }
+        
+        # Guardar en el almacén
+        if not almacen.agregar([registro_actual]):
+            return None
+        return registro_actual
+    
+    def _visita_terminada(self, nombre, futuro):
+        """Hilo de Tk: muestra el resultado de la visita analizada"""
+        self._procesando = False
+        self.analizar_btn.state(["!disabled"])
+        
+        try:
+            registro = futuro.result()
+        except Exception as e:
+            self.result_var.set("Complete los datos y analice")
+            messagebox.showerror("Error", f"Error en procesamiento:\n{str(e)}")
+            return
+        
+        if registro is None:
+            self.result_var.set("Complete los datos y analice")
+            messagebox.showerror("Error de guardado", "No se pudo guardar los datos")
+            return
+        
+        # Actualizar UI con resultados
+        self.area_var.set(f"{registro['AreaLesion']:.2f}")
+        self.desv_var.set(f"{registro['DesvEstR']:.2f}")
+        self.result_var.set(
+            f"Paciente: {nombre}\n"
+            f"Riesgo Calculado: {registro['Riesgo']:.2f}\n"
+            f"Nivel de Riesgo: {registro['Semaforo']}"
+        )
+        self.pdf_btn.config(state="normal")
+        messagebox.showinfo("Éxito", "Datos guardados correctamente")
+        
+        if DETECTOR_TENDENCIAS is not None:
+            alertas = DETECTOR_TENDENCIAS.alertas_registro(registro['ID'])
+            if alertas:
+                messagebox.showwarning("Alerta de evolución",
+                                       f"Paciente: {nombre}\n" + "\n".join(a['Mensaje'] for a in alertas))
+            self.actualizar_alertas()
+        
+        # Actualizar último registro (si el operador no cambió de paciente)
+        if self.nombre_var.get().strip() == nombre:
+            self.last_record = pd.DataFrame([registro])
+            self.update_evolution_display()
+            self.update_image_display()
+    
     def generar_pdf(self):
-        """Genera reporte PDF con gráficos de evolución"""
+        """Genera reporte PDF con gráficos de evolución en segundo plano"""
         try:
             nombre = self.nombre_var.get().strip()
             if not nombre:
                 messagebox.showerror("Error", "No se ha especificado paciente")
                 return
-                
-            df = get_dataframe()
-            if df.empty:
-                messagebox.showerror("Error", "No hay datos disponibles")
-                return
-                
-            # Filtrar datos del paciente
-            df_paciente = df[df['Paciente'] == nombre]
-            if df_paciente.empty:
-                messagebox.showerror("Error", f"No se encontraron datos para {nombre}")
-                return
-                
-            # Generar gráfico de evolución
-            img_graph = None
-            if len(df_paciente) > 1:
-                try:
-                    img_graph = graficar_evolucion(df_paciente, nombre)
-                except Exception as e:
-                    registrar_error(e)
-                    img_graph = None
             
-            # Generar PDF
-            pdf_path = exportar_pdf(nombre, df_paciente, img_graph)
+            dialogo = DialogoProgreso(self, f"Reporte de {nombre}")
+            self._reportes_activos.add(dialogo)
             
-            if pdf_path:
-                messagebox.showinfo("PDF Generado", 
-                                  f"Reporte guardado en:\n{pdf_path}\n\n"
-                                  "Puede encontrarlo en su carpeta de Descargas")
-            else:
-                messagebox.showerror("Error", "No se pudo generar el PDF")
+            def progreso(fraccion, etapa):
+                self.en_hilo_ui(dialogo.actualizar, fraccion, etapa)
+            
+            futuro = self._ejecutor_reportes.submit(
+                self._construir_reporte, nombre, progreso, dialogo.cancelar)
+            futuro.add_done_callback(
+                lambda f: self.en_hilo_ui(self._reporte_terminado, nombre, dialogo, f))
                 
         except Exception as e:
             registrar_error(e)
             messagebox.showerror("Error", f"Error generando PDF:\n{str(e)}")
     
+    def _construir_reporte(self, nombre, progreso, cancelar):
+        """Hilo de trabajo: historial, gráfica y PDF. Devuelve la ruta o None"""
+        progreso(0.0, "Cargando historial")
+        df_paciente = get_historial().historial(nombre)
+        if df_paciente.empty:
+            raise LookupError(f"No se encontraron datos para {nombre}")
+        
+        # Generar gráfico de evolución
+        img_graph = None
+        if len(df_paciente) > 1:
+            if cancelar.is_set():
+                raise ReporteCancelado(nombre)
+            progreso(0.0, "Generando gráfica")
+            try:
+                img_graph = get_cache_reportes().grafica(nombre, df_paciente)
+            except Exception as e:
+                registrar_error(e)
+                img_graph = None
+        
+        return exportar_pdf(nombre, df_paciente, img_graph, progreso=progreso, cancelar=cancelar)
+    
+    def _reporte_terminado(self, nombre, dialogo, futuro):
+        """Hilo de Tk: cierra el progreso y muestra el resultado"""
+        self._reportes_activos.discard(dialogo)
+        if dialogo.winfo_exists():
+            dialogo.destroy()
+        
+        try:
+            pdf_path = futuro.result()
+        except ReporteCancelado:
+            return
+        except LookupError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        except Exception as e:
+            registrar_error(e)
+            messagebox.showerror("Error", f"Error generando PDF:\n{str(e)}")
+            return
+        
+        if pdf_path:
+            messagebox.showinfo("PDF Generado", 
+                              f"Reporte guardado en:\n{pdf_path}\n\n"
+                              "Puede encontrarlo en su carpeta de Descargas")
+        else:
+            messagebox.showerror("Error", f"No se pudo generar el PDF de {nombre}")
+    
     def limpiar(self):
         """Reinicia la interfaz para nuevo paciente"""
         self.nombre_var.set("")
@@ -1031,20 +4664,182 @@ class AppPieDiabetico(tk.Tk):
     def on_close(self):
         """Maneja el cierre de la aplicación"""
         if messagebox.askokcancel("Salir", "¿Está seguro que desea salir?"):
+            self._ejecutor_busqueda.shutdown(wait=False, cancel_futures=True)
+            for dialogo in self._reportes_activos:
+                dialogo.cancelar.set()
+            self._ejecutor_reportes.shutdown(wait=False, cancel_futures=True)
+            if self._ventana_camara is not None and self._ventana_camara.winfo_exists():
+                self._ventana_camara.cerrar()
+            self._ejecutor_visita.shutdown(wait=False, cancel_futures=True)
+            self._ejecutor_imagenes.shutdown(wait=False, cancel_futures=True)
+            if DETECTOR_TENDENCIAS is not None:
+                DETECTOR_TENDENCIAS.guardar(forzar=True)
             self.destroy()
 
+def main(argv=None):
+    """Punto de entrada de la aplicación"""
+    global INTERFAZ_GRAFICA, BACKEND_DATOS, BACKEND_GRAFICA, FORMATO_COLUMNAR
+    
+    parser = argparse.ArgumentParser(description="Healthy Foot - Evaluación de Pie Diabético")
+    parser.add_argument("--perfil-arranque", action="store_true",
+                        help="Muestra y registra en arranque.log los tiempos de arranque")
+    parser.add_argument("--importar-csv", metavar="CSV",
+                        help=f"Importa un CSV de resultados a {ARCHIVO_DB} y termina")
+    parser.add_argument("--backend", choices=["csv", "sqlite"],
+                        help=f"Almacén de evaluaciones (por defecto {BACKEND_DATOS})")
+    parser.add_argument("--grafica", choices=BACKENDS_GRAFICA,
+                        help=f"Gráfica de evolución en los PDF (por defecto {BACKEND_GRAFICA})")
+    parser.add_argument("--tabla-riesgo", action="store_true",
+                        help="Evalúa el riesgo con una tabla interpolada precalculada en "
+                             f"{CARPETA_CACHE}/ (motor exacto donde la tabla no es segura)")
+    parser.add_argument("--columnar", choices=FORMATOS_COLUMNARES + ["ninguno"],
+                        help=f"Copia binaria del CSV en {CARPETA_CACHE}/ (por defecto {FORMATO_COLUMNAR}; "
+                             "requiere pyarrow)")
+    comandos = parser.add_subparsers(dest="comando")
+    
+    lote = comandos.add_parser("lote", help="Analiza imágenes archivadas sin interfaz")
+    lote.add_argument("entrada", help="Carpeta de imágenes (p. ej. pacientes/) o manifiesto CSV/JSON")
+    lote.add_argument("--clinicos", metavar="ARCHIVO",
+                      help="CSV/JSON con los datos clínicos por Paciente")
+    lote.add_argument("--roi", choices=MODOS_ROI, default="auto",
+                      help="Modo de ROI; manual/asistido requieren la columna ROI")
+    lote.add_argument("--procesos", type=int, default=None,
+                      help="Procesos de trabajo (por defecto, núcleos disponibles)")
+    
+    reportes = comandos.add_parser("reportes", help="Genera reportes PDF de varios pacientes")
+    reportes.add_argument("--desde", metavar="AAAA-MM-DD",
+                          help="Incluye pacientes atendidos desde esta fecha")
+    reportes.add_argument("--hasta", metavar="AAAA-MM-DD",
+                          help="Incluye pacientes atendidos hasta esta fecha (inclusive)")
+    reportes.add_argument("--pacientes", nargs="+", metavar="NOMBRE",
+                          help="Limita el reporte a estos pacientes")
+    reportes.add_argument("--combinado", action="store_true",
+                          help="Un único PDF con tabla resumen en lugar de uno por paciente")
+    reportes.add_argument("--carpeta", help="Carpeta de salida (por defecto, Descargas)")
+    reportes.add_argument("--procesos", type=int, default=None,
+                          help="Procesos de trabajo (por defecto, núcleos disponibles)")
+    
+    cohorte = comandos.add_parser("cohorte", help="Analítica de todos los pacientes")
+    cohorte.add_argument("--desde", metavar="AAAA-MM-DD", help="Sólo visitas desde esta fecha")
+    cohorte.add_argument("--hasta", metavar="AAAA-MM-DD", help="Sólo visitas hasta esta fecha (inclusive)")
+    cohorte.add_argument("--salida", metavar="CSV", help="Guarda el resumen por paciente en un CSV")
+    
+    alertas = comandos.add_parser("alertas", help="Lista de trabajo de alertas de empeoramiento")
+    alertas.add_argument("--paciente", metavar="NOMBRE", help="Sólo alertas de este paciente")
+    alertas.add_argument("--todas", action="store_true", help="Incluye las alertas ya atendidas")
+    alertas.add_argument("--atender", nargs="+", type=int, metavar="N",
+                         help="Marca como atendidas las alertas con estos números")
+    alertas.add_argument("--reconstruir", action="store_true",
+                         help="Recalcula las tendencias desde el almacén (sin alertas históricas)")
+    
+    benchmark = comandos.add_parser("benchmark", help="Mide el rendimiento con datos sintéticos")
+    benchmark.add_argument("prueba", choices=["reporte", "cohorte", "carga"],
+                           help="reporte: preparación de filas del PDF; cohorte: analítica de cohorte; "
+                                "carga: lectura del historial en CSV y formatos columnares")
+    benchmark.add_argument("--visitas", type=int, default=None,
+                           help="Visitas sintéticas (por defecto 10000 en reporte y 100000 en cohorte y carga)")
+    
+    args = parser.parse_args(argv)
+    if args.backend:
+        BACKEND_DATOS = args.backend
+    if args.grafica:
+        BACKEND_GRAFICA = args.grafica
+    if args.columnar:
+        FORMATO_COLUMNAR = None if args.columnar == "ninguno" else args.columnar
+    
+    if args.importar_csv:
+        importadas = AlmacenSQLite(ARCHIVO_DB).importar_csv(args.importar_csv)
+        print(f"{importadas} evaluaciones importadas a {ARCHIVO_DB}")
+        return
+    
+    if args.comando == "lote":
+        INTERFAZ_GRAFICA = False
+        trabajos = cargar_lote(args.entrada, args.clinicos)
+        print(f"{len(trabajos)} imágenes por analizar")
+        _, errores = procesar_lote(trabajos, args.roi, args.procesos)
+        sys.exit(1 if errores else 0)
+    
+    if args.comando == "benchmark":
+        INTERFAZ_GRAFICA = False
+        if args.prueba == "reporte":
+            visitas = args.visitas or 10000
+            tiempos = medir_preparacion_reporte(visitas)
+            for nombre, segundos in tiempos.items():
+                print(f"{nombre:<10} {segundos * 1000:9.1f} ms ({visitas} visitas)")
+            print(f"Aceleración: {tiempos['iterrows'] / tiempos['columnar']:.1f}x")
+        elif args.prueba == "cohorte":
+            visitas = args.visitas or 100000
+            tiempos, diferencia = medir_analitica_cohorte(visitas)
+            for nombre, segundos in tiempos.items():
+                print(f"{nombre:<12} {segundos * 1000:9.1f} ms ({visitas} visitas)")
+            print(f"Aceleración: {tiempos['por_paciente'] / tiempos['vectorizada']:.1f}x; "
+                  f"diferencia pandas/SQLite: {diferencia:.2e}")
+        elif args.prueba == "carga":
+            visitas = args.visitas or 100000
+            print(f"{'formato':<16} {'carga':>10} {'memoria':>11} {'archivo':>11}  ({visitas} visitas)")
+            for nombre, (segundos, memoria, tamano) in medir_carga_evaluaciones(visitas).items():
+                print(f"{nombre:<16} {segundos * 1000:7.1f} ms {memoria / 2**20:7.1f} MiB {tamano / 2**20:7.1f} MiB")
+            if not COLUMNAR_DISPONIBLE:
+                print("pyarrow no está instalado: se omiten los formatos columnares")
+        return
+    
+    if args.comando == "cohorte":
+        INTERFAZ_GRAFICA = False
+        resumen, distribuciones = analitica_cohorte(desde=args.desde, hasta=args.hasta)
+        if resumen.empty:
+            print("No hay visitas en el periodo")
+            return
+        imprimir_cohorte(resumen, distribuciones)
+        if args.salida:
+            resumen.to_csv(args.salida)
+            print(f"Resumen por paciente guardado en {args.salida}")
+        return
+    
+    if args.comando == "alertas":
+        INTERFAZ_GRAFICA = False
+        detector = get_detector_tendencias()
+        if args.reconstruir:
+            detector.reconstruir(get_historial())
+        if args.atender:
+            print(f"{detector.atender(args.atender)} alertas marcadas como atendidas")
+            return
+        if args.todas:
+            lista = [dict(a) for a in reversed(detector.alertas)
+                     if args.paciente is None or a['Paciente'] == args.paciente]
+        else:
+            lista = detector.pendientes(args.paciente)
+        imprimir_alertas(lista)
+        return
+    
+    if args.comando == "reportes":
+        INTERFAZ_GRAFICA = False
+        exportar_reportes(args.pacientes, args.desde, args.hasta, args.combinado,
+                          args.procesos, args.carpeta)
+        return
+    
+    # Crear carpeta de pacientes si no existe
+    os.makedirs(CARPETA_PACIENTES, exist_ok=True)
+    
+    app = AppPieDiabetico()
+    
+    def ventana_visible():
+        registrar_tiempo_arranque("ventana visible", time.perf_counter() - INICIO_ARRANQUE)
+        # Los subsistemas pesados (motor difuso incluido) se cargan después de pintar la ventana
+        precargar_en_segundo_plano(al_terminar=precarga_completa, tabla_riesgo=args.tabla_riesgo)
+    
+    def precarga_completa():
+        registrar_tiempo_arranque("precarga completa", time.perf_counter() - INICIO_ARRANQUE)
+        if args.perfil_arranque:
+            escribir_reporte_arranque()
+    
+    app.after_idle(ventana_visible)
+    app.mainloop()
+
 if __name__ == "__main__":
     try:
-        # Crear carpeta de pacientes si no existe
-        os.makedirs("pacientes", exist_ok=True)
-        
-        # Inicializar sistema difuso en segundo plano
-        get_fuzzy_system()
-        
-        app = AppPieDiabetico()
-        app.mainloop()
+        main()
     except Exception as e:
         registrar_error(e)
         messagebox.showerror("Error Inesperado", 
                            f"Se produjo un error crítico:\n{str(e)}\n\n"
-                           "Consulte el archivo error.log para detalles")
\ No newline at end of file
+                           "Consulte el archivo error.log para detalles")
@@ -0,0 +1,22 @@
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+# winreg sólo existe en Windows; el módulo lo usa únicamente para la carpeta de Descargas
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))
+_ruta = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Reajustecamara.py")
+_spec = importlib.util.spec_from_file_location("Reajustecamara", _ruta)
+Reajustecamara = importlib.util.module_from_spec(_spec)
+sys.modules["Reajustecamara"] = Reajustecamara
+_spec.loader.exec_module(Reajustecamara)
+
+
+@pytest.fixture
+def rc(tmp_path, monkeypatch):
+    """Módulo de la aplicación trabajando en una carpeta temporal, sin diálogos"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Reajustecamara, "INTERFAZ_GRAFICA", False)
+    return Reajustecamara
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+
+def _registro(paciente, dia, area=1.0):
+    return {"Paciente": paciente, "FechaHora": f"2026-02-{dia:02d} 08:00:00", "AreaLesion": area}
+
+
+@pytest.fixture
+def almacen_sqlite(rc, tmp_path):
+    almacen = rc.AlmacenSQLite(str(tmp_path / "resultados_pacientes.db"))
+    yield almacen
+    almacen.cerrar()
+
+
+def test_importar_csv_heredado_con_columnas_faltantes_y_extra(rc, tmp_path, almacen_sqlite):
+    almacen_sqlite.agregar([_registro("Luis", 1)])
+    ruta = tmp_path / "resultados_pacientes.csv"
+    ruta.write_text("Fecha,Paciente,Area,Nivel_Riesgo,Imagenes,Notas\n"
+                    "2024-05-01 10:00:00,Ana,1.25,ALTO,a.jpg;b.jpg,control\n"
+                    "2024-05-08 10:00:00,Ana,1.0,BAJO,c.jpg,\n", encoding="utf-8")
+
+    assert almacen_sqlite.importar_csv(str(ruta)) == 2
+    df = almacen_sqlite.cargar()
+    assert list(df.columns) == rc.COLUMNAS_EVALUACION
+    ana = df[df["Paciente"] == "Ana"].reset_index(drop=True)
+    assert list(ana["ID"]) == [2, 3]
+    assert list(ana["Semaforo"].astype(str)) == ["ALTO (rojo)", "BAJO (verde)"]
+    assert list(ana["Imagen"]) == ["a.jpg", "c.jpg"]
+    assert list(ana["AreaLesion"]) == pytest.approx([1.25, 1.0])
+    assert (ana["Comparacion"].astype(str) == "actual").all()
+    assert ana["DesvEstR"].isna().all()
+
+    # Reimportar el mismo archivo conserva los IDs y no duplica filas
+    assert almacen_sqlite.importar_csv(str(ruta)) == 2
+    assert sorted(almacen_sqlite.cargar()["ID"]) == [1, 2, 3]
+    assert almacen_sqlite.siguiente_id() == 4
+
+
+def test_importar_csv_actual_respeta_ids_y_numera_los_faltantes(rc, tmp_path, almacen_sqlite):
+    ruta = tmp_path / "resultados_pacientes.csv"
+    ruta.write_text("ID,FechaHora,Paciente,AreaLesion,Semaforo,Extra\n"
+                    "7,2026-02-01 09:00:00,Ana,0.8,MODERADO (amarillo),x\n"
+                    ",2026-02-02 09:00:00,Luis,1.1,BAJO (verde),y\n", encoding="utf-8")
+
+    assert almacen_sqlite.importar_csv(str(ruta)) == 2
+    df = almacen_sqlite.cargar().set_index("Paciente")
+    assert df.loc["Ana", "ID"] == 7 and df.loc["Luis", "ID"] == 8
+    assert "Extra" not in df.columns
+    assert almacen_sqlite.siguiente_id() == 9
+
+
+def test_csv_anexa_con_fsync_y_compacta_cada_n_filas(rc, tmp_path, monkeypatch):
+    ruta = str(tmp_path / "resultados_pacientes.csv")
+    almacen = rc.AlmacenCSV(ruta, compactar_cada=3)
+    sincronizados = []
+    fsync = os.fsync
+    monkeypatch.setattr(rc.os, "fsync", lambda fd: sincronizados.append(fd) or fsync(fd))
+
+    almacen.agregar([_registro("Ana", 1)])
+    inodo = os.stat(ruta).st_ino
+    almacen.agregar([_registro("Ana", 2)])
+    # La segunda inserción sólo agrega al final del mismo archivo
+    assert os.stat(ruta).st_ino == inodo
+    assert sincronizados
+    with open(ruta, encoding="utf-8") as f:
+        assert f.read().count("\n") == 3
+
+    # La tercera alcanza compactar_cada y el archivo se reescribe de forma atómica
+    almacen.agregar([_registro("Luis", 3)])
+    assert os.stat(ruta).st_ino != inodo
+    assert list(almacen.cargar()["ID"]) == [1, 2, 3]
+    assert almacen._agregados == 0
+
+
+def test_csv_se_recupera_de_una_ultima_linea_truncada(rc, tmp_path):
+    ruta = str(tmp_path / "resultados_pacientes.csv")
+    rc.AlmacenCSV(ruta).agregar([_registro("Ana", 1), _registro("Ana", 2)])
+    # Escritura interrumpida a mitad de la fila
+    with open(ruta, "a", encoding="utf-8", newline="") as f:
+        f.write("3,2026-02-03 08:0")
+
+    almacen = rc.AlmacenCSV(ruta)
+    assert almacen.agregar([_registro("Luis", 4)])
+    with open(ruta, encoding="utf-8") as f:
+        lineas = f.read().splitlines()
+    assert lineas[-2] == "3,2026-02-03 08:0"
+    assert lineas[-1].startswith("4,2026-02-04 08:00:00,Luis,")
+
+    df = almacen.cargar()
+    assert list(df.loc[df["Paciente"].notna(), "ID"]) == [1, 2, 4]
+    # Al compactar se descarta la fila incompleta
+    almacen.compactar()
+    df = almacen.cargar()
+    assert list(df["ID"]) == [1, 2, 4]
+    assert list(df["Paciente"].astype(str)) == ["Ana", "Ana", "Luis"]
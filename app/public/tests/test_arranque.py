@@ -0,0 +1,46 @@
+import threading
+from concurrent.futures import Future
+
+ENTRADAS = (3.0, 1.2, 1.8, 0, 1, 10.0, 7.5)
+
+
+def test_evaluar_riesgo_espera_la_carga_del_motor(rc, monkeypatch):
+    exacto = rc.evaluar_riesgo(*ENTRADAS)
+    carga = Future()
+    monkeypatch.setattr(rc, "CARGA_MOTOR", carga)
+
+    resultado = []
+    hilo = threading.Thread(target=lambda: resultado.append(rc.evaluar_riesgo(*ENTRADAS)))
+    hilo.start()
+    hilo.join(0.2)
+    assert hilo.is_alive() and not resultado
+
+    carga.set_result(None)
+    hilo.join(5)
+    assert resultado == [exacto]
+
+
+def test_evaluar_riesgo_tras_fallar_la_carga(rc, monkeypatch):
+    carga = Future()
+    carga.set_exception(RuntimeError("caché ilegible"))
+    monkeypatch.setattr(rc, "CARGA_MOTOR", carga)
+    # El motor se obtiene bajo demanda y no se devuelve el valor por defecto
+    assert 1.0 <= rc.evaluar_riesgo(*ENTRADAS) <= 3.0
+
+
+def test_precarga_carga_el_motor_fuera_del_hilo_principal(rc, monkeypatch):
+    monkeypatch.setattr(rc, "MODULOS_PRECARGA", [])
+    hilos = []
+    original = rc.get_motor_difuso
+
+    def get_motor_difuso():
+        hilos.append(threading.current_thread())
+        return original()
+
+    monkeypatch.setattr(rc, "get_motor_difuso", get_motor_difuso)
+    terminado = threading.Event()
+    rc.precargar_en_segundo_plano(al_terminar=terminado.set)
+    assert terminado.wait(60)
+    assert rc.CARGA_MOTOR.done() and rc.CARGA_MOTOR.exception() is None
+    assert hilos and threading.main_thread() not in hilos
+    monkeypatch.setattr(rc, "CARGA_MOTOR", None)
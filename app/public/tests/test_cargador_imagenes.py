@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("cv2")
+
+
+def _jpeg_rotado(ruta, ancho=400, alto=300):
+    """JPEG almacenado en ancho x alto con Orientation=6 (se muestra girado 90°)"""
+    pixeles = np.zeros((alto, ancho, 3), dtype=np.uint8)
+    pixeles[:, : ancho // 2] = (255, 0, 0)
+    imagen = Image.fromarray(pixeles)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    imagen.save(ruta, "JPEG", exif=exif.tobytes())
+
+
+def test_reducida_respeta_orientacion_exif(rc, tmp_path):
+    ruta = str(tmp_path / "telefono.jpg")
+    _jpeg_rotado(ruta)
+    cargador = rc.CargadorImagenes()
+
+    completa = cargador.completa(ruta)
+    assert completa.shape[:2] == (400, 300)
+
+    cargador.limpiar()
+    proxy, escala = cargador.reducida(ruta, lado_max=100)
+    # Mismas proporciones que la imagen completa orientada, sin deformar
+    assert proxy.shape[:2] == (100, 75)
+    assert escala == pytest.approx(0.25)
+    # Un rectángulo de todo el proxy cubre toda la imagen completa
+    assert round(proxy.shape[1] / escala) == completa.shape[1]
+    assert round(proxy.shape[0] / escala) == completa.shape[0]
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def test_pendientes_pandas_y_sqlite_coinciden(rc, tmp_path):
+    df = rc.generar_cohorte_sintetica(2000, pacientes=40, semilla=3)
+    # Un paciente con una sola visita y una visita sin fecha válida
+    df.loc[len(df)] = dict(df.iloc[0], ID=len(df) + 1, Paciente="Unico")
+    df.loc[len(df)] = dict(df.iloc[0], ID=len(df) + 1, FechaHora="sin fecha")
+
+    almacen = rc.AlmacenSQLite(str(tmp_path / "cohorte.db"))
+    assert almacen.agregar(df.to_dict("records"))
+
+    for desde, hasta in [(None, None), ("2021-06-01", "2022-12-31")]:
+        resumen, _ = rc.analitica_cohorte(df, desde, hasta)
+        sql = rc.velocidad_cicatrizacion_sql(almacen, desde, hasta)
+        assert list(sql.index) == list(resumen.index)
+        assert (sql["Visitas"] == resumen["Visitas"]).all()
+        for columna in ["PendienteArea", "PendienteDesv"]:
+            assert np.allclose(sql[columna], resumen[columna], rtol=1e-6, atol=1e-9, equal_nan=True)
+
+    # Comparadas además con un ajuste por paciente sobre todo el historial
+    resumen, _ = rc.analitica_cohorte(df)
+    assert np.isnan(resumen.loc["Unico", "PendienteArea"])
+    datos = rc._preparar_cohorte(df)
+    paciente = datos[datos["Paciente"] == "Paciente_7"]
+    esperado = np.polyfit(paciente["Dias"], paciente["AreaLesion"], 1)[0]
+    assert resumen.loc["Paciente_7", "PendienteArea"] == pytest.approx(esperado)
+    almacen.cerrar()
+
+
+def test_consulta_publica_del_almacen(rc, tmp_path):
+    almacen = rc.AlmacenSQLite(str(tmp_path / "consulta.db"))
+    almacen.agregar([{"Paciente": "Ana", "FechaHora": "2026-01-01 10:00:00", "AreaLesion": 1.5}])
+    resultado = almacen.consulta("SELECT Paciente, AreaLesion FROM evaluaciones WHERE Paciente = ?", ("Ana",))
+    assert isinstance(resultado, pd.DataFrame)
+    assert resultado.to_dict("records") == [{"Paciente": "Ana", "AreaLesion": 1.5}]
+    almacen.cerrar()
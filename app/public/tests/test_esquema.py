@@ -0,0 +1,97 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def _evaluaciones(rc, n=6):
+    df = pd.DataFrame({
+        "ID": range(1, n + 1),
+        "FechaHora": [f"2026-03-{d:02d} 09:30:00" for d in range(1, n + 1)],
+        "Paciente": ["Ana", "Luis"] * (n // 2),
+        "AreaLesion": np.linspace(0.1, 3.7, n),
+        "DesvEstR": np.linspace(10.25, 30.5, n),
+        "Riesgo": np.linspace(1.1, 2.9, n),
+        "Semaforo": ["BAJO (verde)", "ALTO (rojo)"] * (n // 2),
+        "Imagen": [f"pacientes/Ana/{i}.jpg" for i in range(n)],
+        "Comparacion": "actual",
+        "EvolArea": [""] + [f" ({v:+.2f})" for v in np.linspace(-0.5, 0.5, n - 1)],
+    })
+    df["Imagenes"] = df["Imagen"]
+    if n > 3:
+        df.loc[2, "AreaLesion"] = np.nan
+        df.loc[3, "FechaHora"] = ""
+    for col in rc.COLUMNAS_EVALUACION:
+        if col not in df.columns:
+            df[col] = None
+    return rc.tipar_evaluaciones(df[rc.COLUMNAS_EVALUACION])
+
+
+def test_esquema_sobrevive_a_escribir_y_leer_el_csv(rc, tmp_path):
+    original = _evaluaciones(rc)
+    ruta = str(tmp_path / "evaluaciones.csv")
+    rc.escribir_csv_atomico(original, ruta)
+    leido = rc._leer_csv_evaluaciones(ruta)
+
+    for col, tipo in rc.ESQUEMA_EVALUACION.items():
+        assert str(leido[col].dtype) == tipo, col
+    pd.testing.assert_frame_equal(leido[original.columns], original, check_categorical=False)
+    assert pd.isna(leido.loc[3, "FechaHora"]) and pd.isna(leido.loc[2, "AreaLesion"])
+    assert leido.loc[0, "EvolArea"] != leido.loc[0, "EvolArea"]  # Sin evolución: NaN
+    assert leido.loc[1, "EvolArea"] == pytest.approx(-0.5)
+
+
+@pytest.fixture
+def csv_columnar(rc, tmp_path):
+    pytest.importorskip("pyarrow")
+    ruta = str(tmp_path / "datos" / "resultados_pacientes.csv")
+    os.makedirs(os.path.dirname(ruta))
+    rc.escribir_csv_atomico(_evaluaciones(rc, n=200), ruta)
+    return ruta
+
+
+def test_copia_columnar_detecta_edicion_sin_cambio_de_filas(rc, tmp_path, csv_columnar):
+    carpeta = str(tmp_path / "cache")
+    primera = rc.cargar_csv_columnar(csv_columnar, carpeta, "feather")
+    assert os.path.exists(rc.ruta_copia_columnar(csv_columnar, carpeta, "feather"))
+    pd.testing.assert_frame_equal(rc.cargar_csv_columnar(csv_columnar, carpeta, "feather"), primera)
+
+    # Mismas filas y bytes, otro paciente en la segunda fila (lejos del final del archivo)
+    with open(csv_columnar, encoding="utf-8") as f:
+        lineas = f.read().split("\n")
+    assert "Luis" in lineas[2]
+    lineas[2] = lineas[2].replace("Luis", "Rosa")
+    with open(csv_columnar, "w", encoding="utf-8", newline="") as f:
+        f.write("\n".join(lineas))
+
+    editada = rc.cargar_csv_columnar(csv_columnar, carpeta, "feather")
+    assert editada.loc[1, "Paciente"] == "Rosa"
+    assert len(editada) == len(primera)
+
+
+def test_copia_columnar_lee_solo_las_filas_anexadas(rc, tmp_path, csv_columnar, monkeypatch):
+    carpeta = str(tmp_path / "cache")
+    rc.cargar_csv_columnar(csv_columnar, carpeta, "parquet")
+    with open(csv_columnar, "a", encoding="utf-8", newline="") as f:
+        f.write("201,2026-03-09 09:30:00,Ana,0.5,12.0" + "," * (len(rc.COLUMNAS_EVALUACION) - 5) + "\n")
+
+    lecturas = []
+    original = rc._leer_csv_evaluaciones
+    monkeypatch.setattr(rc, "_leer_csv_evaluaciones",
+                        lambda fuente, **opciones: lecturas.append(opciones) or original(fuente, **opciones))
+    df = rc.cargar_csv_columnar(csv_columnar, carpeta, "parquet")
+    assert len(df) == 201 and df.loc[200, "AreaLesion"] == pytest.approx(0.5)
+    assert [opciones.get("header") for opciones in lecturas] == [None]
+
+
+def test_copia_columnar_por_ruta_completa(rc, tmp_path, csv_columnar):
+    carpeta = str(tmp_path / "cache")
+    otro = str(tmp_path / "otra" / "resultados_pacientes.csv")
+    os.makedirs(os.path.dirname(otro))
+    rc.escribir_csv_atomico(_evaluaciones(rc, n=2), otro)
+
+    assert rc.ruta_copia_columnar(csv_columnar, carpeta) != rc.ruta_copia_columnar(otro, carpeta)
+    assert len(rc.cargar_csv_columnar(csv_columnar, carpeta, "feather")) == 200
+    assert len(rc.cargar_csv_columnar(otro, carpeta, "feather")) == 2
+    assert len(rc.cargar_csv_columnar(csv_columnar, carpeta, "feather")) == 200
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+
+def _registro(paciente, dia, area=1.0):
+    return {"Paciente": paciente, "FechaHora": f"2026-02-{dia:02d} 08:00:00", "AreaLesion": area,
+            "DesvEstR": 10.0, "Riesgo": 1.5, "Semaforo": "BAJO (verde)", "Comparacion": "actual"}
+
+
+@pytest.fixture(params=["csv", "sqlite"])
+def almacenes(rc, tmp_path, request):
+    """Dos almacenes sobre el mismo archivo, como la interfaz y el comando lote"""
+    if request.param == "csv":
+        ruta = str(tmp_path / "resultados_pacientes.csv")
+        return rc.AlmacenCSV(ruta), rc.AlmacenCSV(ruta)
+    ruta = str(tmp_path / "resultados_pacientes.db")
+    return rc.AlmacenSQLite(ruta), rc.AlmacenSQLite(ruta)
+
+
+def test_recarga_tras_escritura_de_otro_proceso(rc, almacenes):
+    propio, otro = almacenes
+    historial = rc.CacheHistorial(propio)
+    assert historial.agregar([_registro("Ana", 1)])
+    assert len(historial.historial("Ana")) == 1
+
+    assert otro.agregar([_registro("Ana", 2), _registro("Luis", 2)])
+    assert list(historial.historial("Ana")["FechaHora"].dt.day) == [1, 2]
+    assert len(historial.ultimo("Luis")) == 1
+    assert len(historial.cargar()) == 3
+
+
+def test_agregar_no_oculta_una_escritura_concurrente(rc, almacenes, monkeypatch):
+    propio, otro = almacenes
+    historial = rc.CacheHistorial(propio)
+    historial.agregar([_registro("Ana", 1)])
+    historial.cargar()
+
+    # El otro proceso escribe justo después de la verificación y antes del guardado propio
+    original = propio.agregar
+
+    def agregar_con_carrera(registros, *args):
+        otro.agregar([_registro("Luis", 3)])
+        return original(registros, *args)
+
+    monkeypatch.setattr(propio, "agregar", agregar_con_carrera)
+    assert historial.agregar([_registro("Ana", 4)])
+
+    df = historial.cargar()
+    assert sorted(df["Paciente"].astype(str)) == ["Ana", "Ana", "Luis"]
+    assert len(historial.historial("Luis")) == 1
+    assert df["ID"].is_unique
+
+
+def test_ids_unicos_con_dos_escritores(rc, almacenes):
+    propio, otro = almacenes
+    assert propio.siguiente_id() == otro.siguiente_id() == 1
+
+    def guardar(almacen, paciente):
+        for dia in range(1, 26):
+            registro = dict(_registro(paciente, dia), ID=almacen.siguiente_id())
+            assert almacen.agregar([registro])
+
+    hilos = [threading.Thread(target=guardar, args=(almacen, paciente))
+             for almacen, paciente in [(propio, "Ana"), (otro, "Luis")]]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    ids = propio.cargar()["ID"]
+    assert sorted(ids) == list(range(1, 51))
+
+
+def test_agregar_escribe_el_id_asignado(rc, almacenes):
+    propio, otro = almacenes
+    otro.agregar([_registro("Luis", 1)])
+    registro = dict(_registro("Ana", 2), ID=1)
+    assert propio.agregar([registro])
+    assert registro["ID"] == 2
+    assert propio.siguiente_id() == 3
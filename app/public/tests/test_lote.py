@@ -0,0 +1,79 @@
+import io
+import json
+import os
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+CLINICOS = {"Sensibilidad": 3, "Secrecion": 0, "Eritema": 1, "TiempoEvol": 10, "ControlGlu": 7.5}
+
+
+def _imagen(ruta):
+    """Piel con una lesión roja circular"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    img = np.full((200, 200, 3), (150, 180, 220), np.uint8)
+    cv2.circle(img, (100, 100), 40, (40, 40, 200), -1)
+    cv2.imwrite(str(ruta), img)
+    return str(ruta)
+
+
+def test_manifiesto_csv_con_datos_clinicos_por_paciente(rc, tmp_path):
+    _imagen(tmp_path / "pacientes" / "Ana" / "v1.png")
+    _imagen(tmp_path / "pacientes" / "Luis" / "v1.png")
+    manifiesto = tmp_path / "lote.csv"
+    manifiesto.write_text("Imagen,Paciente,ROI,Eritema,FechaHora\n"
+                          "pacientes/Ana/v1.png,Ana,\"10,20,30,40\",0,2026-03-01 08:00:00\n"
+                          "pacientes/Luis/v1.png,,,,\n", encoding="utf-8")
+    clinicos = tmp_path / "clinicos.json"
+    clinicos.write_text(json.dumps([dict(CLINICOS, Paciente="Ana"), dict(CLINICOS, Paciente="Luis", Eritema=1)]),
+                        encoding="utf-8")
+
+    ana, luis = rc.cargar_lote(str(manifiesto), str(clinicos))
+    # Rutas relativas al manifiesto y paciente deducido de la carpeta
+    assert ana["Imagen"] == str(tmp_path / "pacientes" / "Ana" / "v1.png")
+    assert luis["Paciente"] == "Luis" and os.path.isabs(luis["Imagen"])
+    # Los valores del manifiesto tienen prioridad sobre los datos clínicos
+    assert ana["Eritema"] == 0 and luis["Eritema"] == 1
+    assert ana["ControlGlu"] == 7.5 and luis["TiempoEvol"] == 10
+    assert rc._parsear_roi(ana["ROI"]) == (10, 20, 30, 40)
+    assert rc._parsear_roi(luis["ROI"]) is None
+    assert ana["FechaHora"] == "2026-03-01 08:00:00"
+
+
+def test_carpeta_omite_la_cache_de_miniaturas(rc, tmp_path):
+    _imagen(tmp_path / "pacientes" / "Ana" / "v1.png")
+    _imagen(tmp_path / "pacientes" / "Ana" / rc.CARPETA_MINIATURAS / "v1.png")
+    _imagen(tmp_path / "pacientes" / ".oculta" / "v1.png")
+    (tmp_path / "pacientes" / "Ana" / "notas.txt").write_text("", encoding="utf-8")
+
+    trabajos = rc.cargar_lote(str(tmp_path / "pacientes"))
+    assert [(t["Paciente"], os.path.basename(t["Imagen"])) for t in trabajos] == [("Ana", "v1.png")]
+    assert trabajos[0]["Sensibilidad"] is None
+
+
+def test_procesar_lote_informa_cada_error_sin_detener_el_lote(rc, tmp_path, monkeypatch):
+    for nombre in ["ALMACEN", "HISTORIAL", "DETECTOR_TENDENCIAS"]:
+        monkeypatch.setattr(rc, nombre, None)
+    monkeypatch.setattr(rc, "BACKEND_DATOS", "csv")
+    imagen = _imagen(tmp_path / "pacientes" / "Ana" / "v1.png")
+    trabajos = [
+        dict(CLINICOS, Imagen=imagen, Paciente="Ana"),
+        dict(CLINICOS, Imagen=str(tmp_path / "pacientes" / "Ana" / "falta.png"), Paciente="Ana"),
+        dict(CLINICOS, Imagen=imagen, Paciente="Luis", Sensibilidad=None),
+    ]
+
+    salida = io.StringIO()
+    assert rc.procesar_lote(trabajos, procesos=1, salida=salida) == (1, 2)
+    lineas = salida.getvalue().splitlines()
+    assert any("v1.png: Ana riesgo=" in linea for linea in lineas)
+    assert any("falta.png: ERROR FileNotFoundError" in linea for linea in lineas)
+    assert any("v1.png: ERROR ValueError: Faltan datos clínicos: Sensibilidad" in linea for linea in lineas)
+    assert lineas[-1].startswith("Lote terminado: 1 guardados, 2 con error")
+
+    with open(tmp_path / "error.log", encoding="utf-8") as f:
+        log = f.read()
+    assert log.count("--- ERROR LOTE") == 2 and "falta.png" in log
+    df = rc.get_historial().cargar()
+    assert list(df["Paciente"].astype(str)) == ["Ana"]
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("skfuzzy")
+
+# Sensibilidad disminuida, lesión pequeña y baja dispersión, sin secreción ni
+# eritema, evolución intermedia y control regular: ninguna regla se activa
+SIN_REGLAS = (3.0, 0.4, 0.9, 0, 0, 16.0, 7.6)
+
+
+def _skfuzzy(rc, fila):
+    """Riesgo con ControlSystemSimulation (NaN si skfuzzy no puede defuzzificar)"""
+    simulacion = rc.ctrl.ControlSystemSimulation(rc.get_fuzzy_system())
+    for var_name, valor in zip(rc.VARIABLES_ENTRADA, fila):
+        simulacion.input[var_name] = valor
+    try:
+        simulacion.compute()
+        return simulacion.output["Riesgo"]
+    except Exception:
+        return np.nan
+
+
+def test_motor_vectorizado_igual_a_skfuzzy(rc):
+    rng = np.random.default_rng(7)
+    entradas = rc.preparar_entradas(*[
+        rng.uniform(*rc.UNIVERSOS[var_name], size=150) for var_name in rc.VARIABLES_ENTRADA
+    ])
+    # Incluir los vértices de las funciones de membresía, donde cambian las reglas activas
+    entradas[:6, 0] = [0, 1, 2, 4, 5, 6]
+    entradas[6:12, 1] = [0, 0.3, 0.5, 0.7, 1.8, 2.5]
+
+    vectorizado = rc.get_motor_difuso().evaluar(entradas)
+    referencia = np.array([_skfuzzy(rc, fila) for fila in entradas])
+    assert np.array_equal(np.isnan(vectorizado), np.isnan(referencia))
+    activas = ~np.isnan(referencia)
+    assert activas.sum() > 100
+    assert np.max(np.abs(vectorizado[activas] - referencia[activas])) <= rc.TOLERANCIA_MOTOR
+
+
+def test_sin_reglas_activas_se_usa_el_valor_por_defecto(rc):
+    entradas = rc.preparar_entradas(*SIN_REGLAS)
+    assert np.isnan(rc.get_motor_difuso().evaluar(entradas)[0])
+    assert np.isnan(_skfuzzy(rc, entradas[0]))
+
+    assert rc.evaluar_riesgo_lote(*SIN_REGLAS)[0] == 2.0
+    assert np.isnan(rc.evaluar_riesgo_lote(*SIN_REGLAS, valor_sin_reglas=np.nan)[0])
+    assert rc.evaluar_riesgo(*SIN_REGLAS) == 2.0
+
+
+def test_evaluar_riesgo_lote_acota_y_binariza(rc):
+    fuera = rc.evaluar_riesgo_lote([-1.0, 9.0], [5.0, -2.0], 0.5, [0.7, 0.2], [0.49, 0.51], 50.0, 3.0)
+    dentro = rc.evaluar_riesgo_lote([0.0, 6.0], [4.0, 0.0], 0.5, [1, 0], [0, 1], 35.0, 5.0)
+    assert np.array_equal(fuera, dentro)
+    assert np.all((fuera >= 1.0) & (fuera <= 3.0))
+
+
+def test_cache_del_motor_se_invalida_al_cambiar_las_reglas(rc, monkeypatch):
+    compilaciones = []
+    compilar = rc.MotorDifusoVectorizado.compilar
+    monkeypatch.setattr(rc.MotorDifusoVectorizado, "compilar",
+                        classmethod(lambda cls: compilaciones.append(1) or compilar()))
+
+    monkeypatch.setattr(rc, "MOTOR_DIFUSO", None)
+    original = rc.get_motor_difuso()
+    ruta = rc.ruta_cache_motor()
+    assert os.path.exists(ruta) and len(compilaciones) == 1
+
+    # Segundo arranque con las mismas reglas: se lee la caché
+    monkeypatch.setattr(rc, "MOTOR_DIFUSO", None)
+    rc.get_motor_difuso()
+    assert len(compilaciones) == 1
+
+    # Una regla nueva cambia la huella: la caché anterior no se reutiliza
+    monkeypatch.setattr(rc, "REGLASTEXT", rc.REGLASTEXT + "0 0 0 0 0 0 2, 2\n")
+    monkeypatch.setattr(rc, "MOTOR_DIFUSO", None)
+    assert rc.ruta_cache_motor() != ruta
+    nuevo = rc.get_motor_difuso()
+    assert len(compilaciones) == 2 and os.path.exists(rc.ruta_cache_motor())
+    entradas = rc.preparar_entradas(*SIN_REGLAS)
+    assert np.isnan(original.evaluar(entradas)[0])
+    assert nuevo.evaluar(entradas)[0] == pytest.approx(2.0)
+
+    # También al cambiar una función de membresía o la versión del formato
+    rutas = {ruta, rc.ruta_cache_motor()}
+    monkeypatch.setitem(rc.PARAMETROS_MF["Area"], "Pequena", ("trapmf", [0, 0, 0.4, 0.7]))
+    rutas.add(rc.ruta_cache_motor())
+    monkeypatch.setattr(rc, "VERSION_CACHE_MOTOR", rc.VERSION_CACHE_MOTOR + 1)
+    rutas.add(rc.ruta_cache_motor())
+    assert len(rutas) == 4
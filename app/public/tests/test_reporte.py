@@ -0,0 +1,79 @@
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("fpdf")
+
+
+@pytest.fixture
+def temporales(tmp_path, monkeypatch):
+    """Carpeta temporal propia para comprobar que el reporte no deja archivos"""
+    carpeta = tmp_path / "tmp"
+    carpeta.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(carpeta))
+    return carpeta
+
+
+def _historial(rc, tmp_path):
+    imagenes = []
+    for n, radio in enumerate([40, 30]):
+        ruta = tmp_path / "pacientes" / "Ana" / f"v{n}.jpg"
+        os.makedirs(ruta.parent, exist_ok=True)
+        img = np.full((200, 200, 3), (150, 180, 220), np.uint8)
+        cv2.circle(img, (100, 100), radio, (40, 40, 200), -1)
+        cv2.imwrite(str(ruta), img)
+        imagenes.append(str(ruta))
+    # La tercera visita apunta a una imagen que ya no existe
+    imagenes.append(str(tmp_path / "pacientes" / "Ana" / "borrada.jpg"))
+
+    df = pd.DataFrame({
+        "ID": [1, 2, 3],
+        "FechaHora": ["2026-03-01 09:00:00", "2026-03-08 09:00:00", "2026-03-15 09:00:00"],
+        "Paciente": "Ana",
+        "AreaLesion": [1.2, 0.9, 0.7],
+        "DesvEstR": [20.0, 18.0, 15.0],
+        "Riesgo": [2.4, 2.0, 1.6],
+        "Semaforo": ["ALTO (rojo)", "MODERADO (amarillo)", "BAJO (verde)"],
+        "Imagen": imagenes,
+        "Comparacion": "actual",
+    })
+    df["Imagenes"] = df["Imagen"]
+    for col in rc.COLUMNAS_EVALUACION:
+        if col not in df.columns:
+            df[col] = None
+    return rc.tipar_evaluaciones(df[rc.COLUMNAS_EVALUACION])
+
+
+def test_exportar_pdf_no_deja_archivos_temporales(rc, tmp_path, temporales):
+    df = _historial(rc, tmp_path)
+    salida = tmp_path / "reportes"
+    salida.mkdir()
+
+    ruta = rc.exportar_pdf("Ana", df, rc.preparar_grafica(df, "Ana"), carpeta=str(salida))
+    assert ruta is not None and os.path.dirname(ruta) == str(salida)
+    with open(ruta, "rb") as f:
+        assert f.read(5) == b"%PDF-"
+    assert os.listdir(salida) == [os.path.basename(ruta)]
+    assert os.listdir(temporales) == []
+    assert not list((tmp_path / "pacientes").rglob("*.pdf"))
+
+
+def test_exportar_pdf_cancelado_no_deja_archivos(rc, tmp_path, temporales):
+    df = _historial(rc, tmp_path)
+    salida = tmp_path / "reportes"
+    salida.mkdir()
+    cancelar = threading.Event()
+
+    def progreso(fraccion, etapa):
+        if etapa.startswith("Imagen"):
+            cancelar.set()
+
+    with pytest.raises(rc.ReporteCancelado):
+        rc.exportar_pdf("Ana", df, None, progreso=progreso, cancelar=cancelar, carpeta=str(salida))
+    assert os.listdir(salida) == []
+    assert os.listdir(temporales) == []
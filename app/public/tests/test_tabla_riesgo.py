@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+
+def _ejes(rc, puntos=3):
+    return [np.linspace(*rc.UNIVERSOS[var_name], puntos) for var_name in rc.VARIABLES_TABLA]
+
+
+def _tabla_lineal(rc, ejes):
+    """Riesgo = 1 + suma ponderada de las entradas: la interpolación multilineal es exacta"""
+    mallas = np.meshgrid([0.0, 1.0], [0.0, 1.0], *ejes, indexing="ij")
+    return 1.0 + sum(0.01 * (k + 1) * malla for k, malla in enumerate(mallas))
+
+
+def _consulta(valores):
+    return (valores["Sensibilidad"], valores["Area"], valores["DesvEstR"], valores["Secrecion"],
+            valores["Eritema"], valores["TiempoEvol"], valores["ControlGlu"])
+
+
+def test_consulta_interpola_y_omite_celdas_no_seguras(rc):
+    ejes = _ejes(rc)
+    tabla = _tabla_lineal(rc, ejes)
+    segura = np.ones((2, 2) + tuple(eje.size - 1 for eje in ejes), dtype=bool)
+    segura[1, 0, 0, 0, 0, 0, 0] = False
+    tabla_riesgo = rc.TablaRiesgo(ejes, tabla, segura)
+
+    valores = {"Sensibilidad": 4.5, "Area": 3.1, "DesvEstR": 0.7, "Secrecion": 0, "Eritema": 1,
+               "TiempoEvol": 30.0, "ControlGlu": 6.0}
+    esperado = 1.0 + 0.01 * 2 + sum(0.01 * (k + 3) * valores[var_name]
+                                    for k, var_name in enumerate(rc.VARIABLES_TABLA))
+    assert tabla_riesgo.consultar(*_consulta(valores)) == pytest.approx(esperado)
+
+    no_segura = dict(valores, Secrecion=1, Eritema=0, Sensibilidad=1.0, Area=1.0, DesvEstR=1.0,
+                     TiempoEvol=10.0, ControlGlu=6.0)
+    assert tabla_riesgo.consultar(*_consulta(no_segura)) is None
+
+    lote = tabla_riesgo.consultar_lote(np.array([_consulta(valores), _consulta(no_segura)]))
+    assert lote[0] == pytest.approx(esperado)
+    assert np.isnan(lote[1])
+
+
+def test_celdas_seguras_excluye_discontinuidades_y_cruces_de_banda(rc):
+    ejes = [np.array([0.0, 1.0, 2.0])] * len(rc.VARIABLES_TABLA)
+    forma_nodos = (2, 2) + (3,) * len(ejes)
+    forma_celdas = (2, 2) + (2,) * len(ejes)
+    nodos = np.full(forma_nodos, 1.2)
+    centros = np.full(forma_celdas, 1.2)
+
+    # Esquina sin reglas activas, centro sin reglas, cruce de banda y variación grande
+    nodos[0, 0, 0, 0, 0, 0, 0] = np.nan
+    centros[0, 1, 0, 0, 0, 0, 0] = np.nan
+    nodos[1, 0, 2, 2, 2, 2, 2] = rc.UMBRAL_RIESGO_BAJO + 0.01
+    nodos[1, 1, 2, 2, 2, 2, 2] = 1.2 + 0.5
+
+    segura = rc.TablaRiesgo.celdas_seguras(nodos, centros, tolerancia=0.05)
+    assert segura.shape == forma_celdas
+    assert not segura[0, 0, 0, 0, 0, 0, 0]
+    assert not segura[0, 1, 0, 0, 0, 0, 0]
+    assert not segura[1, 0, 1, 1, 1, 1, 1]
+    assert not segura[1, 1, 1, 1, 1, 1, 1]
+    assert segura.sum() == segura.size - 4
+
+
+def test_evaluar_riesgo_usa_el_motor_exacto_fuera_de_la_tabla(rc, monkeypatch):
+    ejes = _ejes(rc)
+    forma_celdas = (2, 2) + tuple(eje.size - 1 for eje in ejes)
+    entradas = (3.0, 1.2, 1.8, 0, 1, 10.0, 7.5)
+    exacto = rc.evaluar_riesgo(*entradas)
+
+    constante = np.full((2, 2) + tuple(eje.size for eje in ejes), 1.234)
+    monkeypatch.setattr(rc, "TABLA_RIESGO", rc.TablaRiesgo(ejes, constante, np.ones(forma_celdas, bool)))
+    assert rc.evaluar_riesgo(*entradas) == pytest.approx(1.234)
+
+    monkeypatch.setattr(rc, "TABLA_RIESGO", rc.TablaRiesgo(ejes, constante, np.zeros(forma_celdas, bool)))
+    assert rc.evaluar_riesgo(*entradas) == exacto
@@ -0,0 +1,113 @@
+import pandas as pd
+import pytest
+
+
+class HistorialFalso:
+    """Sustituto mínimo de CacheHistorial para el detector"""
+
+    def __init__(self, registros=()):
+        self.df = pd.DataFrame(list(registros))
+
+    def agregar(self, registros):
+        self.df = pd.concat([self.df, pd.DataFrame(registros)], ignore_index=True)
+
+    def cargar(self):
+        return self.df
+
+    def historial(self, paciente):
+        return self.df[self.df["Paciente"] == paciente]
+
+
+def _visita(id_registro, dia, paciente="Ana", area=10.0, desv=5.0, riesgo=1.0):
+    return {"ID": id_registro, "Paciente": paciente, "FechaHora": f"2026-01-{dia:02d} 10:00:00",
+            "AreaLesion": area, "DesvEstR": desv, "Riesgo": riesgo}
+
+
+def _guardar(detector, historial, registro):
+    historial.agregar([registro])
+    return detector.actualizar([registro], historial)
+
+
+@pytest.fixture
+def detector(rc, tmp_path):
+    return rc.DetectorTendencias(str(tmp_path / "tendencias.json"))
+
+
+def test_ewma_de_riesgo_entra_en_banda_alta(rc, detector):
+    historial = HistorialFalso()
+    _guardar(detector, historial, _visita(1, 1, riesgo=1.5))
+    # EWMA: 1.5 -> 1.95 (aún MODERADO) -> 2.265 (ALTO)
+    alertas = _guardar(detector, historial, _visita(2, 2, riesgo=3.0))
+    assert not [a for a in alertas if a["Tipo"] == "BANDA"]
+    alertas = _guardar(detector, historial, _visita(3, 3, riesgo=3.0))
+    banda = [a for a in alertas if a["Tipo"] == "BANDA"]
+    assert [(a["ID"], a["Variable"]) for a in banda] == [(3, "Riesgo")]
+    assert detector.pacientes["Ana"]["variables"]["Riesgo"]["ewma"] >= rc.UMBRAL_RIESGO_MODERADO
+
+
+def test_cusum_dispara_y_se_reinicia(detector):
+    historial = HistorialFalso()
+    _guardar(detector, historial, _visita(1, 1, area=10.0))
+    # (12 - 10) / 0.5 - 0.5 = 3.5: por debajo del umbral
+    assert _guardar(detector, historial, _visita(2, 2, area=12.0)) == []
+    estado = detector.pacientes["Ana"]["variables"]["AreaLesion"]
+    assert estado["cusum"] == pytest.approx(3.5)
+    # 3.5 + (13 - 10.6) / 0.5 - 0.5 = 7.8 > 4: alerta y reinicio
+    alertas = _guardar(detector, historial, _visita(3, 3, area=13.0))
+    assert [(a["ID"], a["Variable"], a["Tipo"]) for a in alertas] == [(3, "AreaLesion", "CUSUM")]
+    assert estado["cusum"] == 0.0
+    assert detector.pendientes("Ana")[0]["Alerta"] == alertas[0]["Alerta"]
+
+
+def test_visita_fuera_de_orden_recalcula_y_alerta_solo_la_nueva(detector):
+    historial = HistorialFalso()
+    for id_registro, area in [(1, 10.0), (2, 13.0), (3, 11.0), (4, 11.0)]:
+        _guardar(detector, historial, _visita(id_registro, id_registro * 2, area=area))
+    anteriores = [(a["Alerta"], a["ID"]) for a in detector.alertas]
+    assert [id_registro for _, id_registro in anteriores] == [2]
+
+    # Visita del día 5 guardada al final: el paciente se recalcula en orden de
+    # fecha; la alerta de la visita 2 no se repite y sí se avisa de la nueva
+    alertas = _guardar(detector, historial, _visita(5, 5, area=20.0))
+    assert [(a["ID"], a["Tipo"]) for a in alertas] == [(5, "CUSUM")]
+    assert [(a["Alerta"], a["ID"]) for a in detector.alertas] == anteriores + [(alertas[0]["Alerta"], 5)]
+    estado = detector.pacientes["Ana"]
+    assert estado["visitas"] == 5
+    assert estado["fecha"] == "2026-01-08T10:00:00"
+
+
+def test_fechas_invalidas_no_alteran_el_estado(detector):
+    historial = HistorialFalso()
+    _guardar(detector, historial, _visita(1, 1, area=10.0))
+    antes = detector.pacientes["Ana"]["variables"]["AreaLesion"].copy()
+
+    for id_registro, fecha in [(2, "NaT"), (3, ""), (4, None)]:
+        registro = dict(_visita(id_registro, 1, area=500.0), FechaHora=fecha)
+        assert _guardar(detector, historial, registro) == []
+    assert detector.pacientes["Ana"]["variables"]["AreaLesion"] == antes
+    assert detector.pacientes["Ana"]["visitas"] == 1
+    assert detector.ultimo_id == 4
+
+    # Al reconstruir desde el almacén también se omiten
+    detector.reconstruir(historial)
+    assert detector.pacientes["Ana"]["visitas"] == 1
+
+
+def test_estado_persistente_y_version(rc, detector, monkeypatch):
+    historial = HistorialFalso()
+    for id_registro, area in [(1, 10.0), (2, 12.0), (3, 13.0)]:
+        _guardar(detector, historial, _visita(id_registro, id_registro, area=area))
+    detector.atender([detector.alertas[0]["Alerta"]])
+
+    copia = rc.DetectorTendencias(detector.ruta)
+    assert copia.cargar()
+    assert copia.pacientes == detector.pacientes
+    assert copia.alertas == detector.alertas
+    assert copia.ultimo_id == 3
+    # Al reabrir sólo se incorporan las evaluaciones posteriores al estado
+    historial.agregar([_visita(4, 4, area=13.0)])
+    copia.sincronizar(historial)
+    assert copia.ultimo_id == 4 and copia.pacientes["Ana"]["visitas"] == 4
+
+    monkeypatch.setattr(rc, "VERSION_TENDENCIAS", rc.VERSION_TENDENCIAS + 1)
+    assert not rc.DetectorTendencias(detector.ruta).cargar()